@@ -47,6 +47,7 @@ class DataBlockCreateWorkerTests(TestMixin, TestCase):
         self.s2 = StreamId.objects.filter(variable=self.v2).first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamFilterAction.objects.all().delete()
         StreamFilterTrigger.objects.all().delete()
         StreamFilter.objects.all().delete()
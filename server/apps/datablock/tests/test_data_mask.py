@@ -47,6 +47,7 @@ class BlockDataMaskTests(TestMixin, TestCase):
         self.s2 = StreamId.objects.filter(variable=self.v2).first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamId.objects.all().delete()
         StreamVariable.objects.all().delete()
         StreamNote.objects.all().delete()
@@ -137,6 +138,7 @@ class BlockDeviceDataMaskApiTests(TestMixin, APITestCase):
         self.s2 = StreamId.objects.filter(variable=self.v2).first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamId.objects.all().delete()
         StreamVariable.objects.all().delete()
         StreamNote.objects.all().delete()
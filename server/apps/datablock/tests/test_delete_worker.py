@@ -151,6 +151,7 @@ class DataBlockDeleteWorkerTests(TestMixin, TestCase):
         )
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamFilterAction.objects.all().delete()
         StreamFilterTrigger.objects.all().delete()
         StreamFilter.objects.all().delete()
@@ -17,6 +17,7 @@ from apps.stream.models import StreamId
 from apps.streamnote.models import StreamNote
 from apps.utils.aws.sns import sns_staff_notification
 from apps.utils.data_helpers.manager import DataManager
+from apps.utils.data_mask.mask_utils import clear_cached_data_mask
 from apps.utils.gid.convert import formatted_gsid, gid_split
 from apps.utils.iotile.variable import SYSTEM_VID
 
@@ -84,6 +85,8 @@ class ArchiveDeviceDataAction(Action):
         # print(f'Migrating from {old_stream_slug} to {new_stream_slug}')
         data_qs = DataManager.filter_qs('event', stream_slug=old_stream_slug)
         data_qs.update(device_slug=new_device_slug, stream_slug=new_stream_slug, project_slug='')
+        clear_cached_data_mask(old_stream_slug)
+        clear_cached_data_mask(new_stream_slug)
 
     def _migrate_stream_events(self):
         logger.info('Migrating DataEventStreams for {}'.format(self._block))
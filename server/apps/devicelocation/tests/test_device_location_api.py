@@ -31,6 +31,7 @@ class DeviceLocationApiTestCase(TestMixin, APITestCase):
         self.pd2 = Device.objects.create_device(project=self.p2, label='d2', template=self.dt1, created_by=self.u3)
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         DeviceLocation.objects.all().delete()
         Device.objects.all().delete()
         self.deviceTemplateTestTearDown()
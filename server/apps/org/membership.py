@@ -0,0 +1,105 @@
+"""
+Org membership snapshots: every active membership of a user (with its role and permissions),
+loaded with a single query and used to answer all Org permission checks.
+
+Snapshots are kept for the duration of a request (see OrgMembershipSnapshotMiddleware),
+and optionally in the shared cache (see ORG_MEMBERSHIP_CACHE_TIMEOUT).
+Both are invalidated whenever an OrgMembership is saved or deleted
+"""
+import contextvars
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# user.id -> snapshot, while snapshots are enabled (e.g. during a request). None otherwise
+_request_snapshots = contextvars.ContextVar('org_membership_snapshots', default=None)
+
+
+def _get_membership_cache_key(user_id):
+    return ':'.join(['org-membership', str(user_id)])
+
+
+def _get_membership_cache_timeout():
+    # A timeout of zero disables the shared cache tier
+    if cache:
+        return getattr(settings, 'ORG_MEMBERSHIP_CACHE_TIMEOUT', 0)
+    return 0
+
+
+def _load_membership_snapshot(user_id):
+    from .models import OrgMembership
+
+    snapshot = {}
+    qs = OrgMembership.objects.filter(user_id=user_id, is_active=True).values(
+        'org_id', 'is_org_admin', 'role', 'permissions'
+    )
+    for membership in qs:
+        snapshot[str(membership.pop('org_id'))] = membership
+    return snapshot
+
+
+@contextmanager
+def membership_snapshots():
+    """
+    Enable membership snapshots within the block (a request, a worker task, etc.)
+    """
+    token = _request_snapshots.set({})
+    try:
+        yield
+    finally:
+        _request_snapshots.reset(token)
+
+
+def get_membership_snapshot(user):
+    """
+    Get the active memberships of the user, if snapshots are enabled
+
+    :param user: User object
+    :return: dict of {org_id (str): {'is_org_admin', 'role', 'permissions'}}.
+             None if snapshots are not enabled, so the caller should query the database
+    """
+    store = _request_snapshots.get()
+    timeout = _get_membership_cache_timeout()
+    if store is None and not timeout:
+        return None
+    if not user.is_authenticated:
+        return {}
+
+    if store is not None and user.id in store:
+        return store[user.id]
+
+    snapshot = None
+    if timeout:
+        snapshot = cache.get(_get_membership_cache_key(user.id))
+    if snapshot is None:
+        snapshot = _load_membership_snapshot(user.id)
+        if timeout:
+            cache.set(_get_membership_cache_key(user.id), snapshot, timeout=timeout)
+
+    if store is not None:
+        store[user.id] = snapshot
+    return snapshot
+
+
+def clear_membership_snapshot(user_id):
+    store = _request_snapshots.get()
+    if store is not None:
+        store.pop(user_id, None)
+    if cache:
+        cache.delete(_get_membership_cache_key(user_id))
+
+
+class OrgMembershipSnapshotMiddleware(object):
+    """
+    Share membership snapshots across all permission checks of a single request
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with membership_snapshots():
+            return self.get_response(request)
@@ -7,6 +7,8 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.db.models import Manager, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.shortcuts import get_object_or_404
 from django.template.defaultfilters import slugify
 from django.urls import reverse
@@ -18,6 +20,7 @@ from apps.orgtemplate.models import OrgTemplate
 from apps.s3images.models import S3Image
 from apps.utils.gravatar import get_gravatar_thumbnail_url
 
+from .membership import clear_membership_snapshot, get_membership_snapshot
 from .roles import DEFAULT_ROLE, NO_PERMISSIONS_ROLE, ORG_ROLE_PERMISSIONS, ROLE_DISPLAY
 
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL')
@@ -33,6 +36,17 @@ def get_default_membership_permissions():
     return dict(ORG_ROLE_PERMISSIONS['m1'])
 
 
+def _has_permissions(membership, permissions):
+    """
+    Snapshot equivalent of a permissions__contains={permission: True} lookup, for every permission
+
+    :param membership: Membership dict from a membership snapshot
+    :param permissions: list of permission names
+    """
+    member_permissions = membership['permissions'] or {}
+    return all([member_permissions.get(permission) is True for permission in permissions])
+
+
 class OrgManager(Manager):
     """
     Manager to help with Org and their membership
@@ -72,6 +86,36 @@ class OrgManager(Manager):
         else:
             return OrgMembership.objects.filter(user=user, is_active=True).values_list('org_id', flat=True)
 
+    def user_orgs_ids_with_permission(self, user, org_ids, permission):
+        """
+        Bulk version of Org.has_permission: single query for any number of Orgs
+
+        :param user: User object
+        :param org_ids: Org IDs to check
+        :param permission: Permission name (e.g. 'can_create_stream_data')
+        :return: set with the subset of org_ids where the user has the permission
+        """
+        org_ids = set(org_ids)
+        if user.is_staff:
+            # If staff, just use staff permissions
+            if permission in ORG_ROLE_PERMISSIONS['s0'] and ORG_ROLE_PERMISSIONS['s0'][permission]:
+                return org_ids
+            return set()
+
+        if not org_ids:
+            return set()
+
+        snapshot = get_membership_snapshot(user)
+        if snapshot is not None:
+            return set([
+                org_id for org_id in org_ids
+                if str(org_id) in snapshot and _has_permissions(snapshot[str(org_id)], [permission])
+            ])
+
+        return set(OrgMembership.objects.filter(
+            user=user, org_id__in=org_ids, is_active=True, permissions__contains={permission: True}
+        ).values_list('org_id', flat=True))
+
     def members_qs(self, org):
         membership = OrgMembership.objects.filter(org=org, is_active=True).values_list('user_id', flat=True)
         return user_model.objects.filter(id__in=membership, is_active=True)
@@ -159,13 +203,31 @@ class Org(models.Model):
     def get_reports_url(self):
         return reverse('org:report:list', args=(self.slug,))
 
+    def _get_membership_snapshot(self, user):
+        """
+        :return: (True, membership dict or None) if snapshots are enabled. (False, None) otherwise
+        """
+        snapshot = get_membership_snapshot(user)
+        if snapshot is None:
+            return False, None
+        return True, snapshot.get(str(self.id))
+
     def is_member(self, user):
+        has_snapshot, membership = self._get_membership_snapshot(user)
+        if has_snapshot:
+            return membership is not None and user.is_active
         return self.membership.filter(user=user, is_active=True, user__is_active=True).exists()
 
     def is_admin(self, user):
+        has_snapshot, membership = self._get_membership_snapshot(user)
+        if has_snapshot:
+            return membership is not None and membership['is_org_admin'] and user.is_active
         return self.membership.filter(user=user, is_active=True, is_org_admin=True, user__is_active=True).exists()
 
     def is_owner(self, user):
+        has_snapshot, membership = self._get_membership_snapshot(user)
+        if has_snapshot:
+            return membership is not None and membership['role'] == 'a0' and user.is_active
         return self.membership.filter(user=user, is_active=True, role='a0', user__is_active=True).exists()
 
     def member_count(self):
@@ -181,6 +243,9 @@ class Org(models.Model):
         if user.is_staff:
             # If staff, just return staff permissions
             return ORG_ROLE_PERMISSIONS['s0']
+        has_snapshot, membership = self._get_membership_snapshot(user)
+        if has_snapshot:
+            return membership['permissions'] if membership else NO_PERMISSIONS_ROLE
         try:
             membership = self.membership.get(user=user, org=self, is_active=True)
         except OrgMembership.DoesNotExist:
@@ -193,6 +258,10 @@ class Org(models.Model):
             # If staff, just return staff permissions
             return permission in ORG_ROLE_PERMISSIONS['s0'] and ORG_ROLE_PERMISSIONS['s0'][permission]
 
+        has_snapshot, membership = self._get_membership_snapshot(user)
+        if has_snapshot:
+            return membership is not None and _has_permissions(membership, [permission])
+
         return self.membership.filter(user=user, org=self, is_active=True, permissions__contains={permission: True}).exists()
 
     def has_multiple_permissions(self, user, permissions):
@@ -203,6 +272,10 @@ class Org(models.Model):
                     return False
             return True
 
+        has_snapshot, membership = self._get_membership_snapshot(user)
+        if has_snapshot:
+            return membership is not None and _has_permissions(membership, permissions)
+
         q = Q(user=user, org=self, is_active=True)
         for permission in permissions:
             q = q & Q(permissions__contains={permission: True})
@@ -402,6 +475,12 @@ class AuthAPIKey(AbstractAPIKey):
         return not (self.revoked or self.has_expired)
 
 
+@receiver(post_save, sender=OrgMembership)
+@receiver(post_delete, sender=OrgMembership)
+def clear_membership_snapshot_on_change(sender, instance, **kwargs):
+    clear_membership_snapshot(instance.user_id)
+
+
 def process_domain_on_email_confirmed(sender, **kwargs):
     email_address = kwargs['email_address']
     try:
@@ -8,8 +8,9 @@ from apps.physicaldevice.models import Device
 from apps.project.models import Project
 from apps.utils.test_util import TestMixin
 
+from ..membership import membership_snapshots
 from ..models import Org, OrgDomain, OrgMembership
-from ..roles import ORG_ROLE_PERMISSIONS
+from ..roles import NO_PERMISSIONS_ROLE, ORG_ROLE_PERMISSIONS
 
 user_model = get_user_model()
 
@@ -395,6 +396,41 @@ class OrgTestCase(TestMixin, TestCase):
         self.assertEqual(Org.objects.members_qs(o1).first(), self.u2)
         self.assertTrue(o1.is_member(self.u2))
 
+    def testMembershipSnapshot(self):
+        o1 = Org.objects.create_org(name='My Org 1', created_by=self.u2)
+        o2 = Org.objects.create_org(name='My Org 2', created_by=self.u3)
+        o2.register_user(self.u2, role='m1')
+
+        with membership_snapshots():
+            # All checks are answered from a single query
+            with self.assertNumQueries(1):
+                self.assertTrue(o1.is_member(self.u2))
+                self.assertTrue(o1.is_admin(self.u2))
+                self.assertTrue(o1.is_owner(self.u2))
+                self.assertTrue(o2.is_member(self.u2))
+                self.assertFalse(o2.is_admin(self.u2))
+                self.assertTrue(o2.has_permission(self.u2, 'can_read_stream_data'))
+                self.assertFalse(o2.has_permission(self.u2, 'can_manage_users'))
+                self.assertTrue(o1.has_multiple_permissions(self.u2, ['can_manage_users', 'can_read_stream_data']))
+                self.assertFalse(o2.has_multiple_permissions(self.u2, ['can_manage_users', 'can_read_stream_data']))
+                self.assertEqual(o2.permissions(self.u2), ORG_ROLE_PERMISSIONS['m1'])
+                self.assertEqual(
+                    Org.objects.user_orgs_ids_with_permission(self.u2, [o1.id, o2.id], 'can_manage_users'),
+                    set([o1.id])
+                )
+
+            # Membership changes clear the snapshot
+            o2.de_register_user(self.u2)
+            self.assertFalse(o2.is_member(self.u2))
+            self.assertEqual(o2.permissions(self.u2), NO_PERMISSIONS_ROLE)
+            self.assertFalse(o2.has_permission(self.u2, 'can_read_stream_data'))
+            self.assertTrue(o1.is_member(self.u2))
+
+        # Without snapshots, every check queries the database
+        with self.assertNumQueries(2):
+            self.assertTrue(o1.is_member(self.u2))
+            self.assertFalse(o2.is_member(self.u2))
+
     def testOrgDomain(self):
         o1 = Org.objects.create_org(name='My Org', created_by=self.u2)
         domain1 = OrgDomain.objects.create(name='org.com', org=o1)
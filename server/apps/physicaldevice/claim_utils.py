@@ -10,7 +10,9 @@ from apps.stream.models import StreamId
 from apps.streamfilter.dynamodb import DynamoFilterLogModel
 from apps.streamnote.models import StreamNote
 from apps.utils.data_helpers.manager import DataManager
+from apps.utils.data_mask.mask_utils import clear_cached_data_mask
 from apps.utils.gid.convert import int16gid
+from apps.utils.iotile.variable import SYSTEM_VID
 from apps.verticals.utils import get_device_claim_vertical_helper
 
 from .tasks import send_device_claim_notification, send_device_semiclaim_notification
@@ -126,6 +128,8 @@ def device_unclaim(device, label=None, clean_streams=False):
     else:
         if '{id}' in label:
             label = label.format(id=int16gid(device.id))
+    # The mask stream slug depends on the project, so get it before unclaiming
+    mask_stream_slug = device.get_stream_slug_for(SYSTEM_VID['DEVICE_DATA_MASK'])
     device.unclaim(label)
 
     # Delete data last in case we have issues deleting large data amounts
@@ -139,6 +143,8 @@ def device_unclaim(device, label=None, clean_streams=False):
         event_qs = DataManager.filter_qs('event', device_slug=device.slug)
         logger.info('Deleting {1} event entries for {0}'.format(device.slug, event_qs.count()))
         event_qs.delete()
+        if mask_stream_slug:
+            clear_cached_data_mask(mask_stream_slug)
 
     logger.debug(msg)
     return msg
@@ -41,6 +41,7 @@ class DeviceDataMaskTests(TestMixin, TestCase):
         self.s2 = StreamId.objects.filter(variable=self.v2).first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamId.objects.all().delete()
         StreamVariable.objects.all().delete()
         StreamNote.objects.all().delete()
@@ -176,6 +177,7 @@ class DeviceDataMaskApiTests(TestMixin, APITestCase):
         self.s2 = StreamId.objects.filter(variable=self.v2).first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamId.objects.all().delete()
         StreamVariable.objects.all().delete()
         StreamNote.objects.all().delete()
@@ -51,26 +51,29 @@ class DeviceDataResetAction(Action):
             assert(self._device)
             GenericProperty.objects.object_properties_qs(self._device, is_system=False).delete()
 
+    def _delete_progress(self, result):
+        logger.info('Reset {0}: {1} row(s) deleted so far (last id={2})'.format(
+            self._device.slug, result['deleted'], result['last_id']
+        ))
+
     def _clear_stream_data(self):
         logger.info('Deleting DataStreams and DataEventStreams for {}'.format(self._device))
         assert(self._device)
         stream_slugs = [s.slug for s in self._device.streamids.filter(block__isnull=True)]
-        data_qs = DataManager.filter_qs('data', stream_slug__in=stream_slugs, device_slug=self._device.slug)
-        data_qs.delete()
-        event_qs = DataManager.filter_qs('event', stream_slug__in=stream_slugs, device_slug=self._device.slug)
-        event_qs.delete()
+        # Rows are deleted in chunks, without loading them
+        for model in ['data', 'event']:
+            DataManager.delete_in_chunks(
+                model, stream_slug__in=stream_slugs, device_slug=self._device.slug, progress=self._delete_progress
+            )
         # Also delete Data Mask
         clear_data_mask(self._device, None, False)
         if self._full_reset:
             # Delete all data even if no StreamIds
-            data_qs = DataManager.filter_qs(
-                'data', device_slug=self._device.slug, project_slug=self._device.project.slug
-            )
-            data_qs.delete()
-            event_qs = DataManager.filter_qs(
-                'event', device_slug=self._device.slug, project_slug=self._device.project.slug
-            )
-            event_qs.delete()
+            for model in ['data', 'event']:
+                DataManager.delete_in_chunks(
+                    model, device_slug=self._device.slug, project_slug=self._device.project.slug,
+                    progress=self._delete_progress
+                )
 
     def _clear_streamers(self):
         logger.info('Deleting Streamers for {}'.format(self._device))
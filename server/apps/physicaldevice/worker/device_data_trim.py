@@ -4,7 +4,7 @@ import pytz
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Max, Min, Q
 from django.utils import timezone
 
 from apps.emailutil.tasks import Email
@@ -64,6 +64,28 @@ class DeviceDataTrimAction(Action):
                 raise WorkerActionHardError('Illegal argument ({}) for DeviceDataTrimAction'.format(key))
         return True
 
+    def _delete_progress(self, result):
+        logger.info('Trim {0}: {1} row(s) deleted so far (last id={2})'.format(
+            self._device.slug, result['deleted'], result['last_id']
+        ))
+
+    def _trim(self, model, stream_slugs, **kwargs):
+        """
+        Delete (in chunks) all rows of the given model matching the time filter
+
+        :return: (Number of rows deleted, oldest or newest timestamp deleted)
+        """
+        qs = DataManager.filter_qs(model, stream_slug__in=stream_slugs, device_slug=self._device.slug, **kwargs)
+        edge = qs.aggregate(oldest=Min('timestamp'), newest=Max('timestamp'))
+        if edge['oldest'] is None:
+            return 0, None
+
+        result = DataManager.delete_in_chunks(
+            model, stream_slug__in=stream_slugs, device_slug=self._device.slug, progress=self._delete_progress, **kwargs
+        )
+        timestamp = edge['oldest'] if 'timestamp__lt' in kwargs else edge['newest']
+        return result['deleted'], convert_to_utc(timestamp)
+
     def _trim_data(self):
         logger.info('Trimming DataStreams and DataEventStreams for {}'.format(self._device))
         assert(self._device)
@@ -73,56 +95,24 @@ class DeviceDataTrimAction(Action):
         stream_slugs = [s.slug for s in stream_qs]
 
         if self._start:
-            data_qs = DataManager.filter_qs('data', stream_slug__in=stream_slugs, device_slug=self._device.slug)
-            event_qs = DataManager.filter_qs('event', stream_slug__in=stream_slugs, device_slug=self._device.slug)
-
-            logger.info('First Data: {}'.format(data_qs.order_by('timestamp').first()))
-            data0_qs = data_qs.filter(timestamp__lt=self._start)
-            first_data = None
-            if data0_qs.exists():
-                msg = '{0} data row(s) before {1} deleted'.format(data0_qs.count(), self._start)
-                logger.info(msg)
-                self._logs.append(msg)
-                first_data = data0_qs.first()
-                self._oldest = convert_to_utc(first_data.timestamp)
-                data0_qs.delete()
-
-            logger.info('First Event: {}'.format(event_qs.order_by('timestamp').first()))
-            event0_qs = event_qs.filter(timestamp__lt=self._start)
-            if event0_qs.exists():
-                msg = '{0} event row(s) before {1} deleted'.format(event0_qs.count(), self._start)
-                logger.info(msg)
-                self._logs.append(msg)
-                older_event = event0_qs.first()
-                if older_event and (not first_data or (older_event.timestamp < self._oldest)):
-                    self._oldest = older_event
-                event0_qs.delete()
+            for model in ['data', 'event']:
+                count, oldest = self._trim(model, stream_slugs, timestamp__lt=self._start)
+                if count:
+                    msg = '{0} {1} row(s) before {2} deleted'.format(count, model, self._start)
+                    logger.info(msg)
+                    self._logs.append(msg)
+                    if not self._oldest or oldest < self._oldest:
+                        self._oldest = oldest
 
         if self._end:
-            data_qs = DataManager.filter_qs('data', stream_slug__in=stream_slugs, device_slug=self._device.slug)
-            event_qs = DataManager.filter_qs('event', stream_slug__in=stream_slugs, device_slug=self._device.slug)
-
-            logger.info('Last Data: {}'.format(data_qs.order_by('timestamp').last()))
-            data1_qs = data_qs.filter(timestamp__gt=self._end)
-            last_data = None
-            if data1_qs.exists():
-                msg = '{0} data row(s) after {1} deleted'.format(data1_qs.count(), self._end)
-                logger.info(msg)
-                self._logs.append(msg)
-                last_data = data1_qs.last()
-                self._newest = convert_to_utc(last_data.timestamp) if last_data else None
-                data1_qs.delete()
-
-            logger.info('Last Event: {}'.format(event_qs.order_by('timestamp').last()))
-            event1_qs = event_qs.filter(timestamp__gt=self._end)
-            if event1_qs.exists():
-                msg = '{0} event row(s) after {1} deleted'.format(event1_qs.count(), self._end)
-                logger.info(msg)
-                self._logs.append(msg)
-                newest_event = event1_qs.last()
-                if newest_event and (not last_data or (newest_event.timestamp > self._newest)):
-                    self._newest = newest_event.timestamp
-                event1_qs.delete()
+            for model in ['data', 'event']:
+                count, newest = self._trim(model, stream_slugs, timestamp__gt=self._end)
+                if count:
+                    msg = '{0} {1} row(s) after {2} deleted'.format(count, model, self._end)
+                    logger.info(msg)
+                    self._logs.append(msg)
+                    if not self._newest or newest > self._newest:
+                        self._newest = newest
 
     def _notify_user(self):
         email = Email()
@@ -166,6 +156,8 @@ class DeviceDataTrimAction(Action):
         super(DeviceDataTrimAction, self).execute(arguments)
         if DeviceDataTrimAction._arguments_ok(arguments):
             self._logs = []
+            self._oldest = None
+            self._newest = None
 
             try:
                 self._device = Device.objects.get(slug=arguments['device_slug'])
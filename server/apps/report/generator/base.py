@@ -46,6 +46,14 @@ class ReportGenerator(object):
             qs = qs.filter(timestamp__lt=self._end)
         return qs
 
+    def _get_streams_data_qs(self, stream_slugs):
+        qs = DataManager.filter_qs('data', stream_slug__in=stream_slugs)
+        if self._start:
+            qs = qs.filter(timestamp__gte=self._start)
+        if self._end:
+            qs = qs.filter(timestamp__lt=self._end)
+        return qs
+
     def _send_email(self, template, ctx, attachment=None):
         subject = _('IOTile Cloud Report: {}'.format(self._rpt.label))
 
@@ -9,6 +9,9 @@ from apps.vartype.models import VarTypeOutputUnit
 
 from ..base import ReportGenerator
 
+# Max number of streams per aggregation query
+STATS_CHUNK_SIZE = 500
+
 
 class ReportColumn(object):
     msgs = []
@@ -129,24 +132,53 @@ class DefaultReportGenerator(ReportGenerator):
         }
         return factory[aggregation_type](val1, val2)
 
-    def _collect_stream_data_stats(self, stream, units, aggregate_type):
-        qs = self._get_stream_data_qs(stream.slug)
-
-        stats = qs.aggregate(
-            sum=Sum('value'),
-            max=Max('value'),
-            min=Min('value'),
-        )
-        if aggregate_type in stats and stats[aggregate_type] != None:
-            # Convert value to required report units
-            if units:
+    def _collect_stream_data_stats(self, stream_slugs):
+        """
+        Compute the sum, max and min of all streams with a single GROUP BY query
+        (or one per STATS_CHUNK_SIZE streams)
+
+        :param stream_slugs: list of stream slugs
+        :return: dict of stream_slug -> {'sum': x, 'max': x, 'min': x}
+        """
+        stats = {}
+        for start in range(0, len(stream_slugs), STATS_CHUNK_SIZE):
+            qs = self._get_streams_data_qs(stream_slugs[start:start + STATS_CHUNK_SIZE])
+            qs = qs.values('stream_slug').annotate(
+                sum=Sum('value'),
+                max=Max('value'),
+                min=Min('value'),
+            ).order_by()
+            for item in qs:
+                stats[item['stream_slug']] = item
+        return stats
+
+    def _get_column_values(self, col, stats):
+        """
+        Get the aggregated value of all the column streams, converted to the column units
+
+        :param col: ReportColumn
+        :param stats: dict returned by _collect_stream_data_stats
+        :return: dict of stream_slug -> value (0 for streams with no data)
+        """
+        values = {slug: 0 for slug in col.stream_slugs}
+        slugs = [
+            slug for slug in col.stream_slugs
+            if slug in stats and stats[slug][col.aggregate] is not None
+        ]
+        if slugs:
+            raw_values = [stats[slug][col.aggregate] for slug in slugs]
+            if col.output_units:
+                # Convert values to required report units
+                units = col.output_units
                 output_mdo = MdoHelper(units.m, units.d, units.o)
-                return output_mdo.compute(stats[aggregate_type])
-            return stats[aggregate_type]
-
-        return 0
+                raw_values = output_mdo.compute_array(raw_values).tolist()
+            values.update(zip(slugs, raw_values))
+        return values
 
     def _compute_report_context(self):
+        stats = self._collect_stream_data_stats(self._rows.stream_slugs)
+        col_values = [self._get_column_values(col, stats) for col in self._cols]
+
         total = [{ 'value': self._initial_value(col.aggregate), 'units': ''} for col in self._cols]
         project_list = []
         projects = self._rows.projects
@@ -167,7 +199,7 @@ class DefaultReportGenerator(ReportGenerator):
                     col_index = 0
                     for col in self._cols:
                         if stream.slug in col.stream_slugs:
-                            stream_value = self._collect_stream_data_stats(stream, col.output_units, col.aggregate)
+                            stream_value = col_values[col_index][stream.slug]
                             stream_units = col.output_units.unit_short
                             item = {
                                 'value': stream_value,
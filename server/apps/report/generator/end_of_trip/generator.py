@@ -19,6 +19,7 @@ from apps.stream.models import StreamId, StreamVariable
 from apps.streamdata.utils import get_stream_output_mdo
 from apps.utils.aws.redshift import get_ts_from_redshift
 from apps.utils.data_helpers.manager import DataManager
+from apps.utils.data_mask.mask_utils import get_data_mask_date_range_for_slug
 from apps.utils.gid.convert import get_device_and_block_by_did, gid2int
 from apps.utils.iotile.variable import SYSTEM_VID
 from apps.utils.objects.utils import get_device_or_block
@@ -135,7 +136,7 @@ class TripSummary(object):
         mdo = get_stream_output_mdo(stream)
         if mdo:
             try:
-                df['value'] = df['value'].apply(lambda x: mdo.compute(x))
+                df['value'] = mdo.compute_array(df['value'])
             except Exception as e:
                 raise WorkerActionHardError(e)
 
@@ -151,13 +152,12 @@ class TripSummary(object):
             }
         return {}
 
-    def _compute_delta_v(self, x):
-        terms = [x[term] for term in self._delta_v_terms]
-        max_dv = max(*terms)
-        min_dv = min(*terms)
-        if max_dv > abs(min_dv):
-            return max_dv
-        return min_dv
+    def _compute_delta_v(self, df, delta_v_terms):
+        """For each row, the delta V term with the largest absolute value"""
+        terms = df[delta_v_terms]
+        max_dv = terms.max(axis=1)
+        min_dv = terms.min(axis=1)
+        return max_dv.where(max_dv > min_dv.abs(), min_dv)
 
     def _compute_event_data(self, event_qs, sg_config_consts):
 
@@ -194,11 +194,10 @@ class TripSummary(object):
             if 'delta_v_terms' in sg_config_consts:
                 for col in sg_config_consts['delta_v_terms']:
                     if col in list(df):
-                        df[col] = df[col].apply(lambda x: x * sg_config_consts['delta_v_multiplier'])
+                        df[col] = df[col] * sg_config_consts['delta_v_multiplier']
 
             if max_dv_col not in list(df):
-                self._delta_v_terms = sg_config_consts['delta_v_terms']
-                df[max_dv_col] = df.apply(self._compute_delta_v, axis=1)
+                df[max_dv_col] = self._compute_delta_v(df, sg_config_consts['delta_v_terms'])
             max_dv_idx = df[max_dv_col].idxmax()
 
             data.update({
@@ -220,11 +219,7 @@ class TripSummary(object):
         """
         mask_stream_slug = self._get_stream_slug_for(SYSTEM_VID['DEVICE_DATA_MASK'])
         if mask_stream_slug:
-            event = DataManager.filter_qs('event', stream_slug=mask_stream_slug).last()
-            if event:
-                assert ('start' in event.extra_data)
-                assert ('end' in event.extra_data)
-                return event.extra_data
+            return get_data_mask_date_range_for_slug(mask_stream_slug)
         return None
 
     def calculate_trip_date_ranges(self):
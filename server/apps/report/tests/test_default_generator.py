@@ -1,8 +1,10 @@
 import json
 from datetime import timedelta
 from pprint import pprint
+from unittest import mock
 
 from django.contrib.auth import get_user_model
+from django.db.models import Max, Min, Sum
 from django.test import Client, TestCase
 from django.utils import dateparse, timezone
 
@@ -397,6 +399,59 @@ class ReportDefaultGeneratorActionTestCase(TestMixin, TestCase):
                 self.assertAlmostEqual(p['total'][0]['value'], 5.0192, delta=0.002)
                 self.assertEqual(p['total'][1]['value'], 19.0)
 
+    def testCollectStreamDataStats(self):
+        config = {
+            'cols': [
+                {
+                    'name': 'Water Usage',
+                    'vars': [
+                        {'lid': '5001', 'name': 'IO 1'},
+                        {'lid': '5002', 'name': 'IO 2'}
+                    ],
+                    'aggregate': 'sum',
+                    'type': 'water-meter-volume',
+                    'units': 'out--water-meter-volume--gallons'
+                }
+            ]
+        }
+        rpt1 = UserReport.objects.create(
+            label='RPT1',
+            interval='d',
+            config=config,
+            sources=[self.pd1.slug, self.p2.slug],
+            created_by=self.u2,
+            org=self.o2
+        )
+
+        action = ReportGeneratorAction()
+        action._reset(rpt1)
+        end = timezone.now()
+        start = end - timedelta(hours=2)
+        rg = DefaultReportGenerator(action._msgs, rpt1, start, end)
+        rg.process_config()
+        action._process_data_sources(rg, rpt1.sources)
+        slugs = rg._rows.stream_slugs
+        self.assertEqual(len(slugs), 6)
+
+        stats = rg._collect_stream_data_stats(slugs)
+        # Chunking should not change the results
+        with mock.patch('apps.report.generator.default.generator.STATS_CHUNK_SIZE', 4):
+            self.assertEqual(rg._collect_stream_data_stats(slugs), stats)
+
+        for slug in slugs:
+            expected = StreamData.objects.filter(
+                stream_slug=slug, timestamp__gte=start, timestamp__lt=end
+            ).aggregate(sum=Sum('value'), max=Max('value'), min=Min('value'))
+            if expected['sum'] is None:
+                self.assertNotIn(slug, stats)
+            else:
+                for key in ['sum', 'max', 'min']:
+                    self.assertAlmostEqual(stats[slug][key], expected[key])
+
+        values = rg._get_column_values(rg._cols[0], stats)
+        self.assertEqual(set(values.keys()), set(slugs))
+        self.assertAlmostEqual(sum(values.values()), 11.8877, delta=0.002)
+
     def testMaxMinColumn(self):
         self.assertEqual(StreamId.objects.count(), 6)
 
@@ -32,6 +32,7 @@ class TripSummaryGeneratorActionTestCase(TestMixin, TestCase):
         self.pd1 = self.p1.devices.first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         self.device_mock.tearDown()
         self.userTestTearDown()
 
@@ -3,7 +3,7 @@ import logging
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
-from apps.sqsworker.workerhelper import Worker
+from apps.sqsworker.workerhelper import ConcurrentWorker, Worker
 from apps.utils.aws.sqs import get_queue_by_name
 
 logger = logging.getLogger(__name__)
@@ -17,6 +17,12 @@ class Command(BaseCommand):
 
         parser.add_argument('--queue-name', '-n', dest='queue_name', default='', help='Specify the SQS queue name')
 
+        parser.add_argument('--concurrency', '-c', dest='concurrency', default='1',
+                            help='Number of tasks to process in parallel. Default is 1 (one message at a time)')
+
+        parser.add_argument('--visibility-timeout', dest='visibility_timeout', default='300',
+                            help='Visibility timeout (in seconds) kept on messages being processed when concurrency > 1')
+
     def handle(self, *args, **options):
         queue_name = ''
         if options.get('queue_name'):
@@ -24,7 +30,13 @@ class Command(BaseCommand):
         elif settings.SQS_WORKER_QUEUE_NAME:
             queue_name = settings.SQS_WORKER_QUEUE_NAME
         if queue_name != '':
-            worker = Worker(get_queue_by_name(queue_name), int(options.get('wait_time')))
+            concurrency = int(options.get('concurrency'))
+            if concurrency > 1:
+                worker = ConcurrentWorker(get_queue_by_name(queue_name), int(options.get('wait_time')),
+                                          max_workers=concurrency,
+                                          visibility_timeout=int(options.get('visibility_timeout')))
+            else:
+                worker = Worker(get_queue_by_name(queue_name), int(options.get('wait_time')))
             worker.run()
         else:
             logger.error('SQS queue name not found')
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sqsworker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workerstatistics',
+            name='total_db_queries',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='workerstatistics',
+            name='total_cache_calls',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -27,6 +27,10 @@ class WorkerStatistics(models.Model):
     error_count = models.IntegerField(blank=True, null=True)
     total_execution_time = models.FloatField(blank=True, null=True)
 
+    # Only for per stage stats (see StageProfiler), where task_name is <task>:<engine>:<size>:<stage>
+    total_db_queries = models.IntegerField(blank=True, null=True)
+    total_cache_calls = models.IntegerField(blank=True, null=True)
+
     created_on = models.DateTimeField('created_on', auto_now_add=True)
 
     class Meta:
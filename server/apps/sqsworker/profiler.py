@@ -0,0 +1,220 @@
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.core.cache import cache, caches
+from django.db import connections
+
+from apps.utils.redis_cache import pop_many, set_add, set_members
+
+logger = logging.getLogger(__name__)
+
+# Per-process stage stats are pushed to the cache (with atomic increments) at most this often
+STAGE_STATS_FLUSH_INTERVAL = 60
+STAGE_STATS_TIMEOUT = 8 * 24 * 60 * 60
+STAGE_STATS_REGISTRY_KEY = 'stage-stats-registry'
+STAGE_STATS_FIELDS = ['count', 'time_ms', 'queries', 'cache_calls']
+
+# Cache backend methods that result in a call to the cache server
+CACHE_METHODS = [
+    'get', 'set', 'add', 'delete', 'get_many', 'set_many', 'delete_many', 'incr', 'decr', 'has_key',
+    'touch', 'delete_pattern', 'get_or_set', 'keys', 'ttl', 'expire', 'persist',
+]
+
+_local = threading.local()
+
+# (task_name, engine, size, stage) -> {field: value}, not yet pushed to the cache
+_pending_stats = {}
+_pending_lock = threading.Lock()
+_last_flush = time.time()
+
+
+def size_bucket(count):
+    """
+    :param count: Number of readings in the report
+    :return: Size label used to aggregate stats for reports of similar size
+    """
+    if count < 100:
+        return '0-99'
+    if count < 1000:
+        return '100-999'
+    if count < 10000:
+        return '1k-10k'
+    return '10k+'
+
+
+def _count_cache_call(method):
+    def wrapper(*args, **kwargs):
+        _local.cache_calls += 1
+        return method(*args, **kwargs)
+    return wrapper
+
+
+def _install_cache_counter():
+    """
+    Wrap the methods of the current thread's cache backend instance, so cache (Redis) calls
+    can be counted. Cache backend instances are thread local, so other threads are not affected.
+
+    :return: names of the wrapped methods, to restore with _uninstall_cache_counter
+    """
+    backend = caches['default']
+    names = []
+    for name in CACHE_METHODS:
+        method = getattr(backend, name, None)
+        if method is not None:
+            setattr(backend, name, _count_cache_call(method))
+            names.append(name)
+    return names
+
+
+def _uninstall_cache_counter(names):
+    backend = caches['default']
+    for name in names:
+        # Remove the instance attribute, so the class method is used again
+        backend.__dict__.pop(name, None)
+
+
+class StageProfiler(object):
+    """
+    Times the stages of a worker action, and counts the DB queries and cache calls done on each.
+
+    Usage:
+        profiler = StageProfiler('ProcessReportV2Action', engine='v2.bin')
+        with profiler.stage('parse_readings'):
+            ...
+        profiler.finish(size=count)
+
+    finish() logs all stages as a single JSON line, and adds them to the per-process stats
+    that are periodically pushed to the cache, to be collected with the WorkerStatistics
+    (see collect_stage_stats).
+    """
+    task_name = None
+    engine = None
+    stages = None
+
+    def __init__(self, task_name, engine=''):
+        self.task_name = task_name
+        self.engine = engine
+        self.stages = {}
+        self._start = time.time()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile a stage. Stages can be entered more than once (i.e. in a loop); times and counts add up.
+        Nested stages are also counted in the outer stage.
+        """
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        outer_cache_calls = getattr(_local, 'cache_calls', None)
+        # Cache calls are only counted (by the outermost stage) while a stage is running
+        wrapped_methods = _install_cache_counter() if outer_cache_calls is None else []
+        _local.cache_calls = 0
+        start = time.time()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_query))
+                yield
+        finally:
+            stats = self.stages.setdefault(name, dict.fromkeys(STAGE_STATS_FIELDS, 0))
+            stats['count'] += 1
+            stats['time_ms'] += int((time.time() - start) * 1000)
+            stats['queries'] += queries[0]
+            stats['cache_calls'] += _local.cache_calls
+            if outer_cache_calls is None:
+                _uninstall_cache_counter(wrapped_methods)
+                _local.cache_calls = None
+            else:
+                _local.cache_calls = outer_cache_calls + _local.cache_calls
+
+    def finish(self, size):
+        """
+        Log and aggregate the stats for all stages
+
+        :param size: Number of readings in the report (or items processed by the action)
+        """
+        bucket = size_bucket(size)
+        logger.info('Profile: {}'.format(json.dumps({
+            'task': self.task_name,
+            'engine': self.engine,
+            'size': size,
+            'total_ms': int((time.time() - self._start) * 1000),
+            'stages': self.stages,
+        }, sort_keys=True)))
+
+        with _pending_lock:
+            for name, stats in self.stages.items():
+                pending = _pending_stats.setdefault(
+                    (self.task_name, self.engine, bucket, name), dict.fromkeys(STAGE_STATS_FIELDS, 0)
+                )
+                for field in STAGE_STATS_FIELDS:
+                    pending[field] += stats[field]
+        flush_stage_stats()
+
+
+def _get_stage_stats_key(key, field):
+    return ':'.join(['stage-stats'] + list(key) + [field])
+
+
+def _add_to_stage_stats_counter(cache_key, value):
+    """Atomically add to a counter, even if it is being collected (deleted) at the same time"""
+    while not cache.add(cache_key, value, timeout=STAGE_STATS_TIMEOUT):
+        try:
+            cache.incr(cache_key, value)
+            return
+        except ValueError:
+            # Collected since the add: add it again
+            pass
+
+
+def flush_stage_stats(force=False):
+    """
+    Push the stats aggregated by this process to the cache
+    """
+    global _last_flush, _pending_stats
+    if not cache:
+        return
+    with _pending_lock:
+        if not _pending_stats or (not force and time.time() - _last_flush < STAGE_STATS_FLUSH_INTERVAL):
+            return
+        pending = _pending_stats
+        _pending_stats = {}
+        _last_flush = time.time()
+
+    # The registry is a set, so workers adding keys at the same time do not overwrite each other
+    set_add(STAGE_STATS_REGISTRY_KEY, [json.dumps(list(key)) for key in pending.keys()], timeout=STAGE_STATS_TIMEOUT)
+
+    for key, stats in pending.items():
+        for field in STAGE_STATS_FIELDS:
+            if stats[field]:
+                _add_to_stage_stats_counter(_get_stage_stats_key(key, field), stats[field])
+
+
+def collect_stage_stats():
+    """
+    Get (and reset) the stage stats aggregated by all workers since the last collection
+
+    :return: list of dicts with task_name, engine, size, stage and the STAGE_STATS_FIELDS
+    """
+    if not cache:
+        return []
+    registry = sorted(json.loads(member) for member in set_members(STAGE_STATS_REGISTRY_KEY))
+    cache_keys = [_get_stage_stats_key(key, field) for key in registry for field in STAGE_STATS_FIELDS]
+    # Get and delete in a single transaction, so no increment is lost
+    values = pop_many(cache_keys)
+
+    results = []
+    for key in registry:
+        item = dict(zip(['task_name', 'engine', 'size', 'stage'], key))
+        for field in STAGE_STATS_FIELDS:
+            item[field] = values.get(_get_stage_stats_key(key, field), 0)
+        if item['count']:
+            results.append(item)
+    return results
@@ -4,6 +4,9 @@ import json
 import os
 import random
 import string
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
 import dateutil.parser
@@ -26,8 +29,9 @@ from apps.utils.timezone_utils import *
 
 from ..action import Action
 from ..common import ACTION_CLASS_MODULE
+from ..profiler import StageProfiler, collect_stage_stats, flush_stage_stats, size_bucket
 from ..tracker import WorkerUUID
-from ..workerhelper import Worker
+from ..workerhelper import ConcurrentWorker, Worker, get_task_ordering_key
 
 user_model = get_user_model()
 
@@ -196,6 +200,202 @@ class WorkerTestCase(TestMixin, TestCase):
         worker.run_once_without_delete()
         self.assertEqual(StreamData.objects.all().count(), 1)
 
+    def testTaskOrderingKey(self):
+        task = {
+            'module': 'apps.streamer.worker.v2_bin.process_report',
+            'class': 'ProcessReportV2Action',
+            'arguments': {
+                'bucket': 'foo',
+                'key': 'dev/t--0000-0000-0000-000a--0001/2017/09/28/10/00000000-0000-0000-0000-000000000001.bin',
+                'version': 'v2'
+            }
+        }
+        self.assertEqual(get_task_ordering_key(task), 't--0000-0000-0000-000a--0001')
+        task['arguments']['key'] = 'dev/t--0000-0000-0000-000a--0001%2F2017%2F09.bin'
+        self.assertEqual(get_task_ordering_key(task), 't--0000-0000-0000-000a--0001')
+        self.assertIsNone(get_task_ordering_key({'arguments': {'rpt': 'abc'}}))
+        self.assertIsNone(get_task_ordering_key({'arguments': {'key': 'foo/bar.bin'}}))
+
+    def testConcurrentWorkerOrdering(self):
+        queue = QueueTestMock()
+        worker = ConcurrentWorker(queue, 2, max_workers=4)
+        worker.running = True
+        running = set()
+        processed = []
+        lock = threading.Lock()
+
+        def process_task(action, task, message=None):
+            key = task['arguments']['key']
+            with lock:
+                # Tasks for the same streamer should never overlap
+                self.assertFalse(key in running)
+                running.add(key)
+            time.sleep(0.01)
+            with lock:
+                running.remove(key)
+                processed.append((key, task['arguments']['n']))
+            worker.delete_sqs_message(message)
+
+        worker.process_task = process_task
+        bodies = []
+        for n in range(10):
+            key = 'dev/t--0000-0000-0000-000a--000{}/report.bin'.format(n % 2)
+            bodies.append({'module': 'foo', 'class': 'Bar', 'arguments': {'key': key, 'n': n}})
+        queue.add_messages(bodies)
+
+        with mock.patch('apps.sqsworker.workerhelper.db'):
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                worker._executor = executor
+                for message in queue.messages:
+                    worker.submit_task(task=json.loads(message.body), message=message)
+
+        self.assertEqual(worker.pending_count, 0)
+        self.assertEqual(len(processed), 10)
+        self.assertEqual(len(worker._deleted_messages), 10)
+        for key in set([item[0] for item in processed]):
+            ids = [n for k, n in processed if k == key]
+            self.assertEqual(ids, sorted(ids))
+
+    def testConcurrentWorkerHalt(self):
+        queue = QueueTestMock()
+        worker = ConcurrentWorker(queue, 2, max_workers=1)
+        worker.running = True
+        processed = []
+
+        def process_task(action, task, message=None):
+            if task['arguments'].get('halt'):
+                worker._shutdown_procedure(err_msg='Halt', action=None, sqs_message=message)
+            else:
+                processed.append(task['arguments']['n'])
+                worker.delete_sqs_message(message)
+
+        worker.process_task = process_task
+        key = 'dev/t--0000-0000-0000-000a--0001/report.bin'
+        queue.add_messages([
+            {'module': 'foo', 'class': 'Bar', 'arguments': {'key': key, 'n': 0, 'halt': True}},
+            {'module': 'foo', 'class': 'Bar', 'arguments': {'key': key, 'n': 1}},
+            {'module': 'foo', 'class': 'Bar', 'arguments': {'n': 2}},
+        ])
+
+        with mock.patch('apps.sqsworker.workerhelper.db'), mock.patch('apps.sqsworker.workerhelper.ActionPID'):
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                worker._executor = executor
+                for message in queue.messages:
+                    worker.submit_task(task=json.loads(message.body), message=message)
+
+        # Nothing else is started after the halt, and messages not started are left for SQS to requeue
+        self.assertFalse(worker.running)
+        self.assertIsNotNone(worker._halt)
+        self.assertEqual(processed, [])
+        self.assertEqual(worker.pending_count, 0)
+        self.assertEqual(worker._active_messages, {})
+        self.assertEqual(worker._ordered_tasks, {})
+        self.assertEqual([m.message_id for m in worker._deleted_messages], [queue.messages[0].message_id])
+
+    def testConcurrentWorkerBadMessage(self):
+        queue = QueueTestMock()
+        queue.add_messages([{'module': 'foo', 'class': 'Bar', 'arguments': {'n': 0}}])
+        bad_message = Message(queue, {})
+        bad_message.body = 'Not JSON'
+        mock_queue = mock.MagicMock()
+        mock_queue.receive_messages.return_value = [bad_message] + queue.messages
+        worker = ConcurrentWorker(mock_queue, 2, max_workers=4)
+        worker.running = True
+        worker._last_visibility_update = time.time()
+
+        with mock.patch.object(worker, 'submit_task') as mock_submit, \
+                mock.patch('apps.sqsworker.workerhelper.delete_sqs_message_batch') as mock_delete, \
+                mock.patch('apps.sqsworker.workerhelper.ActionPID'):
+            worker.poll()
+
+        # The bad message is deleted, and the other one is still processed
+        self.assertEqual(mock_submit.call_count, 1)
+        mock_delete.assert_called_once_with(mock_queue, [bad_message])
+
+    def testConcurrentWorkerRescheduleDuringExtend(self):
+        queue = QueueTestMock()
+        queue.add_messages([{'module': 'foo', 'class': 'Bar', 'arguments': {'n': n}} for n in range(2)])
+        worker = ConcurrentWorker(queue, 2, max_workers=4, visibility_timeout=300)
+        for message in queue.messages:
+            worker._active_messages[message.message_id] = message
+        visibility = {}
+        extending = threading.Event()
+        rescheduled = threading.Event()
+
+        def change_batch(sqs_queue, messages, timeout):
+            extending.set()
+            # Give the reschedule a chance to run while the batch is being sent
+            rescheduled.wait(0.2)
+            for message in messages:
+                visibility[message.message_id] = timeout
+
+        def change_one(message, delay):
+            visibility[message.message_id] = delay
+            rescheduled.set()
+
+        with mock.patch('apps.sqsworker.workerhelper.change_sqs_message_visibility_batch', change_batch), \
+                mock.patch('apps.sqsworker.workerhelper.change_sqs_message_visibility', change_one), \
+                mock.patch('apps.sqsworker.workerhelper.ActionPID'):
+            thread = threading.Thread(target=worker._extend_visibility)
+            thread.start()
+            extending.wait(1)
+            worker.reschedule_sqs_message(queue.messages[0], delay=60)
+            thread.join()
+
+        # The reschedule delay is the last one set
+        self.assertEqual(visibility[queue.messages[0].message_id], 60)
+        self.assertEqual(visibility[queue.messages[1].message_id], 300)
+        self.assertEqual(list(worker._active_messages.keys()), [queue.messages[1].message_id])
+
+    def testStageProfiler(self):
+        self.assertEqual(size_bucket(0), '0-99')
+        self.assertEqual(size_bucket(500), '100-999')
+        self.assertEqual(size_bucket(5000), '1k-10k')
+        self.assertEqual(size_bucket(50000), '10k+')
+
+        cache.clear()
+        profiler = StageProfiler('TestWorkerAction', engine='v2.bin')
+        with profiler.stage('outer'):
+            StreamId.objects.count()
+            with profiler.stage('inner'):
+                StreamId.objects.count()
+                cache.get('foo')
+        with profiler.stage('inner'):
+            cache.set('foo', 1)
+
+        self.assertEqual(profiler.stages['outer']['count'], 1)
+        self.assertEqual(profiler.stages['outer']['queries'], 2)
+        self.assertEqual(profiler.stages['outer']['cache_calls'], 1)
+        self.assertEqual(profiler.stages['inner']['count'], 2)
+        self.assertEqual(profiler.stages['inner']['queries'], 1)
+        self.assertEqual(profiler.stages['inner']['cache_calls'], 2)
+
+        profiler.finish(size=150)
+        flush_stage_stats(force=True)
+        stats = {item['stage']: item for item in collect_stage_stats()}
+        self.assertEqual(len(stats), 2)
+        self.assertEqual(stats['inner']['task_name'], 'TestWorkerAction')
+        self.assertEqual(stats['inner']['engine'], 'v2.bin')
+        self.assertEqual(stats['inner']['size'], '100-999')
+        self.assertEqual(stats['inner']['count'], 2)
+        self.assertEqual(stats['outer']['queries'], 2)
+        # Stats are reset once collected
+        self.assertEqual(collect_stage_stats(), [])
+
+        # Stats from another worker are added to the registry, without losing the existing ones
+        other = StageProfiler('OtherWorkerAction', engine='v1.bin')
+        with other.stage('inner'):
+            pass
+        other.finish(size=10)
+        profiler.finish(size=150)
+        flush_stage_stats(force=True)
+        stats = {(item['task_name'], item['stage']): item for item in collect_stage_stats()}
+        self.assertEqual(set(stats.keys()), {
+            ('TestWorkerAction', 'outer'), ('TestWorkerAction', 'inner'), ('OtherWorkerAction', 'inner')
+        })
+        self.assertEqual(stats[('TestWorkerAction', 'inner')]['count'], 2)
+        self.assertEqual(stats[('OtherWorkerAction', 'inner')]['size'], '0-99')
+
     @mock.patch('apps.sqsworker.views.WorkerStats')
     def testAccessControls(self, mock_worker_stats):
         mock_worker_stats.return_value = {}
@@ -13,6 +13,7 @@ from .common import ACTION_LIST
 from .dynamodb import DynamoWorkerLogModel
 from .exceptions import HaltAndCatchFire, WorkerActionHardError
 from .models import WorkerStatistics
+from .profiler import collect_stage_stats
 from .tracker import WorkerUUID
 
 logger = logging.getLogger(__name__)
@@ -135,11 +136,29 @@ class WorkerCollectStatsAction(Action):
         else:
             raise WorkerActionHardError('Invalid argument span = {}. Expected d, w or m'.format(span))
 
+    def _create_stage_stats(self, timestamp, span):
+        """
+        Per stage stats are aggregated (by StageProfiler) since the last collection,
+        so they are only collected for the shortest span
+        """
+        for item in collect_stage_stats():
+            stat = WorkerStatistics.objects.create(timestamp=timestamp,
+                                                   span=span,
+                                                   task_name=':'.join([item['task_name'], item['engine'], item['size'], item['stage']]),
+                                                   total_count=item['count'],
+                                                   error_count=0,
+                                                   total_execution_time=item['time_ms'] / 1000.0,
+                                                   total_db_queries=item['queries'],
+                                                   total_cache_calls=item['cache_calls'])
+            logger.info("Statistics created: {}".format(str(stat)))
+
     def execute(self, arguments):
         super(WorkerCollectStatsAction, self).execute(arguments)
         if 'ts' in arguments and 'span' in arguments:
             for task_name in ACTION_LIST:
                 self._create_stats_for_task(task_name=task_name, timestamp=parse_datetime(arguments['ts']), span=arguments['span'])
+            if arguments['span'] == 'd':
+                self._create_stage_stats(timestamp=parse_datetime(arguments['ts']), span=arguments['span'])
             logger.info("Finish creating statistics for worker's task at ts {}, span : {}".format(arguments['ts'], arguments['span']))
         else:
             raise WorkerActionHardError('Missing fields in argument payload. Error comes from WorkerCollectStatsAction with arguments: {}'.format(arguments))
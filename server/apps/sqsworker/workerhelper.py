@@ -1,9 +1,13 @@
+import collections
 import json
 import logging
 import sys
+import threading
 import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib import parse
 
 from django import db
 from django.conf import settings
@@ -11,7 +15,9 @@ from django.db.utils import DatabaseError, InterfaceError, OperationalError
 from django.utils import timezone
 
 from apps.utils.aws.sns import sns_staff_notification
-from apps.utils.aws.sqs import change_sqs_message_visibility, get_sqs_messages
+from apps.utils.aws.sqs import (
+    change_sqs_message_visibility, change_sqs_message_visibility_batch, delete_sqs_message_batch, get_sqs_messages
+)
 from apps.utils.dynamic_loading import str_to_class
 from apps.utils.timezone_utils import str_utc
 
@@ -22,6 +28,25 @@ from .tracker import WorkerUUID
 
 logger = logging.getLogger(__name__)
 WORKER_QUEUE_NAME = getattr(settings, 'SQS_WORKER_QUEUE_NAME')
+# SQS limits
+SQS_MAX_BATCH_SIZE = 10
+SQS_MAX_WAIT_TIME_SECONDS = 20
+
+
+def get_task_ordering_key(task):
+    """
+    Tasks processing streamer reports should never run in parallel for the same streamer.
+    The streamer slug is part of the report S3 key: '{stage}/{streamer}/{path}/{uuid}{ext}'
+
+    :param task: parsed SQS message body
+    :return: Streamer slug if the task needs to be serialized, None otherwise
+    """
+    arguments = task.get('arguments')
+    if isinstance(arguments, dict) and 'key' in arguments:
+        for part in parse.unquote(str(arguments['key'])).split('/'):
+            if part.startswith('t--'):
+                return part
+    return None
 
 
 class Worker(object):
@@ -116,12 +141,30 @@ class Worker(object):
             ActionPID.delete(message.message_id)
             change_sqs_message_visibility(message, delay)
 
+    def parse_message(self, message):
+        """
+        :param message: SQS message
+        :return: parsed message body, or None if the body is not valid JSON
+        """
+        try:
+            return json.loads(message.body)
+        except ValueError as e:
+            self.log_error(error_txt='Unable to parse SQS message: {}'.format(str(e)), message=message)
+            return None
+
+    def count_task(self, task):
+        self.id.increment_count()
+        self.id.increment_action_count(task['class'])
+
     def _shutdown_procedure(self, err_msg, action, sqs_message):
         self.log_status(action, 'ShutDown-0')
         self.log_error(error_txt=str(err_msg), message=sqs_message)
         # First delete message to ensure it does not get re-queue
         self.delete_sqs_message(sqs_message)
-        # Now enter a loop to three 30min sleeps, or abort after that
+        self._wait_for_shutdown(action)
+
+    def _wait_for_shutdown(self, action):
+        # Enter a loop to three 30min sleeps, or abort after that
         count = 1
         while count <= 3:
             time.sleep(30 * 60)  # 30min
@@ -146,8 +189,7 @@ class Worker(object):
             self.delete_sqs_message(message)
 
         if action:
-            self.id.increment_count()
-            self.id.increment_action_count(task['class'])
+            self.count_task(task)
             self.worker_task_log_obj = create_worker_log(uuid=str(self.id), task=task['class'], args=task['arguments'])
             try:
                 self.call_action(action, task)
@@ -196,17 +238,20 @@ class Worker(object):
             finally:
                 pass
 
+    def _start(self):
+        ts_now = str(timezone.now())
+        self.id.start(ts_now)
+        self.id.increment_action_count('WorkerStarted')
+        sns_staff_notification("SQSWorker Started:\n\n - ID: {0}:{1}\n - Timestamp: {2}".format(settings.SERVER_TYPE, str(self.id), ts_now))
+        create_worker_log(uuid=str(self.id), task='WorkerStarted', args="")
+
     def run(self):
         """
         Run the worker with the given sqs queue and sleeping time
         :return:
         """
         logger.info('Running worker...')
-        ts_now = str(timezone.now())
-        self.id.start(ts_now)
-        self.id.increment_action_count('WorkerStarted')
-        sns_staff_notification("SQSWorker Started:\n\n - ID: {0}:{1}\n - Timestamp: {2}".format(settings.SERVER_TYPE, str(self.id), ts_now))
-        create_worker_log(uuid=str(self.id), task='WorkerStarted', args="")
+        self._start()
 
         self.running = True
         while self.running:
@@ -215,9 +260,12 @@ class Worker(object):
                 if len(messages) > 0:
                     for message in messages:
                         action = None
-                        task = json.loads(message.body)
+                        task = self.parse_message(message)
                         if task:
                             self.process_task(action=action, task=task, message=message)
+                        elif task is None:
+                            # Not valid JSON: will never be processed
+                            self.delete_sqs_message(message)
                 else:
                     logger.info('Nothing in SQS queue, worker goes to sleep at {}'.format(timezone.now()))
                     time.sleep(self.wait_time)
@@ -236,7 +284,7 @@ class Worker(object):
             if len(messages) > 0:
                 for message in messages:
                     action = None
-                    task = json.loads(message.body)
+                    task = self.parse_message(message)
                     if task:
                         self.process_task(action=action, task=task)
 
@@ -247,3 +295,226 @@ class Worker(object):
     def stop(self):
         self.running = False
 
+
+
+class ConcurrentWorker(Worker):
+    """
+    Worker that long polls SQS for batches of messages and runs them on a bounded thread pool.
+
+    Tasks for the same streamer (see get_task_ordering_key) are queued in-process and run
+    one at a time, in the order they were received. The visibility timeout of every message
+    that is running or waiting is extended periodically, and messages are deleted in batches.
+
+    Once stopped (or halted by a HaltAndCatchFire), no new message is received or started, and
+    messages that were not started are left for SQS to requeue. A halt then waits for the
+    shutdown on the main thread.
+    """
+    max_workers = 1
+    visibility_timeout = 300
+
+    def __init__(self, sqs_queue, wait_time, max_workers=4, visibility_timeout=300):
+        """
+        :param sqs_queue: The sqs queue from which the worker reads tasks
+        :param wait_time: Not used. Empty queues are long polled instead
+        :param max_workers: Number of tasks to run in parallel
+        :param visibility_timeout: Visibility timeout to keep on received messages, in seconds
+        """
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+        # streamer slug -> deque of (task, message) waiting for the running task of that streamer
+        self._ordered_tasks = {}
+        # message_id -> message for all messages that are running or waiting
+        self._active_messages = {}
+        self._deleted_messages = []
+        self._pending_count = 0
+        self._last_visibility_update = 0
+        # (action, worker log) of the task that requested a halt
+        self._halt = None
+        super(ConcurrentWorker, self).__init__(sqs_queue, wait_time)
+        self.max_workers = max_workers
+        self.visibility_timeout = visibility_timeout
+
+    @property
+    def worker_task_log_obj(self):
+        # Every thread is processing a different task, so keep the log object per thread
+        return getattr(self._local, 'worker_task_log_obj', None)
+
+    @worker_task_log_obj.setter
+    def worker_task_log_obj(self, value):
+        self._local.worker_task_log_obj = value
+
+    @property
+    def pending_count(self):
+        return self._pending_count
+
+    def delete_sqs_message(self, message):
+        # Messages are deleted in batches by the main thread
+        if message:
+            ActionPID.delete(message.message_id)
+            with self._lock:
+                self._active_messages.pop(message.message_id, None)
+                self._deleted_messages.append(message)
+
+    def reschedule_sqs_message(self, message, delay):
+        if message:
+            # Under the lock, so the delay cannot be overridden by an ongoing visibility extension
+            with self._lock:
+                self._active_messages.pop(message.message_id, None)
+                super(ConcurrentWorker, self).reschedule_sqs_message(message, delay)
+
+    def count_task(self, task):
+        with self._lock:
+            super(ConcurrentWorker, self).count_task(task)
+
+    def _shutdown_procedure(self, err_msg, action, sqs_message):
+        # Called from a pool thread: stop receiving and starting messages, and let
+        # the main thread wait for the shutdown, once running tasks are done (see run)
+        self.log_status(action, 'ShutDown-0')
+        self.log_error(error_txt=str(err_msg), message=sqs_message)
+        self.delete_sqs_message(sqs_message)
+        with self._lock:
+            if self._halt is None:
+                self._halt = (action, self.worker_task_log_obj)
+        self.stop()
+
+    def _release_messages(self, messages):
+        """
+        Stop tracking messages that will not be processed (they are not deleted, so SQS will requeue them).
+        Call with the lock held
+        """
+        for message in messages:
+            self._active_messages.pop(message.message_id, None)
+        self._pending_count -= len(messages)
+
+    def _flush_deleted_messages(self):
+        with self._lock:
+            messages = self._deleted_messages
+            self._deleted_messages = []
+
+        for i in range(0, len(messages), SQS_MAX_BATCH_SIZE):
+            try:
+                delete_sqs_message_batch(self.queue, messages[i:i + SQS_MAX_BATCH_SIZE])
+            except Exception as e:
+                # Messages will be requeued once their visibility timeout expires
+                self.log_error(error_txt='Unable to delete SQS messages: {}'.format(str(e)))
+
+    def _extend_visibility(self):
+        # Hold the lock for the whole update, so a message rescheduled (with a delay)
+        # while the batches are sent is never extended afterwards
+        with self._lock:
+            messages = list(self._active_messages.values())
+            for i in range(0, len(messages), SQS_MAX_BATCH_SIZE):
+                try:
+                    change_sqs_message_visibility_batch(
+                        self.queue, messages[i:i + SQS_MAX_BATCH_SIZE], self.visibility_timeout
+                    )
+                except Exception as e:
+                    self.log_error(error_txt='Unable to extend SQS message visibility: {}'.format(str(e)))
+        self._last_visibility_update = time.time()
+
+    def _run_task(self, task, message):
+        try:
+            self.process_task(action=None, task=task, message=message)
+        except SystemExit:
+            # process_task exits on database errors. Stop the whole worker, not just this thread
+            logger.error('Task requested worker exit. Stopping worker')
+            self.stop()
+        except Exception as e:
+            formatted_lines = traceback.format_exc().splitlines()
+            self.log_error(error_txt=str(e), message=message, trace="\n".join(formatted_lines))
+        finally:
+            db.close_old_connections()
+            with self._lock:
+                self._pending_count -= 1
+
+    def _run_ordered_tasks(self, key, task, message):
+        """
+        Run a task and, if it has an ordering key, any task for the same key
+        that was received while it was running
+        """
+        while True:
+            if self.running:
+                self._run_task(task, message)
+            else:
+                with self._lock:
+                    self._release_messages([message])
+            if not key:
+                return
+            with self._lock:
+                waiting = self._ordered_tasks[key]
+                if not waiting or not self.running:
+                    self._release_messages([waiting_message for _, waiting_message in waiting])
+                    del self._ordered_tasks[key]
+                    return
+                task, message = waiting.popleft()
+
+    def submit_task(self, task, message):
+        """
+        Queue a task to run on the thread pool
+
+        :param task: parsed SQS message body
+        :param message: SQS message
+        """
+        key = get_task_ordering_key(task)
+        with self._lock:
+            self._pending_count += 1
+            self._active_messages[message.message_id] = message
+            if key:
+                if key in self._ordered_tasks:
+                    logger.info('Task for {0} already running. Queueing message {1}'.format(key, message.message_id))
+                    self._ordered_tasks[key].append((task, message))
+                    return
+                self._ordered_tasks[key] = collections.deque()
+
+        self._executor.submit(self._run_ordered_tasks, key, task, message)
+
+    def poll(self):
+        """
+        Receive as many messages as there is capacity for, and submit them
+        """
+        capacity = 2 * self.max_workers - self.pending_count
+        if capacity > 0:
+            messages = self.queue.receive_messages(
+                MaxNumberOfMessages=min(capacity, SQS_MAX_BATCH_SIZE),
+                WaitTimeSeconds=SQS_MAX_WAIT_TIME_SECONDS,
+                VisibilityTimeout=self.visibility_timeout
+            )
+            for message in messages:
+                task = self.parse_message(message)
+                if task:
+                    self.submit_task(task=task, message=message)
+                elif task is None:
+                    # Not valid JSON: will never be processed
+                    self.delete_sqs_message(message)
+        else:
+            time.sleep(1)
+
+        self._flush_deleted_messages()
+        if time.time() - self._last_visibility_update > self.visibility_timeout / 2:
+            self._extend_visibility()
+
+    def run(self):
+        """
+        Run the worker with the given sqs queue until stopped
+        :return:
+        """
+        logger.info('Running concurrent worker with {} threads...'.format(self.max_workers))
+        self._start()
+
+        self.running = True
+        self._last_visibility_update = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self._executor = executor
+            while self.running:
+                try:
+                    self.poll()
+                except KeyboardInterrupt as e:
+                    self.stop()
+                    logger.info('Worker stopping. Waiting for running tasks...')
+
+        self._flush_deleted_messages()
+        if self._halt is not None:
+            action, self.worker_task_log_obj = self._halt
+            self._wait_for_shutdown(action)
+        logger.info('Worker stopped.')
@@ -35,7 +35,7 @@ class RemoveDuplicateAction(Action):
                 end = ((page + 1) * page_size)
                 logger.info('{}: Deleting page {}: [{}:{}]'.format(stream_slug, page+1, start, end))
                 page_ids = pending_delete_ids[start:end]
-                DataManager.filter_qs('data', id__in=page_ids).delete()
+                DataManager.delete_in_chunks('data', chunk_size=page_size, id__in=page_ids)
 
     def _remove_duplicate_device(self, device_slug):
         try:
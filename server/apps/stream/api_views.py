@@ -1,19 +1,14 @@
 # Modules needed to execute back-end jobs requested by server
-import csv
 import logging
 from datetime import datetime, timedelta
 
-import pytz
-
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.paginator import Paginator
 from django.db.models import Q
-from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.utils.timezone import localtime
 
 import django_filters
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet
@@ -35,6 +30,7 @@ from apps.streamevent.serializers import StreamIdEventDataSerializer
 from apps.utils.gid.convert import formatted_gsid, formatted_gvid, get_device_and_block_by_did
 from apps.utils.rest.custom_serializers import MultiSerializerViewSetMixin
 from apps.utils.rest.pagination import LargeResultsSetPagination, SuperLargeResultsSetPagination
+from apps.utils.rest.streaming import EXPORT_FETCH_SIZE, streaming_export_response
 from apps.utils.uuid_utils import validate_uuid
 from apps.vartype.serializers import VarTypeReadOnlySerializer
 
@@ -413,35 +409,48 @@ class APIStreamIdViewSet(MultiSerializerViewSetMixin, viewsets.ModelViewSet):
                 name='end', in_=openapi.IN_QUERY,
                 type=openapi.TYPE_STRING,
                 description="Show data points with timestamp before this value"
+            ),
+            openapi.Parameter(
+                name='output', in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="csv (default) or ndjson"
             )
         ]
     )
     @action(methods=['get'], detail=True)
     def csv(self, request, slug=None):
         """
-        Get Stream data in CSV format
+        Get Stream data in CSV format (or NDJSON with output=ndjson).
+        Data is streamed, so there is no limit on the number of rows
         """
+        output = request.GET.get('output', 'csv')
+        if output not in ['csv', 'ndjson']:
+            return Response({'error': 'output must be one of: csv, ndjson'}, status=status.HTTP_400_BAD_REQUEST)
 
         stream = self.get_object()
         helper = StreamDataQueryHelper(stream=stream)
-        data = helper.get_data_for_filter(request.GET)
+        try:
+            data = helper.get_data_for_filter(request.GET)
+        except ValidationError as e:
+            return Response({'error': 'Validation Error: {}'.format(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if isinstance(data, list):
+            # lastn returns a (bounded) list of objects
+            rows = [(item.timestamp, item.int_value) for item in data]
+        else:
+            rows = data.values_list('timestamp', 'int_value').iterator(chunk_size=EXPORT_FETCH_SIZE)
 
-        response = HttpResponse()
-        response['Content-Disposition'] = 'attachment; filename="{0}.csv"'.format(stream.slug)
-        csv_writer = csv.DictWriter(response, ['Timestamp', 'Value'])
-        csv_writer.writeheader()
         helper = StreamDataDisplayHelper(stream=stream)
-        for item in data:
-            try:
-                timestamp = localtime(item.timestamp).strftime('%Y/%m/%d %H:%M:%S')
-            except ValueError:
-                aware = pytz.utc.localize(item.timestamp)
-                timestamp = aware.strftime('%Y/%m/%d %H:%M:%S')
-            csv_writer.writerow({
-                'Timestamp': timestamp,
-                'Value': helper.output_value(value=item.int_value)
-            })
-        return response
+        if output == 'csv':
+            fields = ['Timestamp', 'Value']
+            # The current timezone must be read now, as rows are only generated after the view returns
+            rows = helper.iter_output_rows(
+                rows, timestamp_format='%Y/%m/%d %H:%M:%S', tz=timezone.get_current_timezone()
+            )
+        else:
+            fields = ['timestamp', 'value']
+            rows = helper.iter_output_rows(rows)
+        return streaming_export_response(rows, fields, output, filename=stream.slug)
 
     @swagger_auto_schema(
         auto_schema = None
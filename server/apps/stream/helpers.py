@@ -1,9 +1,14 @@
 import logging
+from itertools import islice
+
+import numpy as np
+import pandas as pd
 
 from apps.utils.data_helpers.manager import DataManager
 from apps.utils.data_mask.mask_utils import get_data_mask_date_range_for_slug
 from apps.utils.iotile.variable import SYSTEM_VID
 from apps.utils.mdo.helpers import MdoHelper
+from apps.utils.rest.streaming import EXPORT_FETCH_SIZE
 from apps.utils.timezone_utils import str_to_dt_utc
 
 from .models import StreamId
@@ -174,6 +179,72 @@ class StreamDataDisplayHelper(object):
 
         return ret_value
 
+    def _get_base_output_mdos(self, stream):
+        # Same order as _base_output_value: derived streams first
+        mdos = []
+        if stream.derived_stream:
+            mdos += self._get_base_output_mdos(stream=stream.derived_stream)
+        if stream.output_unit:
+            mdos.append(MdoHelper(stream.output_unit.m, stream.output_unit.d, stream.output_unit.o))
+        return mdos
+
+    def get_output_mdo(self):
+        """
+        Single MDO equivalent to output_value(), so it can be applied to many values at once
+
+        :return: MdoHelper, or None if values are output as they are
+        """
+        mdos = self._get_base_output_mdos(stream=self._stream)
+
+        if self._derived_stream:
+            if self._stream.derived_selection != '':
+                out_unit = self._stream.derived_variable.output_unit
+                if out_unit:
+                    if self._stream.derived_selection in out_unit.derived_units:
+                        mdos.append(MdoHelper(
+                            m=out_unit.derived_units[self._stream.derived_selection]['m'],
+                            d=out_unit.derived_units[self._stream.derived_selection]['d']
+                        ))
+
+        if mdos:
+            return MdoHelper.chain(*mdos)
+        return None
+
+    def iter_output_rows(self, rows, timestamp_format='%Y-%m-%dT%H:%M:%SZ', tz=None, chunk_size=EXPORT_FETCH_SIZE):
+        """
+        Convert (timestamp, int_value) rows into (formatted timestamp, output value) rows.
+        Rows are processed chunk_size at a time, so the output MDO and the timestamp
+        formatting are applied to a whole chunk at once
+
+        :param rows: iterable of (timestamp, int_value) tuples (e.g. values_list(...).iterator())
+        :param timestamp_format: strftime format
+        :param tz: Timezone to format the timestamps in (UTC if not set)
+        :param chunk_size: Number of rows processed at a time
+        :return: generator of (str, value) tuples
+        """
+        output_mdo = self.get_output_mdo()
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            timestamps, values = zip(*chunk)
+
+            # Naive timestamps are assumed to be UTC
+            timestamps = pd.to_datetime(list(timestamps), utc=True)
+            if tz is not None:
+                timestamps = timestamps.tz_convert(tz)
+            timestamps = timestamps.strftime(timestamp_format).fillna('')
+
+            if output_mdo is not None:
+                # Missing values (None) become NaN, and then None again
+                values = output_mdo.compute_array(np.array(values, dtype=np.float64))
+                missing = np.isnan(values)
+                values = values.astype(object)
+                values[missing] = None
+
+            yield from zip(timestamps, values)
+
     def output_value(self, value):
         if (not isinstance(value, int) and not isinstance(value, float)):
             return None
@@ -0,0 +1,172 @@
+import copy
+import logging
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.streamdata.utils import get_stream_input_mdo, get_stream_mdo, get_stream_output_mdo
+from apps.utils.local_cache import LocalCache
+from apps.utils.mdo.helpers import MdoHelper
+from apps.vartype.models import VarType, VarTypeInputUnit, VarTypeOutputUnit
+
+from .models import StreamId, StreamVariable
+
+logger = logging.getLogger(__name__)
+
+# Related objects needed to compute the stream MDOs (and to decode encoded streams)
+STREAM_METADATA_SELECT_RELATED = [
+    'variable', 'variable__input_unit', 'variable__output_unit', 'input_unit', 'output_unit', 'var_type'
+]
+STREAM_METADATA_LOCAL_CACHE_MAX_ENTRIES = 4096
+
+# Process level tier, shared by all resolvers (and threads). Only existing streams, as loaded
+# from the database, are cached here (a stream can be created at any time, but is rarely modified),
+# and every resolver gets its own copy of the StreamId.
+# Entries are dropped when a stream, variable, var type or unit is saved or deleted by this process.
+# Changes made by other processes are seen after, at most, STREAM_METADATA_LOCAL_CACHE_TIMEOUT seconds
+_local_metadata = LocalCache(max_entries=STREAM_METADATA_LOCAL_CACHE_MAX_ENTRIES)
+
+
+class StreamMetadata(object):
+    """
+    A StreamId (with its variable and units already loaded) and everything
+    needed to convert its values, computed once.
+    """
+    stream = None
+    raw_value_format = None
+    stream_mdo = None
+    input_mdo = None
+    output_mdo = None
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.raw_value_format = stream.raw_value_format
+        self.stream_mdo = get_stream_mdo(stream)
+        self.input_mdo = get_stream_input_mdo(stream)
+        self.output_mdo = get_stream_output_mdo(stream)
+
+    @property
+    def slug(self):
+        return self.stream.slug
+
+    def copy(self):
+        """
+        :return: StreamMetadata with its own copy of the StreamId (and related objects).
+                 MDOs are never modified, so they are shared
+        """
+        metadata = copy.copy(self)
+        metadata.stream = copy.deepcopy(self.stream)
+        return metadata
+
+    def get_value_mdo(self, apply_output=False):
+        """
+        :param apply_output: If True, also apply the output MDO
+        :return: Single MDO to convert a (casted) raw value into a stored (or output) value
+        """
+        mdos = [self.stream_mdo, self.input_mdo]
+        if apply_output:
+            mdos.append(self.output_mdo)
+        return MdoHelper.chain(*mdos)
+
+
+class StreamMetadataResolver(object):
+    """
+    Resolve stream slugs into StreamMetadata, loading all streams of a report, device or
+    request with a single query, instead of one (or more) query per stream.
+
+    Results are kept for the life of the resolver (i.e. a report or a request), and
+    existing streams are also kept in a process level cache for a short time.
+    Slugs with no StreamId resolve to None.
+    """
+    _metadata = {}
+
+    def __init__(self):
+        self._metadata = {}
+
+    def _get_queryset(self):
+        return StreamId.objects.select_related(*STREAM_METADATA_SELECT_RELATED)
+
+    def _add(self, stream, cache_locally=True):
+        metadata = StreamMetadata(stream)
+        self._metadata[stream.slug] = metadata
+        if cache_locally:
+            # Cache a copy, so changes made to this stream by the caller are not seen by other resolvers
+            _local_metadata.set(
+                stream.slug, metadata.copy(), timeout=getattr(settings, 'STREAM_METADATA_LOCAL_CACHE_TIMEOUT', 0)
+            )
+        return metadata
+
+    def add_stream(self, stream):
+        """
+        Add (or replace) an already loaded stream. Only used by this resolver,
+        as the stream may have been modified
+        """
+        return self._add(stream, cache_locally=False)
+
+    def prefetch(self, slugs):
+        """
+        Load all given streams that are not yet known, with a single query
+
+        :param slugs: iterable of stream slugs
+        """
+        missing = []
+        for slug in set([str(slug) for slug in slugs]):
+            if slug not in self._metadata:
+                metadata = _local_metadata.get(slug)
+                if metadata is not None:
+                    self._metadata[slug] = metadata.copy()
+                else:
+                    missing.append(slug)
+
+        if missing:
+            for stream in self._get_queryset().filter(slug__in=missing):
+                self._add(stream)
+            for slug in missing:
+                self._metadata.setdefault(slug, None)
+
+    def prefetch_device(self, device):
+        """
+        Load all streams of a device with a single query
+        """
+        for stream in self._get_queryset().filter(device=device):
+            if stream.slug not in self._metadata:
+                self._add(stream)
+
+    def get(self, slug):
+        """
+        :return: StreamMetadata, or None if there is no StreamId for the slug
+        """
+        slug = str(slug)
+        if slug not in self._metadata:
+            self.prefetch([slug])
+        return self._metadata[slug]
+
+    def get_stream(self, slug):
+        """
+        :return: StreamId, or None
+        """
+        metadata = self.get(slug)
+        if metadata is not None:
+            return metadata.stream
+        return None
+
+
+@receiver(post_save, sender=StreamId)
+@receiver(post_delete, sender=StreamId)
+def clear_local_stream_metadata_callback(sender, instance, **kwargs):
+    if instance.slug:
+        _local_metadata.delete(instance.slug)
+
+
+@receiver(post_save, sender=StreamVariable)
+@receiver(post_delete, sender=StreamVariable)
+@receiver(post_save, sender=VarType)
+@receiver(post_delete, sender=VarType)
+@receiver(post_save, sender=VarTypeInputUnit)
+@receiver(post_delete, sender=VarTypeInputUnit)
+@receiver(post_save, sender=VarTypeOutputUnit)
+@receiver(post_delete, sender=VarTypeOutputUnit)
+def clear_all_local_stream_metadata_callback(sender, instance, **kwargs):
+    # Used by any number of streams, but rarely modified
+    _local_metadata.clear()
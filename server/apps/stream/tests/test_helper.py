@@ -4,7 +4,7 @@ import json
 import dateutil.parser
 
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.utils import dateparse, timezone
 from django.utils.dateparse import parse_datetime
 
@@ -22,6 +22,7 @@ from apps.utils.timezone_utils import str_utc
 from apps.vartype.models import *
 
 from ..helpers import *
+from ..metadata import StreamMetadataResolver, _local_metadata
 from ..models import *
 
 user_model = get_user_model()
@@ -96,6 +97,62 @@ class StreamDataDisplayHelperTest(TestMixin, TestCase):
 
         self.assertEqual(helper.format_value(None), 'ERR')
 
+    def testStreamMetadataResolver(self):
+        v2 = StreamVariable.objects.create_variable(
+            name='Var B', project=self.p1, created_by=self.u2, lid=2,
+            multiplication_factor=2, division_factor=1
+        )
+        s2 = StreamId.objects.create_stream(
+            project=self.p1, variable=v2, device=self.d1, created_by=self.u2,
+            mdo_type='S', multiplication_factor=3, division_factor=1, offset=1.0
+        )
+        missing_slug = 's--0000-0001--0000-0000-0000-0001--5099'
+
+        resolver = StreamMetadataResolver()
+        with self.assertNumQueries(1):
+            resolver.prefetch([self.s.slug, s2.slug, missing_slug])
+        with self.assertNumQueries(0):
+            metadata = resolver.get(s2.slug)
+            self.assertEqual(metadata.stream.id, s2.id)
+            self.assertEqual(metadata.stream.variable.id, v2.id)
+            self.assertEqual(metadata.stream_mdo.compute(10), 31.0)
+            self.assertEqual(metadata.get_value_mdo().compute(10), 31.0)
+            self.assertEqual(resolver.get_stream(self.s.slug).id, self.s.id)
+            self.assertIsNone(resolver.get(missing_slug))
+            self.assertIsNone(resolver.get_stream(missing_slug))
+
+        # Streams added explicitly replace the prefetched ones
+        s2.offset = 2.0
+        resolver.add_stream(s2)
+        self.assertEqual(resolver.get(s2.slug).stream_mdo.compute(10), 32.0)
+
+    @override_settings(STREAM_METADATA_LOCAL_CACHE_TIMEOUT=60)
+    def testStreamMetadataLocalCache(self):
+        _local_metadata.clear()
+        resolver1 = StreamMetadataResolver()
+        stream1 = resolver1.get_stream(self.s.slug)
+        self.assertEqual(stream1.id, self.s.id)
+
+        # From the process level cache, but every resolver gets its own copy
+        resolver2 = StreamMetadataResolver()
+        with self.assertNumQueries(0):
+            stream2 = resolver2.get_stream(self.s.slug)
+            self.assertEqual(stream2.variable.id, self.s.variable.id)
+        self.assertEqual(stream2.id, stream1.id)
+        self.assertIsNot(stream2, stream1)
+        self.assertIsNot(stream2.variable, stream1.variable)
+
+        # Explicitly added streams are not cached, as they may have been modified
+        stream1.offset = 5.0
+        resolver1.add_stream(stream1)
+        self.assertNotEqual(StreamMetadataResolver().get_stream(self.s.slug).offset, 5.0)
+
+        # Saving a variable (or unit) drops all cached streams
+        self.s.variable.save()
+        with self.assertNumQueries(1):
+            StreamMetadataResolver().get(self.s.slug)
+        _local_metadata.clear()
+
 
 class StreamDataQueryHelperTest(TestMixin, APITestCase):
 
@@ -165,6 +222,7 @@ class StreamDataQueryHelperTest(TestMixin, APITestCase):
         )
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamId.objects.all().delete()
         StreamVariable.objects.all().delete()
         Device.objects.all().delete()
@@ -201,6 +201,73 @@ class StreamIdDataAPITests(TestMixin, APITestCase):
 
         self.client.logout()
 
+    def testGetCsv(self):
+        url = reverse('streamid-csv', kwargs={'slug': self.s1.slug})
+
+        var_type = VarType.objects.create(
+            name='Volume',
+            storage_units_full='Liters',
+            created_by=self.u1
+        )
+        self.s1.output_unit = VarTypeOutputUnit.objects.create(
+            var_type=var_type,
+            unit_full='Gallons',
+            unit_short='g',
+            m=4,
+            d=2,
+            o=1.0,
+            created_by=self.u1
+        )
+        self.s1.save()
+
+        dt1 = dateutil.parser.parse('2016-09-28T10:00:00Z')
+        StreamData.objects.create(
+            stream_slug=self.s1.slug,
+            type='Num',
+            timestamp=dt1,
+            int_value=5
+        )
+        StreamData.objects.create(
+            stream_slug=self.s1.slug,
+            type='Num',
+            timestamp=dt1 + datetime.timedelta(seconds=10),
+            int_value=None
+        )
+        StreamData.objects.create(
+            stream_slug=self.s1.slug,
+            type='Num',
+            timestamp=dt1 + datetime.timedelta(seconds=20),
+            int_value=6
+        )
+
+        ok = self.client.login(email='user1@foo.com', password='pass')
+        self.assertTrue(ok)
+
+        response = self.client.get(url+'?staff=1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="{}.csv"'.format(self.s1.slug))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines, [
+            'Timestamp,Value',
+            '2016/09/28 10:00:00,11.0',
+            '2016/09/28 10:00:10,',
+            '2016/09/28 10:00:20,13.0',
+        ])
+
+        response = self.client.get(url+'?staff=1&output=ndjson&lastn=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [
+            {'timestamp': '2016-09-28T10:00:10Z', 'value': None},
+            {'timestamp': '2016-09-28T10:00:20Z', 'value': 13.0},
+        ])
+
+        response = self.client.get(url+'?staff=1&output=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.logout()
+
     def testMembershipAccess(self):
         url = reverse('streamid-list')
 
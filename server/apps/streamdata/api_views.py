@@ -9,6 +9,7 @@ import django_filters
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import ParseError, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -16,19 +17,20 @@ from rest_pandas import PandasCSVRenderer, PandasJSONRenderer, PandasSimpleView,
 
 from iotile_cloud.utils.gid import IOTileStreamSlug
 
+from apps.stream.metadata import StreamMetadataResolver
 from apps.stream.models import StreamId
 from apps.utils.aws.kinesis import send_to_firehose
 from apps.utils.data_mask.mask_utils import get_data_mask_date_range_for_slug
 from apps.utils.iotile.variable import SYSTEM_VID
 from apps.utils.objects.utils import get_device_or_block, get_object_by_slug
 from apps.utils.rest.exceptions import ApiIllegalFilterOrTargetException, ApiIllegalPkException
-from apps.utils.rest.pagination import LargeResultsSetPagination
+from apps.utils.rest.pagination import DataKeysetPagination, LargeResultsSetPagination
+from apps.utils.rest.streaming import EXPORT_CONTENT_TYPES, EXPORT_FETCH_SIZE, streaming_export_response
 from apps.utils.timezone_utils import str_to_dt_utc
 
 from .helpers import StreamDataBuilderHelper
 from .models import *
 from .serializers import *
-from .utils import get_stream_output_mdo
 
 user_model = get_user_model()
 
@@ -97,14 +99,10 @@ class StreamDataFilter(django_filters.rest_framework.FilterSet):
         elif value > 100000:
             raise ValidationError('lastn limit is 100000')
         
-        n = queryset.count()
-        if value > n:
-            # queryset doesn't support negative indexing
-            qs = queryset.order_by('timestamp')
-        else:
-            qs = queryset.order_by('timestamp')[n-value:]
-
-        return qs
+        # Use a subquery for the last N ids, instead of counting all rows and slicing with an offset.
+        # The result is still a filtered (not sliced) queryset, so it can be further filtered and paginated
+        last_ids = queryset.order_by('-timestamp').values('id')[:int(value)]
+        return queryset.filter(id__in=last_ids).order_by('timestamp')
 
 
 class APIStreamDataFrameViewSet(PandasSimpleView):
@@ -212,14 +210,17 @@ class APIStreamDataFrameViewSet(PandasSimpleView):
 
         # Apply MDO per stream if needed
         if apply_mdo and not df.empty:
+            resolver = StreamMetadataResolver()
             if pivot:
-                streams = StreamId.objects.filter(slug__in=[str(col) for col in df])
-                for stream in streams:
-                    mdo = get_stream_output_mdo(stream)
+                slugs = [str(col) for col in df]
+                resolver.prefetch(slugs)
+                for slug in slugs:
+                    metadata = resolver.get(slug)
+                    mdo = metadata.output_mdo if metadata else None
                     if mdo:
                         try:
                             # Apply MDO for whole column, representing single stream (as it is a pivot)
-                            df[stream.slug] = df[stream.slug].apply(lambda x: mdo.compute(x))
+                            df[slug] = mdo.compute_array(df[slug])
                         except Exception as e:
                             raise ParseError(e)
 
@@ -230,13 +231,15 @@ class APIStreamDataFrameViewSet(PandasSimpleView):
                     except Exception as e:
                         raise ParseError(e)
             else:
-                streams = StreamId.objects.filter(slug__in=stream_set)
-                for stream in streams:
-                    mdo = get_stream_output_mdo(stream)
+                resolver.prefetch(stream_set)
+                for slug in stream_set:
+                    metadata = resolver.get(slug)
+                    mdo = metadata.output_mdo if metadata else None
                     if mdo:
                         try:
                             # Selectively apply MDO to rows for given stream
-                            df['value'] = df.apply(lambda x: mdo.compute(x['value']) if x['stream_slug'] == stream.slug else x['value'], axis=1)
+                            rows = df['stream_slug'] == slug
+                            df.loc[rows, 'value'] = mdo.compute_array(df.loc[rows, 'value'])
                         except Exception as e:
                             raise ParseError(e)
 
@@ -250,6 +253,12 @@ class APIStreamDataViewSet(viewsets.ModelViewSet):
     * StreamData is the data collected from an IOTile Device over time. 
     * It is associated with a Stream, which represents the given output (Variable) for a given Device
 
+    Use `cursor=` (empty for the first page) to get cursor based pages instead of numbered pages.
+    This is a lot faster for large data sets: follow the `next` link until it is null.
+    Use `ordering=timestamp` (default) or `ordering=streamer_local_id` to set the order of the cursor.
+
+    Use `/api/v1/data/export/?filter=...&output=ndjson|csv|msgpack` to get all data in a single streamed response.
+
     create: Staff Only.
     destroy: Staff Ony.
     destroy: Staff Only.
@@ -261,6 +270,33 @@ class APIStreamDataViewSet(viewsets.ModelViewSet):
     pagination_class = LargeResultsSetPagination
     filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
     filterset_class = StreamDataFilter
+    export_fields = (
+        ('id', 'id'),
+        ('stream', 'stream_slug'),
+        ('project', 'project_slug'),
+        ('device', 'device_slug'),
+        ('variable', 'variable_slug'),
+        ('type', 'type'),
+        ('device_timestamp', 'device_timestamp'),
+        ('timestamp', 'timestamp'),
+        ('int_value', 'int_value'),
+        ('value', 'value'),
+        ('streamer_local_id', 'streamer_local_id'),
+        ('dirty_ts', 'dirty_ts'),
+        ('status', 'status'),
+    )
+
+    @property
+    def paginator(self):
+        """
+        Use keyset pagination if a cursor argument is given (even if empty)
+        """
+        if not hasattr(self, '_paginator'):
+            if self.request is not None and DataKeysetPagination.cursor_query_param in self.request.GET:
+                self._paginator = DataKeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_queryset(self):
         """
@@ -337,6 +373,11 @@ class APIStreamDataViewSet(viewsets.ModelViewSet):
         helper = StreamDataBuilderHelper()
         if many:
             count = 0
+            stream_slugs = set([item['stream_slug'] for item in serializer.validated_data])
+            # Resolve all permissions at once, and reject the whole batch before building any data point
+            if not helper.prefetch_write_access(stream_slugs, user=self.request.user):
+                raise PermissionDenied('User has no access to least some data points')
+            helper.prefetch_streams(stream_slugs)
             if not getattr(settings, 'USE_FIREHOSE'):
                 logger.debug('Using bulk-create (Production = {0})'.format(getattr(settings, 'PRODUCTION')))
                 for item in serializer.validated_data:
@@ -408,3 +449,41 @@ class APIStreamDataViewSet(viewsets.ModelViewSet):
     ])
     def list(self, request, *args, **kwargs):
         return super(APIStreamDataViewSet, self).list(request, args)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter(
+            name='filter', in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description="Use a device slug or stream slug to filter",
+            required=True
+        ),
+        openapi.Parameter(
+            name='output', in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description="ndjson (default), csv or msgpack"
+        ),
+        openapi.Parameter(
+            name='ordering', in_=openapi.IN_QUERY,
+            type=openapi.TYPE_STRING,
+            description="timestamp (default) or streamer_local_id"
+        ),
+    ])
+    @action(methods=['get'], detail=False)
+    def export(self, request, *args, **kwargs):
+        """
+        Stream all data matching the filters, as NDJSON, CSV or MessagePack (a stream of maps).
+        Rows are read with a server side cursor, so there is no limit on the number of rows.
+        Supports the same arguments as the list API (except for pagination)
+        """
+        output = request.GET.get('output', 'ndjson')
+        if output not in EXPORT_CONTENT_TYPES:
+            raise ValidationError('output must be one of: {}'.format(', '.join(sorted(EXPORT_CONTENT_TYPES.keys()))))
+        ordering = request.GET.get('ordering', DataKeysetPagination.ordering_fields[0])
+        if ordering not in DataKeysetPagination.ordering_fields:
+            raise ValidationError('ordering must be one of: {}'.format(', '.join(DataKeysetPagination.ordering_fields)))
+
+        qs = self.filter_queryset(self.get_queryset()).order_by(ordering, 'id')
+        names = [name for name, field in self.export_fields]
+        rows = qs.values_list(*[field for name, field in self.export_fields]).iterator(chunk_size=EXPORT_FETCH_SIZE)
+        filename = request.GET.get('filter', 'data')
+        return streaming_export_response(rows, names, output, filename=filename)
@@ -1,17 +1,21 @@
 import logging
 import struct
 
+import numpy as np
+
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
+from apps.org.models import Org
 from apps.physicaldevice.models import Device
 from apps.project.models import Project
-from apps.stream.models import StreamId
+from apps.stream.metadata import StreamMetadataResolver
 from apps.streamfilter.cache_utils import cached_serialized_filter_for_slug
 from apps.streamfilter.process import FilterHelper
+from apps.utils.aws.kinesis import firehose_timestamp
 from apps.utils.iotile.variable import ENCODED_STREAM_VALUES
 
 from .models import StreamData
-from .utils import get_stream_input_mdo, get_stream_mdo
 
 # Get an instance of a logger
 logger = logging.getLogger(__name__)
@@ -20,22 +24,34 @@ logger = logging.getLogger(__name__)
 class StreamDataBuilderHelper(object):
     _streams = {}
     _has_access = {}
+    _resolver = None
 
-    def __init__(self):
+    def __init__(self, resolver=None):
+        """
+        :param resolver: StreamMetadataResolver to share with other helpers (a new one is used by default)
+        """
         self._streams = {}
         self._has_access = {}
+        self._resolver = resolver or StreamMetadataResolver()
 
     def add_stream_to_cache(self, key, stream=None):
         if key not in self._streams:
-            if not stream:
-                try:
-                    stream = StreamId.objects.get(slug=key)
-                except StreamId.DoesNotExist:
-                    stream = None
+            if stream:
+                self._resolver.add_stream(stream)
+            else:
+                stream = self._resolver.get_stream(key)
 
             logger.info('>>> Adding stream for {}'.format(key))
             self._streams[key] = stream
 
+    def prefetch_streams(self, slugs):
+        """
+        Load all given streams with a single query, before building data for them
+
+        :param slugs: iterable of stream slugs
+        """
+        self._resolver.prefetch(slugs)
+
     def _cast(self, format, int_value):
         # We assume the streamer report parser is unpacking as Long
         # So, we can skip any processing if the stream value format is long
@@ -67,6 +83,31 @@ class StreamDataBuilderHelper(object):
         # We assume the data.int_value is always stored in unsigned long
         return self._cast(stream.raw_value_format, int_value)
 
+    def _cast_array(self, format, int_values):
+        """
+        Vectorized version of _cast for a numpy array of int64 values
+
+        :param format: struct format (e.g. '<L', '<l' or 'auto')
+        :param int_values: numpy array of int64 values
+        :return: numpy array of int64 values
+        """
+        if format == 'auto' or format == '<L':
+            values = int_values
+        elif format == '<l':
+            # Reinterpret the unsigned long as a signed long. Values that would not
+            # fit an unsigned long are kept as is (like _cast does on struct.error)
+            in_range = (int_values >= 0) & (int_values <= 0xffffffff)
+            signed = int_values.astype(np.uint32).view(np.int32).astype(np.int64)
+            values = np.where(in_range, signed, int_values)
+        else:
+            # Not a common format. Cast each distinct value once
+            unique_values, inverse = np.unique(int_values, return_inverse=True)
+            casted = np.array([self._cast(format, v) for v in unique_values.tolist()], dtype=np.int64)
+            values = casted[inverse]
+
+        # See _cast: ensure number fits within 31 bits
+        return np.clip(values, -0x7fffffff, 0x7fffffff)
+
     def add_stream(self, stream):
         self.add_stream_to_cache(stream.slug, stream)
 
@@ -106,12 +147,12 @@ class StreamDataBuilderHelper(object):
                     logger.debug('{0}::{1}:: Packet element  at {2}'.format(stream.slug, stream_data.incremental_id, stream_data.device_timestamp))
                     stream_data.type = 'P-E'
             else:
-                value = self._cast_stream_value(stream, int_value)
+                metadata = self._resolver.get(stream.slug)
+                value = self._cast(metadata.raw_value_format, int_value)
 
-                stream_mdo = get_stream_mdo(stream)
-                value = stream_mdo.compute(value)
+                value = metadata.stream_mdo.compute(value)
 
-                input_mdo = get_stream_input_mdo(stream)
+                input_mdo = metadata.input_mdo
 
                 if input_mdo:
                     stream_data.value = input_mdo.compute(value)
@@ -126,6 +167,42 @@ class StreamDataBuilderHelper(object):
 
         return stream_data
 
+    def convert_to_internal_values(self, stream_slug, int_values):
+        """
+        Vectorized version of convert_to_internal_value for a set of values of the same stream.
+        The stream casting format and MDOs are only computed once.
+
+        :param stream_slug: Stream slug for all values (must already be in the stream cache)
+        :param int_values: numpy array (or list) of raw int values
+        :return: tuple with a list of values and a list of types (None means keep model default)
+        """
+        stream = self._streams[stream_slug]
+        int_values = np.asarray(int_values, dtype=np.int64)
+        count = int_values.shape[0]
+
+        if not stream:
+            return int_values.astype(np.float64).tolist(), [None] * count
+
+        if stream.is_encoded > 0:
+            types = np.full(count, 'P-E', dtype=object)
+            types[int_values == ENCODED_STREAM_VALUES['BEGIN']] = 'P-0'
+            types[int_values == ENCODED_STREAM_VALUES['END']] = 'P-1'
+            return [None] * count, types.tolist()
+
+        metadata = self._resolver.get(stream.slug)
+        values = self._cast_array(metadata.raw_value_format, int_values)
+
+        values = metadata.stream_mdo.compute_array(values)
+
+        input_mdo = metadata.input_mdo
+        if input_mdo:
+            values = input_mdo.compute_array(values)
+            data_type = 'ITR'
+        else:
+            data_type = 'Num'
+
+        return values.tolist(), [data_type] * count
+
     @classmethod
     def get_firehose_payload(cls, stream_data):
         payload = {
@@ -136,7 +213,7 @@ class StreamDataBuilderHelper(object):
             'type': stream_data.type,
             'dirty_ts': stream_data.dirty_ts,
             'status': stream_data.status,
-            'timestamp': stream_data.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')
+            'timestamp': firehose_timestamp(stream_data.timestamp)
         }
         if stream_data.device_timestamp is not None:
             payload['device_timestamp'] = stream_data.device_timestamp
@@ -169,6 +246,45 @@ class StreamDataBuilderHelper(object):
         # self.log(stream_data)
         return stream_data
 
+    def build_data_obj_list(self, stream_slug, streamer_local_ids, device_timestamps, timestamps, int_values):
+        """
+        Columnar version of build_data_obj for a set of readings of the same stream.
+        Slugs are deduced, and the stream is looked up and converted, once for the whole set.
+
+        :param stream_slug: Stream slug shared by all readings
+        :param streamer_local_ids: list of incremental IDs
+        :param device_timestamps: list of device timestamps
+        :param timestamps: list of datetimes
+        :param int_values: list of raw int values
+        :return: list of StreamData objects
+        """
+        template = StreamData(stream_slug=stream_slug)
+        template.deduce_slugs_from_stream_id()
+
+        self.add_stream_to_cache(stream_slug)
+        values, types = self.convert_to_internal_values(stream_slug, int_values)
+        if not isinstance(int_values, list):
+            int_values = np.asarray(int_values).tolist()
+
+        entries = []
+        for i in range(len(values)):
+            stream_data = StreamData(
+                stream_slug=stream_slug,
+                project_slug=template.project_slug,
+                device_slug=template.device_slug,
+                variable_slug=template.variable_slug,
+                streamer_local_id=streamer_local_ids[i],
+                device_timestamp=device_timestamps[i],
+                timestamp=timestamps[i],
+                int_value=int_values[i],
+                value=values[i]
+            )
+            if types[i]:
+                stream_data.type = types[i]
+            entries.append(stream_data)
+
+        return entries
+
     def process_serializer_data(self, item, user_slug=None):
         # print('serializing: {}'.format(item))
         if not self.check_if_stream_is_enabled(item['stream_slug']):
@@ -213,6 +329,49 @@ class StreamDataBuilderHelper(object):
 
         return self._has_access[project_slug] and self._has_access[device_slug]
 
+    def prefetch_write_access(self, stream_slugs, user):
+        """
+        Bulk version of user_has_write_access, used before building a batch of data points:
+        resolve access for all projects and devices of the given streams with a constant
+        number of queries (instead of several queries per project and device)
+
+        :param stream_slugs: iterable of stream slugs
+        :param user: User object
+        :return: True if user has access to all streams
+        """
+        all_slugs = set()
+        project_slugs = set()
+        device_slugs = set()
+        for stream_slug in set(stream_slugs):
+            template = StreamData(stream_slug=stream_slug)
+            template.deduce_slugs_from_stream_id()
+            all_slugs.update([template.project_slug, template.device_slug])
+            if template.project_slug not in self._has_access:
+                project_slugs.add(template.project_slug)
+            if template.device_slug not in self._has_access:
+                if template.device_slug != 'd--0000-0000-0000-0000':
+                    device_slugs.add(template.device_slug)
+                else:
+                    self._has_access[template.device_slug] = True
+
+        org_ids = {}
+        if project_slugs:
+            org_ids.update(Project.objects.filter(slug__in=project_slugs).values_list('slug', 'org_id'))
+        if device_slugs:
+            org_ids.update(Device.objects.filter(slug__in=device_slugs).values_list('slug', 'org_id'))
+        for slug in project_slugs | device_slugs:
+            if slug not in org_ids:
+                # Same as user_has_write_access
+                raise Http404('No Project or Device matches {}'.format(slug))
+
+        allowed_org_ids = Org.objects.user_orgs_ids_with_permission(
+            user, org_ids.values(), 'can_create_stream_data'
+        )
+        for slug, org_id in org_ids.items():
+            self._has_access[slug] = org_id in allowed_org_ids
+
+        return all([self._has_access[slug] for slug in all_slugs])
+
     def process_stream_filters(self, data_entries, user):
         logger.info('Checking {} data entries for filters'.format(len(data_entries)))
 
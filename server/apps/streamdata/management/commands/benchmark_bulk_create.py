@@ -0,0 +1,82 @@
+import datetime
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.utils import timezone
+
+from apps.streamdata.models import StreamData
+from apps.streamtimeseries.models import StreamTimeSeriesValue
+from apps.utils.data_helpers.bulk_copy import copy_bulk_create, copy_is_supported
+
+logger = logging.getLogger(__name__)
+
+STREAM_SLUG = 's--0000-0fff--0000-0000-0000-0fff--5001'
+
+
+def _build_data(count):
+    ts = timezone.now()
+    return [
+        StreamData(
+            stream_slug=STREAM_SLUG, project_slug='p--0000-0fff', device_slug='d--0000-0000-0000-0fff',
+            variable_slug='v--0000-0fff--5001', timestamp=ts + datetime.timedelta(seconds=i),
+            device_timestamp=i, streamer_local_id=i + 1, int_value=i, value=float(i)
+        ) for i in range(count)
+    ]
+
+
+def _build_timeseries(count):
+    ts = timezone.now()
+    return [
+        StreamTimeSeriesValue(
+            stream_slug=STREAM_SLUG, project_id=0xfff, device_id=0xfff, block_id=0, variable_id=0x5001,
+            timestamp=ts + datetime.timedelta(seconds=i), device_timestamp=i, device_seqid=i + 1,
+            raw_value=i, value=float(i)
+        ) for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Compare ORM bulk_create with COPY FROM STDIN (all rows are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, dest='rows', default=12000,
+                            help='Number of rows to create on each run')
+        parser.add_argument('--repeat', type=int, dest='repeat', default=3,
+                            help='Number of runs for each method')
+        parser.add_argument('--model', dest='model', default='data', choices=['data', 'timeseries'],
+                            help='data: StreamData, timeseries: StreamTimeSeriesValue')
+
+    def _run(self, model, build, method, rows):
+        objs = build(rows)
+        using = router.db_for_write(model)
+        with transaction.atomic(using=using):
+            start = time.time()
+            if method == 'copy':
+                copy_bulk_create(model, objs)
+            else:
+                model.objects.bulk_create(objs)
+            elapsed = time.time() - start
+            transaction.set_rollback(True, using=using)
+        return elapsed
+
+    def handle(self, *args, **options):
+        if options['model'] == 'data':
+            model, build = StreamData, _build_data
+        else:
+            model, build = StreamTimeSeriesValue, _build_timeseries
+
+        methods = ['orm']
+        if copy_is_supported(model):
+            methods.append('copy')
+        else:
+            self.stdout.write('COPY is not supported by the {} database'.format(router.db_for_write(model)))
+
+        rows = options['rows']
+        for method in methods:
+            times = [self._run(model, build, method, rows) for _ in range(options['repeat'])]
+            best = min(times)
+            self.stdout.write('{0:>5}: {1} rows, best={2:.3f}s ({3:.0f} rows/s), avg={4:.3f}s'.format(
+                method, rows, best, rows / best if best else 0, sum(times) / len(times)
+            ))
@@ -3,8 +3,10 @@ import json
 import struct
 
 import dateutil.parser
+import numpy as np
 
 from django.contrib.auth import get_user_model
+from django.http import Http404
 from django.test import Client, TestCase
 from django.utils import timezone
 
@@ -15,6 +17,7 @@ from rest_framework.test import APITestCase
 from apps.devicetemplate.models import DeviceTemplate
 from apps.physicaldevice.models import Device
 from apps.stream.helpers import StreamDataDisplayHelper, StreamDataQueryHelper
+from apps.stream.metadata import StreamMetadata
 from apps.stream.models import CTYPE_TO_RAW_FORMAT, StreamId, StreamVariable
 from apps.streamfilter.models import *
 from apps.utils.gid.convert import *
@@ -98,6 +101,39 @@ class StreamDataBuilderHelperTestCase(TestMixin, TestCase):
         self.assertEqual(data.project_slug, '')
         self.assertEqual(data.variable_slug, 'v--0000-0000--5001')
 
+    def testPrefetchWriteAccess(self):
+        u2 = user_model.objects.create_user(username='User3', email='user3@foo.com', password='pass')
+        o2 = Org.objects.create_org(name='Org 2', created_by=u2)
+        p2 = Project.objects.create(name='Project 2', created_by=u2, org=o2)
+        d2 = Device.objects.create_device(id=0xb, project=self.p, label='d2', template=self.d.template, created_by=self.u)
+        d3 = Device.objects.create_device(id=0xc, project=p2, label='d3', template=self.d.template, created_by=u2)
+        slug1 = formatted_gsid(pid=self.p.formatted_gid, did=self.d.formatted_gid, vid='5001')
+        slug2 = formatted_gsid(pid=self.p.formatted_gid, did=d2.formatted_gid, vid='5001')
+        slug3 = formatted_gsid(pid=p2.formatted_gid, did=d3.formatted_gid, vid='5001')
+
+        helper = StreamDataBuilderHelper()
+        # Projects, Devices and Memberships
+        with self.assertNumQueries(3):
+            self.assertTrue(helper.prefetch_write_access([slug1, slug2, slug1], self.u))
+        with self.assertNumQueries(0):
+            for slug in [slug1, slug2]:
+                data = StreamData(stream_slug=slug)
+                data.deduce_slugs_from_stream_id()
+                self.assertTrue(helper.user_has_write_access(data, self.u))
+
+        # A single inaccessible device rejects the whole batch
+        with self.assertNumQueries(3):
+            self.assertFalse(helper.prefetch_write_access([slug1, slug2, slug3], self.u))
+        self.assertFalse(helper.prefetch_write_access([slug3, slug1], self.u))
+
+        helper = StreamDataBuilderHelper()
+        self.assertTrue(helper.prefetch_write_access([slug3], u2))
+        self.assertFalse(helper.prefetch_write_access([slug1], u2))
+
+        helper = StreamDataBuilderHelper()
+        with self.assertRaises(Http404):
+            helper.prefetch_write_access(['s--0000-0001--0000-0000-0000-0fff--5001'], self.u)
+
     def testBuildData(self):
         t0 = dateutil.parser.parse('2016-09-28T10:00:00Z')
         helper = StreamDataBuilderHelper()
@@ -295,6 +331,41 @@ class StreamDataBuilderHelperTestCase(TestMixin, TestCase):
         self.assertEqual(d4.int_value, 4)
         self.assertEqual(d4.value, 24.0)
 
+    def testCastArray(self):
+        helper = StreamDataBuilderHelper()
+        values = np.array([0, 5, 0xFFFFFFFB, 0xffffffff], dtype=np.int64)
+        for format in ['<l', '<L', 'auto']:
+            casted = helper._cast_array(format, values)
+            self.assertEqual(casted.tolist(), [helper._cast(format, v) for v in values.tolist()])
+
+    def testBuildDataObjList(self):
+        s = StreamId.objects.create(device=self.d, variable=self.v, project=self.p, created_by=self.u,
+                                    mdo_type='S', multiplication_factor=3, input_unit=self.input_unit1,
+                                    raw_value_format=CTYPE_TO_RAW_FORMAT['int'])
+        t0 = dateutil.parser.parse('2016-09-28T10:00:00Z')
+        t1 = dateutil.parser.parse('2016-09-28T10:01:00Z')
+        helper = StreamDataBuilderHelper()
+        entries = helper.build_data_obj_list(
+            stream_slug=s.slug,
+            streamer_local_ids=[1, 2],
+            device_timestamps=[0, 60],
+            timestamps=[t0, t1],
+            int_values=[5, 0xFFFFFFFB]
+        )
+        self.assertEqual(len(entries), 2)
+        for entry, int_value, ts in zip(entries, [5, 0xFFFFFFFB], [t0, t1]):
+            expected = helper.build_data_obj(stream_slug=s.slug, timestamp=ts, int_value=int_value)
+            self.assertEqual(entry.project_slug, self.p.slug)
+            self.assertEqual(entry.device_slug, self.d.slug)
+            self.assertEqual(entry.variable_slug, self.v.slug)
+            self.assertEqual(entry.timestamp, ts)
+            self.assertEqual(entry.int_value, int_value)
+            self.assertEqual(entry.type, expected.type)
+            self.assertEqual(entry.value, expected.value)
+        self.assertEqual(entries[0].streamer_local_id, 1)
+        self.assertEqual(entries[1].device_timestamp, 60)
+        self.assertEqual(entries[1].value, -7.5)
+
     def testFirehosePayload(self):
         s = StreamId.objects.create(device=self.d, variable=self.v, project=self.p, created_by=self.u)
         t0 = dateutil.parser.parse('2016-09-28T10:00:00Z')
@@ -339,6 +410,49 @@ class StreamDataBuilderHelperTestCase(TestMixin, TestCase):
         converted_value = helper.compute(value)
         self.assertEqual(helper.compute_reverse(converted_value), value)
 
+    def testMdoHelperArray(self):
+        import pandas as pd
+
+        helper = MdoHelper(2, 10, 5.0)
+        values = [0, 10, -3, 1234]
+        self.assertEqual(helper.compute_array(values).tolist(), [helper.compute(v) for v in values])
+        series = pd.Series(values, index=['a', 'b', 'c', 'd'])
+        computed = helper.compute_array(series)
+        self.assertEqual(list(computed.index), ['a', 'b', 'c', 'd'])
+        self.assertEqual(computed.tolist(), [helper.compute(v) for v in values])
+
+        mdo1 = MdoHelper(2, 10, 5.0)
+        mdo2 = MdoHelper(3, 7)
+        mdo3 = MdoHelper(-4, 6, 1.5)
+        composed = MdoHelper.chain(mdo1, None, mdo2, mdo3)
+        self.assertEqual(composed._m, -2)
+        self.assertEqual(composed._d, 35)
+        for value in values:
+            self.assertAlmostEqual(composed.compute(value), mdo3.compute(mdo2.compute(mdo1.compute(value))))
+        self.assertEqual(MdoHelper.chain().compute(7), 7.0)
+
+    def testGetStreamValueMdo(self):
+        output_unit = VarTypeOutputUnit.objects.create(
+            var_type=self.var_type,
+            unit_full='Gallons',
+            unit_short='g',
+            m=3,
+            d=11,
+            o=1.0,
+            created_by=self.u
+        )
+        s = StreamId.objects.create(device=self.d, variable=self.v, project=self.p, created_by=self.u,
+                                    mdo_type='S', multiplication_factor=3, input_unit=self.input_unit1,
+                                    output_unit=output_unit)
+        helper = StreamDataBuilderHelper()
+        helper.add_stream(s)
+        data = helper.build_data_obj(stream_slug=s.slug, timestamp=timezone.now(), int_value=5)
+        metadata = StreamMetadata(s)
+        self.assertAlmostEqual(metadata.get_value_mdo().compute(5), data.value)
+        self.assertAlmostEqual(
+            metadata.get_value_mdo(apply_output=True).compute(5), get_stream_output_mdo(s).compute(data.value)
+        )
+
     def testGetStreamMdo(self):
         s = StreamId.objects.create(device=self.d, variable=self.v, project=self.p, created_by=self.u)
         self.v.multiplication_factor = 5
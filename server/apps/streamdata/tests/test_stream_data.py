@@ -21,6 +21,7 @@ from apps.streamalias.models import StreamAlias, StreamAliasTap
 from apps.streamfilter.models import State, StateTransition, StreamFilter, StreamFilterAction, StreamFilterTrigger
 from apps.utils.data_mask.mask_utils import set_data_mask
 from apps.utils.mdo.helpers import MdoHelper
+from apps.utils.rest.streaming import streaming_export_response
 from apps.utils.test_util import TestMixin
 from apps.utils.timezone_utils import str_utc
 from apps.utils.utest.utils.alias_utils import TestStreamAliasHelper
@@ -82,6 +83,7 @@ class StreamDataAPITests(TestMixin, TestStreamAliasHelper, APITestCase):
             cache.clear()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamFilterAction.objects.all().delete()
         StreamFilterTrigger.objects.all().delete()
         StreamFilter.objects.all().delete()
@@ -670,6 +672,133 @@ class StreamDataAPITests(TestMixin, TestStreamAliasHelper, APITestCase):
 
         self.client.logout()
 
+    def testGetWithCursor(self):
+        url = reverse('streamdata-list')
+        base_ts = timezone.now()
+        for i in range(7):
+            StreamData.objects.create(
+                stream_slug=self.s1.slug,
+                type='Num',
+                # Two readings on each timestamp, to test the id tie breaker
+                timestamp=base_ts + datetime.timedelta(seconds=i // 2),
+                int_value=i,
+                streamer_local_id=100 - i
+            )
+        StreamData.objects.create(
+            stream_slug=self.s2.slug,
+            type='Num',
+            timestamp=base_ts,
+            int_value=50,
+            streamer_local_id=1
+        )
+
+        ok = self.client.login(email='user1@foo.com', password='pass')
+        self.assertTrue(ok)
+
+        values = []
+        next_url = url + '?staff=1&filter={}&page_size=3&cursor='.format(self.s1.slug)
+        pages = 0
+        while next_url:
+            response = self.client.get(next_url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            deserialized = json.loads(response.content.decode())
+            self.assertNotIn('count', deserialized)
+            self.assertTrue(len(deserialized['results']) <= 3)
+            values += [item['int_value'] for item in deserialized['results']]
+            next_url = deserialized['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(values, [0, 1, 2, 3, 4, 5, 6])
+
+        values = []
+        next_url = url + '?staff=1&filter={}&page_size=4&cursor=&ordering=streamer_local_id'.format(self.s1.slug)
+        while next_url:
+            response = self.client.get(next_url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            deserialized = json.loads(response.content.decode())
+            values += [item['int_value'] for item in deserialized['results']]
+            next_url = deserialized['next']
+        self.assertEqual(values, [6, 5, 4, 3, 2, 1, 0])
+
+        response = self.client.get(url + '?staff=1&filter={}&cursor=&ordering=value'.format(self.s1.slug), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url + '?staff=1&filter={}&cursor=bad'.format(self.s1.slug), format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # Cursor also works with lastn
+        response = self.client.get(url + '?staff=1&filter={}&lastn=2&cursor='.format(self.s1.slug), format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        deserialized = json.loads(response.content.decode())
+        self.assertEqual([item['int_value'] for item in deserialized['results']], [5, 6])
+        self.assertIsNone(deserialized['next'])
+
+        self.client.logout()
+
+    def testExport(self):
+        url = reverse('streamdata-export')
+        base_ts = timezone.now()
+        for i in range(5):
+            StreamData.objects.create(
+                stream_slug=self.s1.slug,
+                type='Num',
+                timestamp=base_ts + datetime.timedelta(seconds=i),
+                int_value=i,
+                streamer_local_id=i + 1
+            )
+
+        response = self.client.get(url + '?filter={}'.format(self.s1.slug))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        ok = self.client.login(email='user1@foo.com', password='pass')
+        self.assertTrue(ok)
+
+        response = self.client.get(url + '?staff=1&filter={}'.format(self.s1.slug))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="{}.ndjson"'.format(self.s1.slug))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual([row['int_value'] for row in rows], [0, 1, 2, 3, 4])
+        self.assertEqual(rows[0]['stream'], self.s1.slug)
+        self.assertEqual(rows[0]['timestamp'], str_utc(base_ts))
+
+        response = self.client.get(url + '?staff=1&filter={}&output=csv&start={}'.format(
+            self.s1.slug, str_utc(base_ts + datetime.timedelta(seconds=2))
+        ))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        reader = csv.DictReader(StringIO(b''.join(response.streaming_content).decode()))
+        rows = list(reader)
+        self.assertEqual([row['int_value'] for row in rows], ['2', '3', '4'])
+
+        response = self.client.get(url + '?staff=1&filter={}&output=msgpack'.format(self.s1.slug))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        import msgpack
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(b''.join(response.streaming_content))
+        self.assertEqual([row['streamer_local_id'] for row in unpacker], [1, 2, 3, 4, 5])
+
+        response = self.client.get(url + '?staff=1&filter={}&output=xml'.format(self.s1.slug))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # The filter is only used in the attachment filename after being sanitized
+        response = streaming_export_response([], [], 'csv', filename='a"b\r\nc')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="abc.csv"')
+        response = streaming_export_response([], [], 'csv', filename='"')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="data.csv"')
+
+        self.client.logout()
+
+        ok = self.client.login(email='user3@foo.com', password='pass')
+        self.assertTrue(ok)
+
+        response = self.client.get(url + '?filter={}'.format(self.s1.slug))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+        self.client.logout()
+
     def testGetWithFilter(self):
         url = reverse('streamdata-list')
 
@@ -0,0 +1,280 @@
+"""
+Streamer ingest benchmark: runs synthetic reports through the report parser and the
+report processing engines, and measures throughput, peak memory and query counts.
+
+Meant to run against a local database and cache (e.g. docker-compose), with
+    python manage.py streamer-benchmark
+All fixtures and processed data are rolled back after every run.
+"""
+import datetime
+import io
+import json
+import logging
+import time
+import tracemalloc
+import uuid
+from contextlib import ExitStack
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Max
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from apps.devicetemplate.models import DeviceTemplate
+from apps.org.models import Org
+from apps.physicaldevice.models import Device
+from apps.project.models import Project
+from apps.sqsworker.action import Action
+from apps.stream.models import StreamId, StreamVariable
+from apps.streamer.models import Streamer, StreamerReport
+from apps.streamer.report.generator import SyntheticReport
+from apps.streamer.report.parser import ReportParser
+from apps.utils.iotile.streamer import STREAMER_SELECTOR
+from apps.vartype.models import VarType, VarTypeDecoder
+
+from .worker.v2_bin.handle_chopped_report import HandleChoppedReportV2Action
+from .worker.v2_bin.process_report import ProcessReportV2Action
+from .worker.v2_json.process_report import ProcessReportV2JsonAction
+
+user_model = get_user_model()
+logger = logging.getLogger(__name__)
+
+BENCHMARK_SCENARIOS = ['parse', 'v2_bin', 'v2_json', 'v2_mp', 'chopped']
+JSON_STREAMER_INDEX = 100
+
+
+class StreamerIngestBenchmark(object):
+    """
+    Each scenario is run `repeat` times, and the best (fastest) run is reported
+    """
+    _options = {}
+    _fixtures = {}
+
+    def __init__(self, num_readings=1000, stream_count=4, reboot_every=0, encoded_ratio=0.0, repeat=3, seed=0):
+        self._options = {
+            'num_readings': num_readings,
+            'stream_count': stream_count,
+            'reboot_every': reboot_every,
+            'encoded_ratio': encoded_ratio,
+            'seed': seed,
+        }
+        self._repeat = repeat
+        self._fixtures = {}
+
+    def _build_report(self, dev_id, **kwargs):
+        options = dict(self._options)
+        options.update(kwargs)
+        return SyntheticReport(dev_id, **options)
+
+    def _setup_fixtures(self, report):
+        """
+        Create a user, org, project and device with a stream for every stream in the report.
+        Called within the (rolled back) run transaction
+        """
+        user = user_model.objects.create_user(
+            username='benchmark-{}'.format(uuid.uuid4().hex[:8]), email='benchmark@example.com', password=None
+        )
+        org = Org.objects.create_org(name='Benchmark {}'.format(user.username), created_by=user)
+        project = Project.objects.create(name='Benchmark', created_by=user, org=org)
+        template = DeviceTemplate.objects.create(
+            external_sku='Benchmark', org=org, released_on=datetime.datetime.utcnow(), created_by=user
+        )
+        dev_id = (Device.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+        device = Device.objects.create_device(
+            id=dev_id, project=project, label='Benchmark', template=template, created_by=user
+        )
+        for lid in report.user_lids:
+            variable = StreamVariable.objects.create_variable(
+                name='Var {:04x}'.format(lid), project=project, created_by=user, lid=lid
+            )
+            StreamId.objects.create_stream(project=project, variable=variable, device=device, created_by=user)
+
+        var_type = VarType.objects.create(
+            name='Benchmark Encoded', storage_units_full='Encoded', is_encoded=True, created_by=user
+        )
+        VarTypeDecoder.objects.create(
+            var_type=var_type, created_by=user, raw_packet_format='<' + 'L' * report.packet_size,
+            packet_info={'decoding': ['L{{v{}}}'.format(i) for i in range(report.packet_size)]}
+        )
+        variable = StreamVariable.objects.create_variable(
+            name='Encoded', project=project, created_by=user, lid=report.encoded_lid, var_type=var_type
+        )
+        StreamId.objects.create_stream(
+            project=project, variable=variable, device=device, created_by=user, var_type=var_type
+        )
+
+        bin_streamer = Streamer.objects.create(
+            device=device, index=0, created_by=user, selector=STREAMER_SELECTOR['USER'], process_engine_ver=2
+        )
+        json_streamer = Streamer.objects.create(
+            device=device, index=JSON_STREAMER_INDEX, created_by=user,
+            selector=STREAMER_SELECTOR['VIRTUAL1'], process_engine_ver=2
+        )
+        self._fixtures = {
+            'user': user,
+            'device': device,
+            'bin_streamer': bin_streamer,
+            'json_streamer': json_streamer,
+        }
+
+    def _create_streamer_report(self, streamer, report, received_dt):
+        return StreamerReport.objects.create(
+            streamer=streamer,
+            sent_timestamp=received_dt,
+            device_sent_timestamp=report.device_sent_timestamp,
+            incremental_id=report.rpt_id,
+            created_by=self._fixtures['user']
+        )
+
+    def _process_bin(self, report, received_dt):
+        action = ProcessReportV2Action()
+        action._fp = io.BytesIO(report.to_bin())
+        action._decoded_key = 'benchmark/{}.bin'.format(uuid.uuid4())
+        action._received_dt = received_dt
+        action._streamer_report = self._create_streamer_report(self._fixtures['bin_streamer'], report, received_dt)
+        action._user = self._fixtures['user']
+        action.process()
+        return action
+
+    def _process_json(self, report, received_dt, ext):
+        base_dt = received_dt - datetime.timedelta(seconds=report.device_sent_timestamp)
+        action = ProcessReportV2JsonAction()
+        action._fp = io.BytesIO(report.to_json(base_dt) if ext == '.json' else report.to_msgpack(base_dt))
+        action._decoded_key = 'benchmark/{0}{1}'.format(uuid.uuid4(), ext)
+        action._received_dt = received_dt
+        action._streamer_report = self._create_streamer_report(self._fixtures['json_streamer'], report, received_dt)
+        action._user = self._fixtures['user']
+        action.process()
+        return action
+
+    def _run_scenario(self, scenario, trace_memory=False):
+        """
+        Run a scenario once, within a transaction (on every database) that is always rolled back
+
+        :param trace_memory: If True, also trace the (Python) memory allocated by the scenario.
+                             Tracing slows everything down, so the timing of these runs is not meaningful
+        :return: dict with the number of readings, seconds, number of queries and peak memory (MB, or None)
+        """
+        received_dt = timezone.now()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(transaction.atomic(using=alias))
+            # Follow-up actions (forwarding, chopped report fixups, etc.) are not part of the ingest path
+            stack.enter_context(mock.patch.object(Action, '_schedule'))
+
+            report = self._build_report(0)
+            self._setup_fixtures(report)
+            dev_id = self._fixtures['device'].id
+            report = self._build_report(dev_id)
+            if scenario == 'chopped':
+                # The first report is chopped, and the second (follow up) report has a reboot
+                first = report
+                self._process_bin(first, received_dt)
+                second = self._build_report(dev_id, first_id=first.highest_id + 1, reboot_every=1, num_readings=2)
+                self._process_bin(second, received_dt + datetime.timedelta(seconds=60))
+                streamer_report = StreamerReport.objects.filter(
+                    streamer=self._fixtures['bin_streamer'], incremental_id=first.rpt_id
+                ).first()
+
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            if trace_memory:
+                tracemalloc.start()
+                stack.callback(tracemalloc.stop)
+            start = time.perf_counter()
+            if scenario == 'parse':
+                fp = io.BytesIO(report.to_bin())
+                parser = ReportParser()
+                parser.parse_header(fp)
+                parser.parse_footer(fp)
+                parser.check_report_hash(fp)
+                parser.parse_readings_array(fp)
+            elif scenario == 'v2_bin':
+                self._process_bin(report, received_dt)
+            elif scenario == 'v2_json':
+                self._process_json(report, received_dt, '.json')
+            elif scenario == 'v2_mp':
+                self._process_json(report, received_dt, '.mp')
+            elif scenario == 'chopped':
+                HandleChoppedReportV2Action().execute({'rpt': str(streamer_report.id), 'attempt_count': 1})
+            else:
+                raise ValueError('Unknown scenario: {}'.format(scenario))
+            seconds = time.perf_counter() - start
+            peak_mb = None
+            if trace_memory:
+                peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            queries = sum([len(capture.captured_queries) for capture in captures])
+
+            for alias in connections:
+                transaction.set_rollback(True, using=alias)
+
+        return {
+            'readings': len(report.readings),
+            'seconds': seconds,
+            'queries': queries,
+            'peak_mb': peak_mb,
+        }
+
+    def run(self, scenarios=None):
+        """
+        :param scenarios: list of scenario names (all by default)
+        :return: dict of {scenario: {readings, seconds, readings_per_sec, queries, peak_mb}}
+        """
+        results = {}
+        for scenario in scenarios or BENCHMARK_SCENARIOS:
+            best = None
+            for i in range(self._repeat):
+                result = self._run_scenario(scenario)
+                if best is None or result['seconds'] < best['seconds']:
+                    best = result
+            best['readings_per_sec'] = best['readings'] / best['seconds'] if best['seconds'] else 0
+            # Peak memory allocated by the scenario itself, from an extra (untimed) run
+            best['peak_mb'] = self._run_scenario(scenario, trace_memory=True)['peak_mb']
+            logger.info('{0}: {1}'.format(scenario, best))
+            results[scenario] = best
+        return {
+            'options': self._options,
+            'results': results,
+        }
+
+
+def compare_with_baseline(results, baseline, max_regression=0.1):
+    """
+    Compare benchmark results with stored (baseline) results
+
+    :param results: Results from StreamerIngestBenchmark.run()
+    :param baseline: Results from a previous StreamerIngestBenchmark.run()
+    :param max_regression: Max allowed throughput loss (0.1 = 10%)
+    :return: (list of report lines, list of regressed scenarios)
+    """
+    lines = []
+    regressions = []
+    if baseline.get('options') != results.get('options'):
+        lines.append('WARNING: Baseline was generated with different options: {}'.format(baseline.get('options')))
+
+    for scenario, result in results['results'].items():
+        if scenario not in baseline['results']:
+            lines.append('{0}: not in baseline'.format(scenario))
+            continue
+        base = baseline['results'][scenario]
+        change = 0.0
+        if base['readings_per_sec']:
+            change = (result['readings_per_sec'] - base['readings_per_sec']) / base['readings_per_sec']
+        lines.append('{0}: {1:.0f} readings/sec ({2:+.1%}), queries {3} -> {4}, peak memory {5:.1f}MB'.format(
+            scenario, result['readings_per_sec'], change, base['queries'], result['queries'], result['peak_mb']
+        ))
+        if change < -max_regression or result['queries'] > base['queries']:
+            regressions.append(scenario)
+
+    return lines, regressions
+
+
+def load_baseline(path):
+    with open(path) as fp:
+        return json.load(fp)
+
+
+def save_baseline(path, results):
+    with open(path, 'w') as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.streamer.benchmark import (
+    BENCHMARK_SCENARIOS, StreamerIngestBenchmark, compare_with_baseline, load_baseline, save_baseline
+)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the streamer report ingest path with synthetic reports (all data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readings', type=int, dest='readings', default=1000,
+                            help='Number of readings per report')
+        parser.add_argument('--streams', type=int, dest='streams', default=4,
+                            help='Number of user streams')
+        parser.add_argument('--reboot-every', type=int, dest='reboot_every', default=0,
+                            help='Add a reboot every N readings (0 for none)')
+        parser.add_argument('--encoded-ratio', type=float, dest='encoded_ratio', default=0.0,
+                            help='Fraction of readings that are part of encoded stream packets')
+        parser.add_argument('--repeat', type=int, dest='repeat', default=3,
+                            help='Number of runs per scenario (best is reported)')
+        parser.add_argument('--seed', type=int, dest='seed', default=0,
+                            help='Random seed for the synthetic reports')
+        parser.add_argument('--scenarios', type=str, dest='scenarios', default=','.join(BENCHMARK_SCENARIOS),
+                            help='Comma separated list of: {}'.format(', '.join(BENCHMARK_SCENARIOS)))
+        parser.add_argument('--baseline', type=str, dest='baseline', default=None,
+                            help='JSON file with results to compare with')
+        parser.add_argument('--save-baseline', type=str, dest='save_baseline', default=None,
+                            help='Write results to this JSON file')
+        parser.add_argument('--max-regression', type=float, dest='max_regression', default=0.1,
+                            help='Max allowed throughput loss vs the baseline (0.1 = 10%%)')
+
+    def handle(self, *args, **options):
+        scenarios = [s.strip() for s in options['scenarios'].split(',') if s.strip()]
+        for scenario in scenarios:
+            if scenario not in BENCHMARK_SCENARIOS:
+                raise CommandError('Unknown scenario: {}'.format(scenario))
+
+        benchmark = StreamerIngestBenchmark(
+            num_readings=options['readings'],
+            stream_count=options['streams'],
+            reboot_every=options['reboot_every'],
+            encoded_ratio=options['encoded_ratio'],
+            repeat=options['repeat'],
+            seed=options['seed']
+        )
+        results = benchmark.run(scenarios)
+        self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results)
+            self.stdout.write('Saved results to {}'.format(options['save_baseline']))
+
+        if options['baseline']:
+            lines, regressions = compare_with_baseline(
+                results, load_baseline(options['baseline']), options['max_regression']
+            )
+            for line in lines:
+                self.stdout.write(line)
+            if regressions:
+                raise CommandError('Performance regression in: {}'.format(', '.join(regressions)))
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('streamer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='streamer',
+            name='last_reboot_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='streamer',
+            name='last_base_ts',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='streamer',
+            name='reboot_history_scanned',
+            field=models.BooleanField(default=False),
+        ),
+    ]
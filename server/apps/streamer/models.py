@@ -53,6 +53,15 @@ class Streamer(models.Model):
     # Store the last known reboot time
     last_reboot_ts = models.DateTimeField(null=True, blank=True)
 
+    # Time-base state, updated with last_id every time a report is committed, so reports
+    # can be processed without looking at the data (or reports) history:
+    # - last_reboot_id: streamer_local_id of the last known device reboot (0 if unknown)
+    # - last_base_ts: base timestamp (sent_timestamp - device_sent_timestamp) of the last report
+    # - reboot_history_scanned: the data history was already scanned for reboots (even if none was found)
+    last_reboot_id = models.BigIntegerField(default=0)
+    last_base_ts = models.DateTimeField(null=True, blank=True)
+    reboot_history_scanned = models.BooleanField(default=False)
+
     # TODO: Remove once all streamers have been updated with new selector field
     #      Main reason not to do it now is that most test use bad report files with incorrect selectors
     #      so we will need to regenerate all the reports
@@ -0,0 +1,192 @@
+"""
+Synthetic Streamer Reports, used to benchmark (and test) the report processing engines.
+Reports are fully deterministic for a given configuration (including the seed)
+"""
+import datetime
+import hashlib
+import json
+import random
+import struct
+
+import msgpack
+
+from apps.utils.iotile.streamer import STREAMER_SELECTOR
+from apps.utils.iotile.variable import ENCODED_STREAM_VALUES, SYSTEM_VID
+from apps.utils.timezone_utils import str_utc
+
+from .parser import FOOTER_LENGTH, HEADER_LENGTH, READINGS_LENGTH
+
+REBOOT_LID = int(SYSTEM_VID['REBOOT'], 16)
+DEFAULT_FIRST_USER_LID = 0x5001
+DEFAULT_ENCODED_LID = 0x5020
+# Number of (4 byte) values in every encoded packet, between the BEGIN and END markers
+DEFAULT_PACKET_SIZE = 4
+
+
+class SyntheticReport(object):
+    """
+    Sequence of readings for a single device streamer, which can be rendered as a
+    V2 binary report (.bin) or as a JSON (.json) or MessagePack (.mp) report
+
+    Readings are (lid, streamer_local_id, device_timestamp, value) tuples
+    """
+    dev_id = None
+    rpt_id = None
+    streamer_index = 0
+    streamer_selector = None
+    device_sent_timestamp = 0
+    readings = []
+
+    def __init__(self, dev_id, num_readings=1000, stream_count=4, reboot_every=0, encoded_ratio=0.0,
+                 first_id=1, rpt_id=None, streamer_index=0, streamer_selector=STREAMER_SELECTOR['USER'],
+                 interval=10, first_lid=DEFAULT_FIRST_USER_LID, encoded_lid=DEFAULT_ENCODED_LID,
+                 packet_size=DEFAULT_PACKET_SIZE, seed=0):
+        """
+        :param dev_id: Device ID (int)
+        :param num_readings: Approximate number of readings (packets are never split)
+        :param stream_count: Number of user streams (lids first_lid, first_lid + 1, ...)
+        :param reboot_every: Add a reboot every N readings (0 for no reboots)
+        :param encoded_ratio: Fraction (0 to 1) of readings that are part of encoded packets
+        :param first_id: streamer_local_id of the first reading
+        :param rpt_id: Report incremental ID (defaults to the last streamer_local_id)
+        :param interval: Seconds between readings
+        :param seed: Random seed used for values and for the stream/packet mix
+        """
+        assert stream_count > 0
+        assert 0.0 <= encoded_ratio <= 1.0
+        self.dev_id = dev_id
+        self.streamer_index = streamer_index
+        self.streamer_selector = streamer_selector
+        self._num_readings = num_readings
+        self._stream_count = stream_count
+        self._reboot_every = reboot_every
+        self._encoded_ratio = encoded_ratio
+        self._first_id = first_id
+        self._interval = interval
+        self._first_lid = first_lid
+        self._encoded_lid = encoded_lid
+        self._packet_size = packet_size
+        self._random = random.Random(seed)
+        self.readings = self._build_readings()
+        self.rpt_id = rpt_id if rpt_id is not None else self.highest_id
+        self.device_sent_timestamp = self.readings[-1][2] + self._interval if self.readings else 0
+
+    def _build_readings(self):
+        readings = []
+        seq_id = self._first_id
+        device_timestamp = 0
+        since_reboot = 0
+        while len(readings) < self._num_readings:
+            if self._reboot_every and since_reboot >= self._reboot_every:
+                # The device timestamp starts again after every reboot
+                device_timestamp = 0
+                since_reboot = 0
+                readings.append((REBOOT_LID, seq_id, device_timestamp, 1))
+                seq_id += 1
+                continue
+
+            if self._encoded_ratio and self._random.random() < self._encoded_ratio:
+                values = [ENCODED_STREAM_VALUES['BEGIN']]
+                values += [self._random.randint(0, 0xFFFF) for i in range(self._packet_size)]
+                values.append(ENCODED_STREAM_VALUES['END'])
+                for value in values:
+                    readings.append((self._encoded_lid, seq_id, device_timestamp, value))
+                    seq_id += 1
+                since_reboot += len(values)
+            else:
+                lid = self._first_lid + self._random.randrange(self._stream_count)
+                readings.append((lid, seq_id, device_timestamp, self._random.randint(0, 1000)))
+                seq_id += 1
+                since_reboot += 1
+            device_timestamp += self._interval
+
+        return readings
+
+    @property
+    def lowest_id(self):
+        return self.readings[0][1] if self.readings else 0
+
+    @property
+    def highest_id(self):
+        return self.readings[-1][1] if self.readings else 0
+
+    @property
+    def user_lids(self):
+        return [self._first_lid + i for i in range(self._stream_count)]
+
+    @property
+    def encoded_lid(self):
+        return self._encoded_lid
+
+    @property
+    def packet_size(self):
+        return self._packet_size
+
+    def to_bin(self):
+        """
+        :return: bytes with a V2 binary report, with a valid (SHA-256-128) hash
+        """
+        length = HEADER_LENGTH + len(self.readings) * READINGS_LENGTH + FOOTER_LENGTH
+        header = struct.pack(
+            '<BBHLLLBBH', 1, length & 0xFF, length >> 8, self.dev_id, self.rpt_id,
+            self.device_sent_timestamp, 0, self.streamer_index, self.streamer_selector
+        )
+        body = b''.join([
+            struct.pack('<HHLLL', lid, 0, seq_id, device_timestamp, value)
+            for lid, seq_id, device_timestamp, value in self.readings
+        ])
+        hashed_component = header + body + struct.pack('<LL', self.lowest_id, self.highest_id)
+        return hashed_component + hashlib.sha256(hashed_component).digest()[:16]
+
+    def to_dict(self, base_dt):
+        """
+        JSON (V2) report, with every encoded packet as an event, and reboots removed
+
+        :param base_dt: datetime of device_timestamp 0, used to compute the reading timestamps
+        :return: dict, as expected by StreamerReportJsonPostSerializer
+        """
+        data = []
+        events = []
+        packet = None
+        for lid, seq_id, device_timestamp, value in self.readings:
+            timestamp = str_utc(base_dt + datetime.timedelta(seconds=device_timestamp))
+            if lid == REBOOT_LID:
+                continue
+            if lid == self._encoded_lid:
+                if value == ENCODED_STREAM_VALUES['BEGIN']:
+                    packet = {
+                        'stream': '{:04x}'.format(lid),
+                        'timestamp': timestamp,
+                        'streamer_local_id': seq_id,
+                        'extra_data': {}
+                    }
+                elif value == ENCODED_STREAM_VALUES['END']:
+                    events.append(packet)
+                else:
+                    packet['extra_data']['v{}'.format(len(packet['extra_data']))] = value
+            else:
+                data.append({
+                    'stream': '{:04x}'.format(lid),
+                    'timestamp': timestamp,
+                    'streamer_local_id': seq_id,
+                    'value': value
+                })
+
+        return {
+            'format': 'v100',
+            'device': self.dev_id,
+            'streamer_index': self.streamer_index,
+            'streamer_selector': self.streamer_selector,
+            'device_sent_timestamp': self.device_sent_timestamp,
+            'incremental_id': self.rpt_id,
+            'lowest_id': self.lowest_id,
+            'highest_id': self.highest_id,
+            'events': events,
+            'data': data,
+        }
+
+    def to_json(self, base_dt):
+        return json.dumps(self.to_dict(base_dt)).encode('utf-8')
+
+    def to_msgpack(self, base_dt):
+        return msgpack.packb(self.to_dict(base_dt))
@@ -1,9 +1,12 @@
 import hashlib
 import hmac
 import logging
+import mmap
 import os
 import struct
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 # Current Max Size of report (before the mobile is upgraded to send larger sizes)
@@ -79,6 +82,16 @@ READINGS_FORMAT = [
     },
 ]
 
+# Same layout as READINGS_FORMAT, used to decode all readings in a single pass
+READINGS_DTYPE = np.dtype([
+    ('stream', '<u2'),
+    ('_', '<u2'),
+    ('id', '<u4'),
+    ('timestamp', '<u4'),
+    ('value', '<u4'),
+])
+assert READINGS_DTYPE.itemsize == READINGS_LENGTH
+
 
 """Footer Format"""
 # lowest_id, highest_id, signature = unpack("<LL16s", footer)
@@ -113,12 +126,14 @@ class ReportParser(object):
     footer = {}
     length = 0
     data = []
+    readings = None
 
     def __init__(self):
         self.length = 0
         self.header = {}
         self.footer = {}
         self.data = []
+        self.readings = None
 
     def _unpack(self, format, raw):
         result = {}
@@ -173,6 +188,49 @@ class ReportParser(object):
             logger.error(msg)
             raise ParseReportException(msg)
 
+    def parse_readings_array(self, fp):
+        """Vectorized alternative to parse_readings
+
+        Reads the whole readings section with a single read and decodes it as a
+        structured numpy array (READINGS_DTYPE) without building a dict per reading.
+        The array is a read-only view over the bytes read from the file
+        (or over the file itself, if fp is a mmap).
+        Columns are accessed as self.readings['stream'], self.readings['id'],
+        self.readings['timestamp'] and self.readings['value'].
+        self.data is left untouched.
+
+        Params:
+            fp File Pointer as a opened stream
+        """
+        if self.expected_count is None or self.expected_count < 0:
+            raise ParseReportException('Invalid expected_count={0}'.format(self.expected_count))
+
+        size = self.expected_count * READINGS_LENGTH
+        if isinstance(fp, mmap.mmap) and len(fp) >= HEADER_LENGTH + size:
+            # Zero copy: decode the readings in place
+            self.readings = np.frombuffer(fp, dtype=READINGS_DTYPE, count=self.expected_count, offset=HEADER_LENGTH)
+            return
+
+        fp.seek(HEADER_LENGTH)
+        raw = fp.read(size)
+        if len(raw) != size:
+            msg = 'len(data)={0}, expected={1}'.format(len(raw) // READINGS_LENGTH, self.expected_count)
+            logger.error(msg)
+            raise ParseReportException(msg)
+
+        self.readings = np.frombuffer(raw, dtype=READINGS_DTYPE, count=self.expected_count)
+
+    def get_column(self, label):
+        """
+        Return one column of the readings parsed with parse_readings_array
+
+        :param label: One of 'stream', 'id', 'timestamp' or 'value'
+        :return: numpy array view over the parsed readings
+        """
+        if self.readings is None:
+            raise ParseReportException('Readings have not been parsed with parse_readings_array')
+        return self.readings[label]
+
     def check_report_hash(self, fp):
         """Calculate the expected hash for a report and make sure it matches what's in the footer
 
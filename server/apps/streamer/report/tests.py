@@ -1,3 +1,4 @@
+import io
 import os
 import struct
 
@@ -5,7 +6,8 @@ from django.test import TestCase
 
 from ..models import *
 from ..serializers import *
-from .parser import READINGS_FORMAT, ReportParser
+from .generator import REBOOT_LID, SyntheticReport
+from .parser import READINGS_FORMAT, ParseReportException, ReportParser
 
 
 class StreamerReportParsingTestCase(TestCase):
@@ -107,5 +109,49 @@ class StreamerReportParsingTestCase(TestCase):
             self.assertEqual(rp.footer['highest_id'], 14382)
             self.assertTrue(rp.chopped_off())
 
+    def testParseReadingsArray(self):
+        test_filename = self._full_path('valid_16_readings.bin')
+
+        with open(test_filename, 'rb') as fp:
+            rp = ReportParser()
+            rp.parse_header(fp)
+            rp.parse_footer(fp)
+            rp.parse_readings_array(fp)
+            self.assertEqual(rp.readings.shape[0], 16)
+            self.assertEqual(rp.data, [])
+
+            rp.parse_readings(fp)
+            self.assertEqual(list(rp.get_column('id')), [item['id'] for item in rp.data])
+            self.assertEqual(list(rp.get_column('stream')), [item['stream'] for item in rp.data])
+            self.assertEqual(list(rp.get_column('timestamp')), [item['timestamp'] for item in rp.data])
+            self.assertEqual(list(rp.get_column('value')), [item['value'] for item in rp.data])
 
+    def testParseReadingsArrayTooShort(self):
+        test_filename = self._full_path('valid_16_readings.bin')
 
+        with open(test_filename, 'rb') as fp:
+            rp = ReportParser()
+            rp.parse_header(fp)
+            rp.expected_count += 100
+            with self.assertRaises(ParseReportException):
+                rp.parse_readings_array(fp)
+
+    def testSyntheticReport(self):
+        report = SyntheticReport(0x10a, num_readings=100, stream_count=3, reboot_every=20, encoded_ratio=0.2, seed=1)
+        fp = io.BytesIO(report.to_bin())
+        rp = ReportParser()
+        rp.parse_header(fp)
+        self.assertEqual(rp.header['dev_id'], 0x10a)
+        self.assertEqual(rp.expected_count, len(report.readings))
+        rp.parse_footer(fp)
+        self.assertEqual(rp.footer['lowest_id'], report.lowest_id)
+        self.assertEqual(rp.footer['highest_id'], report.highest_id)
+        self.assertTrue(rp.check_report_hash(fp))
+        rp.parse_readings_array(fp)
+        reboots = [r for r in report.readings if r[0] == REBOOT_LID]
+        self.assertTrue(len(reboots) > 0)
+        self.assertEqual(list(rp.get_column('stream')).count(REBOOT_LID), len(reboots))
+
+        # Same seed, same report
+        same = SyntheticReport(0x10a, num_readings=100, stream_count=3, reboot_every=20, encoded_ratio=0.2, seed=1)
+        self.assertEqual(same.to_bin(), report.to_bin())
@@ -1,28 +1,34 @@
 import datetime
 import logging
 import os
+from contextlib import nullcontext
 from urllib import parse
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import DatabaseError, InterfaceError
+from django.db.models import Max
 from django.utils.dateparse import parse_datetime
 
 from apps.physicaldevice.models import Device
 from apps.sqsworker.action import Action
 from apps.sqsworker.exceptions import *
+from apps.sqsworker.profiler import StageProfiler
 from apps.streamdata.helpers import StreamDataBuilderHelper
 from apps.streamdata.models import get_timestamp_from_utc_device_timestamp
 from apps.streamer.models import Streamer, StreamerReport
 from apps.streamer.report.parser import ParseReportException
 from apps.utils.aws.s3 import download_file_from_s3, get_s3_metadata
+from apps.utils.aws.s3_cache import get_report_file_cache
 from apps.utils.aws.sns import sns_staff_notification
 from apps.utils.data_helpers.manager import DataManager
+from apps.utils.dynamic_loading import str_to_class
 from apps.utils.gid.convert import formatted_gdid, formatted_gsid, get_vid_from_gvid, int2did, int2vid
 from apps.utils.iotile.streamer import STREAMER_SELECTOR
 from apps.utils.iotile.variable import *
 
 from .types import ENGINE_TYPES
-from .worker_throtle import WorkerThrotle
+from .streamer_lease import WAIT_NOTIFY_ATTEMPTS, WAIT_RETRY_DELAY, StreamerLease
 
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL')
 user_model = get_user_model()
@@ -72,6 +78,16 @@ class ProcessReportBaseAction(Action):
     _actual_last_id = None
     _chopped_report = False
     _decoded_key = ''
+    # If True, readings are parsed into a columnar numpy array (parser.readings)
+    # instead of a list of dicts (parser.data)
+    _columnar_readings = False
+    # StageProfiler for the report being processed (only set for reports downloaded from S3)
+    _profiler = None
+
+    def _profile_stage(self, name):
+        if self._profiler:
+            return self._profiler.stage(name)
+        return nullcontext()
 
     def _initialize(self):
         # Initialize all variables before reading report
@@ -88,20 +104,21 @@ class ProcessReportBaseAction(Action):
         assert parser
 
         logger.info("Verify header, footer...")
-        try:
-            parser.parse_header(self._fp)
-            parser.parse_footer(self._fp)
-        except ParseReportException as e:
-            raise WorkerActionHardError(str(e))
+        with self._profile_stage('check_report'):
+            try:
+                parser.parse_header(self._fp)
+                parser.parse_footer(self._fp)
+            except ParseReportException as e:
+                raise WorkerActionHardError(str(e))
 
-        if parser.header['signature_flags'] != 0:
-            # Currently, only support for report that have a footer that is only a hash of the report, not an HMAC
-            raise WorkerActionHardError('Unrecognized signature flags')
+            if parser.header['signature_flags'] != 0:
+                # Currently, only support for report that have a footer that is only a hash of the report, not an HMAC
+                raise WorkerActionHardError('Unrecognized signature flags')
 
-        if not parser.check_report_hash(self._fp):
-            msg = 'Invalid Report Hash: {}'.format(str(parser.header))
-            logger.warning(msg)
-            raise WorkerActionHardError(msg)
+            if not parser.check_report_hash(self._fp):
+                msg = 'Invalid Report Hash: {}'.format(str(parser.header))
+                logger.warning(msg)
+                raise WorkerActionHardError(msg)
 
         self._streamer_report.original_first_id = parser.footer['lowest_id']
         self._streamer_report.original_last_id = parser.footer['highest_id']
@@ -120,10 +137,14 @@ class ProcessReportBaseAction(Action):
                 parser.header['dev_id'], str(self._streamer_report.id)
             ))
 
-        try:
-            parser.parse_readings(self._fp)
-        except ParseReportException as e:
-            raise WorkerActionHardError(str(e))
+        with self._profile_stage('parse_readings'):
+            try:
+                if self._columnar_readings:
+                    parser.parse_readings_array(self._fp)
+                else:
+                    parser.parse_readings(self._fp)
+            except ParseReportException as e:
+                raise WorkerActionHardError(str(e))
 
     def _get_last_reboot_data_point(self):
         """
@@ -156,12 +177,59 @@ class ProcessReportBaseAction(Action):
 
         return last_item
 
+    def _get_last_reboot_id(self):
+        """
+        Last time the device was rebooted, based on the time-base state of the device streamers.
+        Only fall back to the (expensive) data history scan if no streamer knows about a reboot yet,
+        and the streamer has never been scanned.
+        The scan result is stored in the streamer, so call before saving the streamer
+
+        :return: streamer_local_id of the last known reboot, or 0
+        """
+        last_reboot_id = Streamer.objects.filter(device=self._device).aggregate(
+            last_reboot_id=Max('last_reboot_id')
+        )['last_reboot_id'] or 0
+        if self._streamer:
+            # Include any reboot from the report being committed
+            last_reboot_id = max(last_reboot_id, self._streamer.last_reboot_id)
+
+        if not last_reboot_id and not (self._streamer and self._streamer.reboot_history_scanned):
+            last_reboot = self._get_last_reboot_data_point()
+            if last_reboot and last_reboot.streamer_local_id:
+                last_reboot_id = last_reboot.streamer_local_id
+            if self._streamer:
+                # Saved with the streamer, so the scan is not needed again, even if no reboot was found
+                self._streamer.last_reboot_id = max(self._streamer.last_reboot_id, last_reboot_id)
+                self._streamer.reboot_history_scanned = True
+
+        return last_reboot_id
+
+    def _update_streamer_time_base(self, base_dt_utc):
+        """
+        Update the streamer time-base state with the report being committed.
+        Call before updating (and saving) the streamer last_id, in the same transaction
+
+        :param base_dt_utc: Base datetime of the report
+        """
+        if self._reboot_ids:
+            self._streamer.last_reboot_id = max(self._streamer.last_reboot_id, max(self._reboot_ids))
+        self._streamer.last_reboot_ts = base_dt_utc
+
+        # Do not go back in time if reports are processed out of order
+        if self._streamer.last_base_ts is None or self._actual_last_id > self._streamer.last_id:
+            sent_ts = self._streamer_report.sent_timestamp
+            device_sent_ts = self._streamer_report.device_sent_timestamp
+            if sent_ts and device_sent_ts is not None:
+                self._streamer.last_base_ts = sent_ts - datetime.timedelta(seconds=device_sent_ts)
+            else:
+                self._streamer.last_base_ts = base_dt_utc
+
     def _initialize_device(self):
-        # Find the last time the device was reseted, if available
-        last_reboot = self._get_last_reboot_data_point()
         if not self._device.last_known_id:
-            if last_reboot and last_reboot.streamer_local_id:
-                self._device.last_known_id = last_reboot.streamer_local_id
+            # Find the last time the device was reseted, if available
+            last_reboot_id = self._get_last_reboot_id()
+            if last_reboot_id:
+                self._device.last_known_id = last_reboot_id
                 logger.info("Device's last_known_id doesn't exist, take the lastest 5c00")
             else:
                 # this is the first start in device's life time
@@ -227,6 +295,11 @@ class ProcessReportBaseAction(Action):
         original_first_id = parser.footer['lowest_id']
         original_last_id = parser.footer['highest_id']
 
+        # Load all streams in the report with a single query
+        self._data_builder.prefetch_streams(set([
+            formatted_gsid(pid=pid, did=did, vid=int2vid(stream)) for stream in set([item['stream'] for item in parser.data])
+        ]))
+
         for item in parser.data:
             incremental_id = item['id']
             assert (incremental_id >= original_first_id or incremental_id <= original_last_id)
@@ -296,72 +369,227 @@ class ProcessReportBaseAction(Action):
     def process(self):
         raise WorkerInternalError('Derived object must implement')
 
-    def execute(self, arguments):
-        super(ProcessReportBaseAction, self).execute(arguments)
-        if 'bucket' in arguments and 'key' in arguments:
-            bucket = arguments['bucket']
-            key = arguments['key']
-            self._decoded_key = parse.unquote(key)
-            try:
-                self._fp = download_file_from_s3(bucket, self._decoded_key)
-            except Exception as e:
-                # We don't know what kind of exceptions can be thrown, so catch all, but only because we are trying
-                # a single command
-                raise WorkerActionHardError('Error: {0}. Incorrect report in bucket {1}, key : {2}'.format(str(e), bucket, key))
+    def _load_report_info(self, arguments):
+        """
+        Get the StreamerReport, user and received datetime for the report in the given task arguments
+        """
+        bucket = arguments['bucket']
+        key = arguments['key']
+        self._decoded_key = parse.unquote(key)
 
-            try:
+        try:
+            report_file_cache = get_report_file_cache()
+            if report_file_cache:
+                metadata = report_file_cache.get_metadata(bucket, key)
+            else:
                 metadata = get_s3_metadata(bucket, key)
-                logger.info('metadata: {}'.format(metadata))
-                # user_slug = metadata['x-amz-meta-user']
-                received_ts = metadata['x-amz-meta-sent']
-                # streamer_slug = metadata['x-amz-meta-streamer']
-                report_id = metadata['x-amz-meta-uuid']
-            except Exception as e:
-                if getattr(settings, 'SERVER_TYPE') == 'dev':
-                    # If we are not using s3, decode information from s3 key
-                    info = self._decoded_key.split('/')
-                    try:
-                        # streamer_slug=info[1]
-                        received_ts = '{y}-{m}-{d}T{h}:00:00Z'.format(y=info[2], m=info[3], d=info[4], h=info[5])
-                        streamer_report_name = info[-1]
-                        report_id = streamer_report_name.split('.')[0]
-                    except IndexError as e:
-                        raise WorkerActionHardError('Error: {0}. Incorrect key format in payload with bucket {1}, key : {2}'.format(str(e), bucket, key))
-
-                    metadata = info
-                else:
-                    raise WorkerActionHardError('Error: {0}. path: //{1}/{2}'.format(str(e), bucket, key))
+            logger.info('metadata: {}'.format(metadata))
+            # user_slug = metadata['x-amz-meta-user']
+            received_ts = metadata['x-amz-meta-sent']
+            # streamer_slug = metadata['x-amz-meta-streamer']
+            report_id = metadata['x-amz-meta-uuid']
+        except Exception as e:
+            if getattr(settings, 'SERVER_TYPE') == 'dev':
+                # If we are not using s3, decode information from s3 key
+                info = self._decoded_key.split('/')
+                try:
+                    # streamer_slug=info[1]
+                    received_ts = '{y}-{m}-{d}T{h}:00:00Z'.format(y=info[2], m=info[3], d=info[4], h=info[5])
+                    streamer_report_name = info[-1]
+                    report_id = streamer_report_name.split('.')[0]
+                except IndexError as e:
+                    raise WorkerActionHardError('Error: {0}. Incorrect key format in payload with bucket {1}, key : {2}'.format(str(e), bucket, key))
+
+                metadata = info
+            else:
+                raise WorkerActionHardError('Error: {0}. path: //{1}/{2}'.format(str(e), bucket, key))
+        try:
+            self._received_dt = parse_datetime(received_ts)
+            self._streamer_report = StreamerReport.objects.get(id=report_id)
+            self._user = self._streamer_report.created_by
+        except user_model.DoesNotExist:
+            raise WorkerActionHardError('User does not exist. Incorrect report in bucket {}, key : {}'.format(bucket, key))
+        except StreamerReport.DoesNotExist:
+            raise WorkerActionHardError("Streamer report {0} not found!".format(report_id))
+
+        if not self._received_dt:
+            raise WorkerActionHardError('Received date time in key is not valid. Incorrect timestamp in bucket {0}, key : {1}'.format(bucket, key))
+
+    def _download_and_process(self, arguments):
+        bucket = arguments['bucket']
+        key = arguments['key']
+        base, ext = os.path.splitext(self._decoded_key)
+        self._profiler = StageProfiler(self.get_name(), engine='{0}{1}'.format(arguments.get('version', 'v0'), ext))
+        with self._profile_stage('download'):
+            self._download(bucket, key)
+
+        try:
+            self.process()
+        finally:
+            self._profiler.finish(size=self._count)
+            self._close_report_file()
+
+    def _close_report_file(self):
+        if self._fp is not None:
             try:
-                self._received_dt = parse_datetime(received_ts)
-                self._streamer_report = StreamerReport.objects.get(id=report_id)
-                self._user = self._streamer_report.created_by
-            except user_model.DoesNotExist:
-                raise WorkerActionHardError('User does not exist. Incorrect report in bucket {}, key : {}'.format(bucket, key))
-            except StreamerReport.DoesNotExist:
-                raise WorkerActionHardError("Streamer report {0} not found!".format(report_id))
+                self._fp.close()
+            except BufferError:
+                # A memory map still used by a readings array (e.g. referenced by an exception traceback).
+                # It gets closed once the array is garbage collected
+                logger.warning('Report file for {} still in use'.format(self._decoded_key))
+            self._fp = None
+
+    def _download(self, bucket, key):
+        try:
+            report_file_cache = get_report_file_cache()
+            if report_file_cache is None:
+                self._fp = download_file_from_s3(bucket, self._decoded_key)
+            elif self._columnar_readings:
+                # Readings are decoded directly from the memory map, without copying
+                self._fp = report_file_cache.open_mmap(bucket, self._decoded_key)
+            else:
+                self._fp = report_file_cache.open(bucket, self._decoded_key)
+        except Exception as e:
+            # We don't know what kind of exceptions can be thrown, so catch all, but only because we are trying
+            # a single command
+            raise WorkerActionHardError('Error: {0}. Incorrect report in bucket {1}, key : {2}'.format(str(e), bucket, key))
 
-            if not self._received_dt:
-                raise WorkerActionHardError('Received date time in key is not valid. Incorrect timestamp in bucket {0}, key : {1}'.format(bucket, key))
+    def _process_pending_reports(self, lease):
+        """
+        Process all reports that were queued while we held the lease, in incremental_id order,
+        and release the lease once there are no more pending reports.
 
-            # We want to ensure that we never process any given streamer in parallel, as it can cause race conditions (i.e. duplicates)
-            # We use the Redis cache to ensure we handle streamer work as atomic operations
+        Every pending report still has its own (rescheduled) task in SQS, so a report that fails
+        here is not lost: it is retried by its own task, with the usual error handling.
+        Processing stops (and the lease is released) on the first failure, so later reports
+        are not processed before it. Database errors are raised, so the worker follows its
+        usual database error procedure.
 
-            throtle_helper = WorkerThrotle(self, self._streamer_report.streamer.slug)
-            if throtle_helper.begin_process():
+        :param lease: StreamerLease held by this action
+        """
+        try:
+            while True:
+                if not lease.renew():
+                    # Held for too long (or lost): let the waiting tasks take over
+                    lease.release()
+                    return
+                item = lease.pop_next_pending_report()
+                if item is None:
+                    if lease.release_if_no_pending_reports():
+                        return
+                    continue
+
+                report_id, arguments = item
+                if lease.is_report_done(report_id):
+                    continue
+                module_name, class_name = ProcessReportBaseAction.get_module_and_class_names(arguments)
+                action = str_to_class(module_name, class_name)()
                 try:
-                    self.process()
-                except WorkerActionHardError as e:
-                    raise WorkerActionHardError(e)
+                    action.execute_with_lease(arguments)
+                except (InterfaceError, DatabaseError):
+                    raise
+                except WorkerAbortSilently as e:
+                    logger.warning(str(e))
+                    lease.mark_report_done(report_id)
                 except Exception as e:
-                    raise e
-                finally:
-                    throtle_helper.end_process()
+                    logger.warning('[{0}] Pending report {1} for {2} failed, will be retried by its own task: {3}'.format(
+                        action.get_name(), report_id, lease.streamer_slug, str(e)
+                    ))
+                    lease.release()
+                    return
+                else:
+                    lease.mark_report_done(report_id)
+        except Exception:
+            lease.release()
+            raise
 
-            else:
-                ProcessReportBaseAction.schedule(args=arguments, delay_seconds=120)
+    def _process_with_lease(self, lease, arguments):
+        try:
+            self._download_and_process(arguments)
+        except Exception:
+            # Pending reports are left to their own tasks, so they are not processed before this one
+            lease.release()
+            raise
+        lease.mark_report_done(self._streamer_report.id)
+        self._process_pending_reports(lease)
+
+    def execute_with_lease(self, arguments):
+        """
+        Process a report, assuming the streamer lease is already held by the caller
+        """
+        super(ProcessReportBaseAction, self).execute(arguments)
+        self._load_report_info(arguments)
+        self._download_and_process(arguments)
+
+    def execute(self, arguments):
+        super(ProcessReportBaseAction, self).execute(arguments)
+        if 'bucket' in arguments and 'key' in arguments:
+            self._load_report_info(arguments)
+
+            # We want to ensure that we never process any given streamer in parallel, as it can cause race conditions (i.e. duplicates)
+            lease = StreamerLease(self._streamer_report.streamer.slug)
+            report_id = self._streamer_report.id
+            if lease.is_report_done(report_id):
+                # Already processed by a lease holder while this task was waiting
+                logger.info('Report {} was already processed'.format(report_id))
+                return
+
+            if lease.acquire():
+                self._process_with_lease(lease, arguments)
+                return
+
+            # Let the lease holder know about this report, so it can process it in order
+            lease.add_pending_report(
+                report_id=report_id,
+                incremental_id=self._streamer_report.incremental_id,
+                arguments=arguments
+            )
+            # The lease holder may have released the lease before we added the report
+            if lease.acquire():
+                lease.remove_pending_report(report_id)
+                self._process_with_lease(lease, arguments)
+                return
+
+            # SQS stays the source of truth: keep a task for this report until it is marked as done,
+            # in case the lease holder dies before processing it
+            attempts = arguments.get('lease_attempts', 0) + 1
+            if attempts % WAIT_NOTIFY_ATTEMPTS == 0:
+                self.notify_admins(self.get_name(), 'Report {0} has waited {1} times for {2}. Args:\n{3}'.format(
+                    report_id, attempts, lease.streamer_slug, str(arguments)
+                ))
+            try:
+                ProcessReportBaseAction.schedule(
+                    args=dict(arguments, lease_attempts=attempts), delay_seconds=WAIT_RETRY_DELAY
+                )
+            except Exception as e:
+                # Keep the current message instead
+                raise WorkerActionSoftError('Unable to reschedule report {0} waiting for {1}: {2}'.format(
+                    report_id, lease.streamer_slug, str(e)
+                ))
         else:
             raise WorkerActionHardError('Bucket and/or key not found in arguments. Error comes from task: {}'.format(arguments))
 
+    @classmethod
+    def get_module_and_class_names(cls, args):
+        """
+        :param args: Task arguments, with at least a 'key' and optionally a 'version'
+        :return: module and class names of the action required to process the report
+        """
+        base, ext = os.path.splitext(args['key'])
+
+        if 'version' in args and args['version'] in ENGINE_TYPES:
+            if args['version'] not in ENGINE_TYPES:
+                raise WorkerActionHardError('Unsupported Streamer Report Version: {}'.format(args['version']))
+            if ext not in ENGINE_TYPES[args['version']]:
+                raise WorkerActionHardError('Unsupported file extension ({}) for Streamer Report V{}'.format(ext, args['version']))
+            module_name = ENGINE_TYPES[args['version']][ext]['module_name']
+            class_name = ENGINE_TYPES[args['version']][ext]['class_name']
+        else:
+            module_name = ENGINE_TYPES['v0']['.bin']['module_name']
+            class_name = ENGINE_TYPES['v0']['.bin']['class_name']
+
+        return module_name, class_name
+
     @classmethod
     def schedule(cls, args, queue_name=getattr(settings, 'SQS_WORKER_QUEUE_NAME'), delay_seconds=None):
         """
@@ -373,18 +601,7 @@ class ProcessReportBaseAction(Action):
         """
 
         if 'bucket' in args and 'key' in args:
-            base, ext = os.path.splitext(args['key'])
-
-            if 'version' in args and args['version'] in ENGINE_TYPES:
-                if args['version'] not in ENGINE_TYPES:
-                    raise WorkerActionHardError('Unsupported Streamer Report Version: {}'.format(args['version']))
-                if ext not in ENGINE_TYPES[args['version']]:
-                    raise WorkerActionHardError('Unsupported file extension ({}) for Streamer Report V{}'.format(ext, args['version']))
-                module_name = ENGINE_TYPES[args['version']][ext]['module_name']
-                class_name = ENGINE_TYPES[args['version']][ext]['class_name']
-            else:
-                module_name = ENGINE_TYPES['v0']['.bin']['module_name']
-                class_name = ENGINE_TYPES['v0']['.bin']['class_name']
+            module_name, class_name = cls.get_module_and_class_names(args)
 
             logger.info('Using module_name={0}, class_name={1}'.format(module_name, class_name))
 
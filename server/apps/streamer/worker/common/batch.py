@@ -0,0 +1,85 @@
+import logging
+
+import numpy as np
+
+from apps.streamdata.models import get_timestamp_from_utc_device_timestamp
+
+logger = logging.getLogger(__name__)
+
+# If the most significant bit of a device timestamp is set, it was set by the device RTC
+RTC_TIMESTAMP_FLAG = 1 << 31
+
+
+class ReportReadingBatch(object):
+    """
+    Columnar representation of the new readings of a binary streamer report.
+
+    Built from the structured array returned by ReportParser.parse_readings_array,
+    it keeps one numpy array per column (in report order), so that any per stream
+    work (slugs, enabled check, value casting) can be done once per distinct stream
+    instead of once per reading.
+    """
+    stream = None
+    seq_id = None
+    device_timestamp = None
+    int_value = None
+
+    def __init__(self, readings, last_id=0):
+        """
+        :param readings: Structured numpy array with READINGS_DTYPE
+        :param last_id: Only keep readings with an incremental ID larger than this
+        """
+        mask = readings['id'] > last_id
+        self.stream = readings['stream'][mask].astype(np.int64)
+        self.seq_id = readings['id'][mask].astype(np.int64)
+        self.device_timestamp = readings['timestamp'][mask].astype(np.int64)
+        self.int_value = readings['value'][mask].astype(np.int64)
+
+    def __len__(self):
+        return self.seq_id.shape[0]
+
+    @property
+    def first_id(self):
+        return int(self.seq_id[0]) if len(self) else None
+
+    @property
+    def last_id(self):
+        return int(self.seq_id[-1]) if len(self) else None
+
+    def get_timestamps(self, base_dt):
+        """
+        Vectorized version of get_utc_read_data_timestamp for all readings
+
+        :param base_dt: Datetime to use for readings that represent time since last reboot
+        :return: list of datetimes, in report order
+        """
+        base = np.datetime64(base_dt.replace(tzinfo=None), 'us')
+        naive_timestamps = (base + self.device_timestamp.astype('timedelta64[s]')).tolist()
+        timestamps = [dt.replace(tzinfo=base_dt.tzinfo) for dt in naive_timestamps]
+
+        # Readings with an RTC timestamp are absolute, and not based on base_dt
+        for i in np.flatnonzero(self.device_timestamp & RTC_TIMESTAMP_FLAG).tolist():
+            timestamps[i] = get_timestamp_from_utc_device_timestamp(int(self.device_timestamp[i]))
+
+        return timestamps
+
+    def get_stream_groups(self):
+        """
+        Group readings by stream
+
+        :return: generator of (stream, indexes) tuples, with indexes in report order
+        """
+        if not len(self):
+            return
+        streams, inverse = np.unique(self.stream, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        boundaries = np.cumsum(np.bincount(inverse))[:-1]
+        for stream, indexes in zip(streams.tolist(), np.split(order, boundaries)):
+            yield stream, indexes
+
+    def get_seq_ids_for_stream(self, stream):
+        """
+        :param stream: Stream (variable) ID as an int
+        :return: numpy array with the incremental IDs of all readings for the given stream
+        """
+        return self.seq_id[self.stream == stream]
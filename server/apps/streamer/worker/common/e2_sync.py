@@ -0,0 +1,60 @@
+import logging
+
+from apps.utils.data_helpers.manager import DataManager
+
+logger = logging.getLogger(__name__)
+
+# Max number of events updated by a single UPDATE statement
+E2_SYNC_BATCH_SIZE = 500
+
+
+def get_e2_data_pointers(data_entries, stream_slugs):
+    """
+    Group the data pointers of E2 streams (Unstructured Events with Data Pointer)
+    with a single pass over the data entries.
+    Data points with RTC synchronized timing are ignored
+
+    :param data_entries: list of StreamData
+    :param stream_slugs: set of E2 stream slugs
+    :return: dict of {stream_slug: {seq_id: (timestamp, device_timestamp)}}
+    """
+    pointers = {}
+    for stream_data in data_entries:
+        if stream_data.stream_slug in stream_slugs and not stream_data.has_utc_synchronized_device_timestamp:
+            stream_pointers = pointers.setdefault(stream_data.stream_slug, {})
+            stream_pointers[stream_data.int_value] = (stream_data.timestamp, stream_data.device_timestamp)
+    return pointers
+
+
+def sync_e2_event_timestamps(stream_slug, pointers, seq_ids=None, skip_events_with_no_timestamp=False):
+    """
+    Update the timestamp of the events of an E2 stream from the data points pointing to them,
+    with a single batched UPDATE (per E2_SYNC_BATCH_SIZE events)
+
+    :param stream_slug: E2 stream slug
+    :param pointers: dict of {seq_id: (timestamp, device_timestamp)}
+    :param seq_ids: seq_ids of the events to update (all pointers by default)
+    :param skip_events_with_no_timestamp: If True, do not update events with no timestamp
+    :return: (list of updated events, list of seq_ids of events with no data pointer)
+    """
+    if seq_ids is None:
+        seq_ids = list(pointers.keys())
+    if not seq_ids:
+        return [], []
+
+    updated = []
+    no_pointer_seq_ids = []
+    event_qs = DataManager.filter_qs('event', streamer_local_id__in=list(seq_ids), stream_slug=stream_slug)
+    for event in event_qs:
+        pointer = pointers.get(event.incremental_id)
+        if pointer is None:
+            no_pointer_seq_ids.append(event.incremental_id)
+        elif event.timestamp is not None or not skip_events_with_no_timestamp:
+            event.timestamp, event.device_timestamp = pointer
+            updated.append(event)
+
+    if updated:
+        logger.info('Updating {0} events of {1} with timestamps from data'.format(len(updated), stream_slug))
+        DataManager.bulk_update('event', updated, ['timestamp', 'device_timestamp'], batch_size=E2_SYNC_BATCH_SIZE)
+
+    return updated, no_pointer_seq_ids
@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+from apps.sqsworker.exceptions import WorkerActionSoftError
+from apps.utils.redis_cache import delete_if_value, expire_if_value
+
+logger = logging.getLogger(__name__)
+
+# The lease expires unless it is renewed, so a dead worker cannot block a streamer for long
+LEASE_TTL = 600
+LEASE_RENEW_INTERVAL = LEASE_TTL // 3
+# A holder stops renewing the lease after this long (in seconds), so a hung worker
+# cannot block a streamer forever: waiting tasks take the lease over once it expires
+LEASE_MAX_HOLD_TIME = 2 * 60 * 60
+# Reports waiting for the lease (and processed report markers) are kept for 5hrs
+PENDING_TTL = 18000
+# Tasks that cannot get the lease are rescheduled with this delay, until their report is processed.
+# Admins are notified every WAIT_NOTIFY_ATTEMPTS attempts
+WAIT_RETRY_DELAY = 120
+WAIT_NOTIFY_ATTEMPTS = 50
+# Short lived mutex protecting the list of pending reports
+MUTEX_TTL = 10
+MUTEX_RETRY_DELAY = 0.05
+MUTEX_ATTEMPTS = 200
+
+
+class StreamerLease(object):
+    """
+    Per-streamer lease, used to ensure we never process a given streamer in parallel,
+    as it can cause race conditions (i.e. duplicates).
+
+    The lease is an atomic add (Redis SET NX) with a TTL, renewed by a heartbeat while held,
+    for up to LEASE_MAX_HOLD_TIME. Renewal and release only succeed if the lease still has our
+    token (compare-and-set), so an expired holder can never extend or delete the lease of the next holder.
+
+    Workers that cannot get the lease add their report to the streamer's pending list,
+    so the lease holder can process it (in incremental_id order) before releasing the lease.
+    The pending list is only an ordering hint: the waiting task is still rescheduled,
+    and is only dropped once its report has been marked as processed.
+    """
+    streamer_slug = None
+    key = None
+    pending_key = None
+    mutex_key = None
+    done_key_prefix = None
+    token = None
+
+    def __init__(self, streamer_slug):
+        self.streamer_slug = streamer_slug
+        self.key = ':'.join(['streamer-processing-lease', self.streamer_slug])
+        self.pending_key = ':'.join(['streamer-pending-reports', self.streamer_slug])
+        self.mutex_key = ':'.join(['streamer-pending-mutex', self.streamer_slug])
+        self.done_key_prefix = ':'.join(['streamer-report-done', self.streamer_slug])
+        self.token = str(uuid.uuid4())
+        self._acquired_at = None
+        self._heartbeat = None
+        self._stop_heartbeat = threading.Event()
+
+    def _heartbeat_loop(self):
+        while not self._stop_heartbeat.wait(LEASE_RENEW_INTERVAL):
+            try:
+                if not self.renew():
+                    return
+            except Exception as e:
+                logger.warning('Unable to renew lease, key={0}, error={1}'.format(self.key, str(e)))
+
+    def _start_heartbeat(self):
+        self._stop_heartbeat.clear()
+        self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        self._heartbeat.start()
+
+    def _end_heartbeat(self):
+        self._stop_heartbeat.set()
+        self._heartbeat = None
+
+    @contextmanager
+    def _pending_mutex(self):
+        for _ in range(MUTEX_ATTEMPTS):
+            if cache.add(self.mutex_key, self.token, MUTEX_TTL):
+                break
+            time.sleep(MUTEX_RETRY_DELAY)
+        else:
+            raise WorkerActionSoftError('Unable to lock pending reports for {}'.format(self.streamer_slug))
+        try:
+            yield
+        finally:
+            delete_if_value(self.mutex_key, self.token)
+
+    @property
+    def is_held(self):
+        return cache.get(self.key) == self.token
+
+    def acquire(self):
+        """
+        :return: True if the lease was acquired
+        """
+        assert(cache)
+        if cache.add(self.key, self.token, LEASE_TTL):
+            logger.info('Acquired lease {}'.format(self.key))
+            self._acquired_at = time.monotonic()
+            self._start_heartbeat()
+            return True
+        return False
+
+    def renew(self):
+        """
+        Extend the lease TTL, if still held, and held for less than LEASE_MAX_HOLD_TIME
+
+        :return: True if the lease is still held (and was extended)
+        """
+        if self._acquired_at is not None and time.monotonic() - self._acquired_at > LEASE_MAX_HOLD_TIME:
+            logger.warning('Lease {} held for too long. No longer renewed'.format(self.key))
+            return False
+        if expire_if_value(self.key, self.token, LEASE_TTL):
+            return True
+        logger.warning('Lease {} is no longer held'.format(self.key))
+        return False
+
+    def release(self):
+        self._end_heartbeat()
+        if delete_if_value(self.key, self.token):
+            logger.info('Released lease {}'.format(self.key))
+
+    def _get_done_key(self, report_id):
+        return ':'.join([self.done_key_prefix, str(report_id)])
+
+    def mark_report_done(self, report_id):
+        """
+        Record that the report was processed, so tasks waiting for the lease can be dropped
+        """
+        cache.set(self._get_done_key(report_id), True, PENDING_TTL)
+
+    def is_report_done(self, report_id):
+        return bool(cache.get(self._get_done_key(report_id)))
+
+    def release_if_no_pending_reports(self):
+        """
+        Release the lease, unless reports were added to the pending list.
+        Done with the pending list locked, so a report cannot be added
+        after we check and before the lease is released
+
+        :return: True if the lease was released
+        """
+        with self._pending_mutex():
+            if cache.get(self.pending_key):
+                return False
+            self.release()
+        return True
+
+    def add_pending_report(self, report_id, incremental_id, arguments):
+        """
+        Add a report to the list of reports waiting for the lease.
+        This is only a hint for the lease holder: the caller is still responsible for the report,
+        until it is marked as done
+
+        :param report_id: StreamerReport ID
+        :param incremental_id: StreamerReport incremental_id, used for ordering
+        :param arguments: Task arguments required to process the report
+        """
+        with self._pending_mutex():
+            pending = cache.get(self.pending_key, {})
+            pending[str(report_id)] = {
+                'report_id': str(report_id),
+                'incremental_id': incremental_id,
+                'arguments': arguments
+            }
+            cache.set(self.pending_key, pending, PENDING_TTL)
+        logger.info('Report {0} waiting for lease {1} ({2} pending)'.format(report_id, self.key, len(pending)))
+
+    def _pop_pending_report(self, report_id=None):
+        with self._pending_mutex():
+            pending = cache.get(self.pending_key, {})
+            if report_id is None and pending:
+                report_id = min(pending.keys(), key=lambda k: pending[k]['incremental_id'] or 0)
+            item = pending.pop(str(report_id), None)
+            if item is None:
+                return None
+            if pending:
+                cache.set(self.pending_key, pending, PENDING_TTL)
+            else:
+                cache.delete(self.pending_key)
+        return item
+
+    def pop_next_pending_report(self):
+        """
+        Remove the pending report with the lowest incremental_id
+
+        :return: (report_id, task arguments) for the report, or None if there are no pending reports
+        """
+        item = self._pop_pending_report()
+        if item is None:
+            return None
+        return item['report_id'], item['arguments']
+
+    def remove_pending_report(self, report_id):
+        """
+        Remove a report from the pending list (i.e. because its own task got the lease)
+        """
+        self._pop_pending_report(report_id)
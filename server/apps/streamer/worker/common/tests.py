@@ -0,0 +1,207 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from apps.sqsworker.exceptions import WorkerActionSoftError
+
+from .base_action import ProcessReportBaseAction
+from .streamer_lease import LEASE_MAX_HOLD_TIME, WAIT_NOTIFY_ATTEMPTS, WAIT_RETRY_DELAY, StreamerLease
+
+
+class StreamerLeaseTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def testAcquireRelease(self):
+        lease1 = StreamerLease('t--0000-0000-0000-000a--0001')
+        lease2 = StreamerLease('t--0000-0000-0000-000a--0001')
+        other = StreamerLease('t--0000-0000-0000-000b--0001')
+
+        self.assertTrue(lease1.acquire())
+        self.assertTrue(lease1.is_held)
+        self.assertFalse(lease2.acquire())
+        self.assertTrue(other.acquire())
+        self.assertTrue(lease1.renew())
+        self.assertFalse(lease2.renew())
+
+        # Releasing a lease we don't hold should not release it for the holder
+        lease2.release()
+        self.assertTrue(lease1.is_held)
+
+        self.assertTrue(lease1.release_if_no_pending_reports())
+        self.assertFalse(lease1.is_held)
+        self.assertTrue(lease2.acquire())
+        lease2.release()
+        other.release()
+
+    def testPendingReports(self):
+        lease1 = StreamerLease('t--0000-0000-0000-000a--0001')
+        lease2 = StreamerLease('t--0000-0000-0000-000a--0001')
+
+        self.assertTrue(lease1.acquire())
+        self.assertFalse(lease2.acquire())
+        lease2.add_pending_report(report_id='rpt-3', incremental_id=3, arguments={'key': 'c'})
+        lease2.add_pending_report(report_id='rpt-1', incremental_id=1, arguments={'key': 'a'})
+        lease2.add_pending_report(report_id='rpt-2', incremental_id=2, arguments={'key': 'b'})
+        # Duplicate tasks for the same report are only processed once
+        lease2.add_pending_report(report_id='rpt-2', incremental_id=2, arguments={'key': 'b'})
+
+        # Cannot release while reports are pending
+        self.assertFalse(lease1.release_if_no_pending_reports())
+        self.assertTrue(lease1.is_held)
+
+        self.assertEqual(lease1.pop_next_pending_report(), ('rpt-1', {'key': 'a'}))
+        lease1.remove_pending_report('rpt-2')
+        self.assertEqual(lease1.pop_next_pending_report(), ('rpt-3', {'key': 'c'}))
+        self.assertIsNone(lease1.pop_next_pending_report())
+
+        self.assertTrue(lease1.release_if_no_pending_reports())
+        self.assertFalse(lease1.is_held)
+
+    def testExpiredLease(self):
+        lease1 = StreamerLease('t--0000-0000-0000-000a--0001')
+        lease2 = StreamerLease('t--0000-0000-0000-000a--0001')
+
+        self.assertTrue(lease1.acquire())
+        # Simulate lease1 expiring (i.e. a delayed heartbeat), and lease2 taking over
+        cache.delete(lease1.key)
+        self.assertTrue(lease2.acquire())
+
+        # lease1 can neither extend nor delete the new lease
+        self.assertFalse(lease1.renew())
+        lease1.release()
+        self.assertTrue(lease2.is_held)
+        self.assertTrue(lease2.renew())
+        lease2.release()
+        self.assertFalse(lease2.is_held)
+
+    def testMaxHoldTime(self):
+        lease1 = StreamerLease('t--0000-0000-0000-000a--0001')
+        self.assertTrue(lease1.acquire())
+        self.assertTrue(lease1.renew())
+        # A (hung) holder stops renewing the lease, so waiting tasks can take it over once it expires
+        with mock.patch('apps.streamer.worker.common.streamer_lease.time.monotonic',
+                        return_value=lease1._acquired_at + LEASE_MAX_HOLD_TIME + 1):
+            self.assertFalse(lease1.renew())
+        lease1.release()
+
+    @mock.patch.object(ProcessReportBaseAction, 'schedule')
+    @mock.patch.object(ProcessReportBaseAction, '_download_and_process')
+    def testWaitingReport(self, mock_download_and_process, mock_schedule):
+        slug = 't--0000-0000-0000-000a--0001'
+
+        def load_report_info(action, arguments):
+            action._streamer_report = mock.Mock(id='rpt-1', incremental_id=1)
+            action._streamer_report.streamer.slug = slug
+        arguments = {'bucket': 'b', 'key': 'k'}
+
+        holder = StreamerLease(slug)
+        self.assertTrue(holder.acquire())
+
+        with mock.patch.object(ProcessReportBaseAction, '_load_report_info', autospec=True,
+                               side_effect=load_report_info):
+            # The task is rescheduled, and the report is added to the pending list
+            ProcessReportBaseAction().execute(arguments)
+            mock_schedule.assert_called_once_with(args=dict(arguments, lease_attempts=1), delay_seconds=WAIT_RETRY_DELAY)
+            mock_download_and_process.assert_not_called()
+            self.assertEqual(holder.pop_next_pending_report(), ('rpt-1', arguments))
+
+            # Once the holder processes the report, the rescheduled task is just dropped
+            holder.mark_report_done('rpt-1')
+            ProcessReportBaseAction().execute(arguments)
+            self.assertEqual(mock_schedule.call_count, 1)
+            mock_download_and_process.assert_not_called()
+
+            # If the holder never processes it, the rescheduled task eventually gets the lease
+            cache.clear()
+            holder.release()
+            ProcessReportBaseAction().execute(arguments)
+            self.assertEqual(mock_schedule.call_count, 1)
+            mock_download_and_process.assert_called_once_with(arguments)
+            self.assertTrue(StreamerLease(slug).is_report_done('rpt-1'))
+            self.assertFalse(StreamerLease(slug).is_held)
+
+    @mock.patch.object(ProcessReportBaseAction, 'notify_admins')
+    @mock.patch.object(ProcessReportBaseAction, 'schedule')
+    def testWaitingReportNotification(self, mock_schedule, mock_notify_admins):
+        slug = 't--0000-0000-0000-000a--0001'
+
+        def load_report_info(action, arguments):
+            action._streamer_report = mock.Mock(id='rpt-1', incremental_id=1)
+            action._streamer_report.streamer.slug = slug
+
+        holder = StreamerLease(slug)
+        self.assertTrue(holder.acquire())
+        with mock.patch.object(ProcessReportBaseAction, '_load_report_info', autospec=True,
+                               side_effect=load_report_info):
+            ProcessReportBaseAction().execute({'bucket': 'b', 'key': 'k', 'lease_attempts': WAIT_NOTIFY_ATTEMPTS - 2})
+            mock_notify_admins.assert_not_called()
+            ProcessReportBaseAction().execute({'bucket': 'b', 'key': 'k', 'lease_attempts': WAIT_NOTIFY_ATTEMPTS - 1})
+            self.assertEqual(mock_notify_admins.call_count, 1)
+            self.assertEqual(mock_schedule.call_args[1]['args']['lease_attempts'], WAIT_NOTIFY_ATTEMPTS)
+        holder.release()
+
+    def testPendingReportFailure(self):
+        slug = 't--0000-0000-0000-000a--0001'
+        holder = StreamerLease(slug)
+        self.assertTrue(holder.acquire())
+        waiter = StreamerLease(slug)
+        for n in [1, 2, 3]:
+            waiter.add_pending_report(report_id='rpt-{}'.format(n), incremental_id=n, arguments={'n': n})
+
+        processed = []
+
+        def execute_with_lease(action, arguments):
+            if arguments['n'] == 2:
+                raise WorkerActionSoftError('Failed')
+            processed.append(arguments['n'])
+
+        with mock.patch.object(ProcessReportBaseAction, 'get_module_and_class_names',
+                               return_value=('apps.streamer.worker.common.base_action', 'ProcessReportBaseAction')), \
+                mock.patch.object(ProcessReportBaseAction, 'execute_with_lease', autospec=True,
+                                  side_effect=execute_with_lease):
+            ProcessReportBaseAction()._process_pending_reports(holder)
+
+        # Processing stops at the failed report, and later reports are left to their own tasks
+        self.assertEqual(processed, [1])
+        self.assertTrue(holder.is_report_done('rpt-1'))
+        self.assertFalse(holder.is_report_done('rpt-2'))
+        self.assertFalse(holder.is_report_done('rpt-3'))
+        self.assertFalse(holder.is_held)
+
+    @mock.patch.object(ProcessReportBaseAction, '_process_pending_reports')
+    @mock.patch.object(ProcessReportBaseAction, '_download_and_process', side_effect=WorkerActionSoftError('Failed'))
+    def testHolderFailure(self, mock_download_and_process, mock_process_pending):
+        action = ProcessReportBaseAction()
+        action._streamer_report = mock.Mock(id='rpt-1', incremental_id=1)
+        lease = StreamerLease('t--0000-0000-0000-000a--0001')
+        self.assertTrue(lease.acquire())
+        with self.assertRaises(WorkerActionSoftError):
+            action._process_with_lease(lease, {'bucket': 'b', 'key': 'k'})
+        # Pending reports are not processed before the failed one
+        mock_process_pending.assert_not_called()
+        self.assertFalse(lease.is_report_done('rpt-1'))
+        self.assertFalse(lease.is_held)
+
+    @mock.patch('apps.streamer.worker.common.base_action.StageProfiler')
+    @mock.patch.object(ProcessReportBaseAction, 'process', side_effect=WorkerActionSoftError('Failed'))
+    @mock.patch.object(ProcessReportBaseAction, '_download')
+    def testReportFileClosed(self, mock_download, mock_process, mock_profiler):
+        action = ProcessReportBaseAction()
+        action._decoded_key = 'k.bin'
+        fp = mock.Mock()
+
+        def download(bucket, key):
+            action._fp = fp
+        mock_download.side_effect = download
+
+        # Closed even if processing fails
+        with self.assertRaises(WorkerActionSoftError):
+            action._download_and_process({'bucket': 'b', 'key': 'k'})
+        fp.close.assert_called_once_with()
+        self.assertIsNone(action._fp)
@@ -32,6 +32,7 @@ class ProcessReportV1Action(ProcessReportBaseAction):
     _last_user_incremental_id = None
     _last_system_incremental_id = None
     _all_stream_filters = {}
+    _last_reboot_id = 0
 
     def _preprocess_parsed_report(self, parser):
         # Initialize all variables before reading report
@@ -41,6 +42,7 @@ class ProcessReportV1Action(ProcessReportBaseAction):
         self._last_user_incremental_id = None
         self._last_system_incremental_id = None
         self._all_stream_filters = {}
+        self._last_reboot_id = 0
 
     def _handle_reboot(self, parser):
         logger.info('Reboot detected during processing. Scheduling handle reboot action...')
@@ -113,8 +115,11 @@ class ProcessReportV1Action(ProcessReportBaseAction):
                 self._streamer_report.actual_first_id = self._actual_first_id
                 self._streamer_report.actual_last_id = self._actual_last_id
                 self._streamer_report.save()
+                self._update_streamer_time_base(base_dt_utc)
+                if not self._streamer.is_system:
+                    # Before saving the streamer, so any reboot history scan is saved with it
+                    self._last_reboot_id = self._get_last_reboot_id()
                 self._streamer.last_id = self._streamer_report.actual_last_id
-                self._streamer.last_reboot_ts = base_dt_utc
                 self._streamer.save()
                 # Update Device Status for Hearthbeat notifications
                 if self._streamer_report.actual_last_id > status.last_known_id:
@@ -138,9 +143,8 @@ class ProcessReportV1Action(ProcessReportBaseAction):
                 if len(self._reboot_ids) > 0:
                     self._handle_reboot(parser)
             else:
-                lastest_reboot = self._get_last_reboot_data_point()
-                if lastest_reboot and lastest_reboot.streamer_local_id:
-                    if self._actual_first_id < lastest_reboot.streamer_local_id:
+                if self._last_reboot_id:
+                    if self._actual_first_id < self._last_reboot_id:
                         logger.info("Delayed report detected, scheduling HandleDelayAction...")
                         self._handle_delay_report()
 
@@ -146,6 +146,33 @@ class ProcessReportTestCase(TestMixin, TestCase):
         # Should be None as this is a different device without 5c00
         self.assertIsNone(last_reboot)
 
+    def testLastRebootIdScannedOnce(self):
+        pr = ProcessReportV1Action()
+        pr._device = self.pd1
+        pr._streamer = self.user_streamer
+
+        # No reboot anywhere: the data history is scanned once, and the result saved with the streamer
+        with mock.patch.object(pr, '_get_last_reboot_data_point', return_value=None) as mock_scan:
+            self.assertEqual(pr._get_last_reboot_id(), 0)
+            self.assertEqual(mock_scan.call_count, 1)
+        self.user_streamer.save()
+        self.user_streamer.refresh_from_db()
+        self.assertTrue(self.user_streamer.reboot_history_scanned)
+
+        pr = ProcessReportV1Action()
+        pr._device = self.pd1
+        pr._streamer = self.user_streamer
+        with mock.patch.object(pr, '_get_last_reboot_data_point') as mock_scan:
+            self.assertEqual(pr._get_last_reboot_id(), 0)
+            self.assertEqual(mock_scan.call_count, 0)
+
+        # A reboot known by the system streamer is used without scanning
+        self.sys_streamer.last_reboot_id = 25
+        self.sys_streamer.save()
+        with mock.patch.object(pr, '_get_last_reboot_data_point') as mock_scan:
+            self.assertEqual(pr._get_last_reboot_id(), 25)
+            self.assertEqual(mock_scan.call_count, 0)
+
     @mock.patch('apps.streamer.worker.common.base_action.download_file_from_s3')
     def testProcessUserReportTwice(self, mock_download_s3):
         report = StreamerReport.objects.create(streamer=self.user_streamer,
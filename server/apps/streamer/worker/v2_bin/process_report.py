@@ -2,6 +2,9 @@ import datetime
 import logging
 import time
 
+import numpy as np
+import pytz
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
@@ -16,12 +19,14 @@ from apps.streamfilter.cache_utils import cached_serialized_filter_for_slug
 from apps.streamfilter.process import FilterHelper
 from apps.utils.aws.sns import sns_staff_notification
 from apps.utils.data_helpers.manager import DataManager
-from apps.utils.gid.convert import get_vid_from_gvid
+from apps.utils.gid.convert import formatted_gsid, get_vid_from_gvid, gid2int, int2vid
 from apps.utils.iotile.streamer import STREAMER_SELECTOR
 from apps.utils.iotile.variable import SYSTEM_VID
 from apps.utils.timezone_utils import convert_to_utc
 
 from ..common.base_action import ProcessReportBaseAction, get_utc_read_data_timestamp
+from ..common.batch import ReportReadingBatch
+from ..common.e2_sync import get_e2_data_pointers, sync_e2_event_timestamps
 from ..misc.forward_streamer_report import ForwardStreamerReportAction
 
 user_model = get_user_model()
@@ -32,6 +37,7 @@ DELAY_SECONDS = 60 * 5  # in seconds
 class ProcessReportV2Action(ProcessReportBaseAction):
     _all_stream_filters = {}
     _event_entries = []
+    _columnar_readings = True
 
     def _preprocess_parsed_report(self, parser):
         # Initialize all variables before reading report
@@ -80,13 +86,87 @@ class ProcessReportV2Action(ProcessReportBaseAction):
                 device_timestamp = item.device_timestamp + base_device_timestamp
                 item.timestamp = convert_to_utc(base_ts + datetime.timedelta(seconds=device_timestamp))
 
+    def _read_stream_data(self, parser, base_dt):
+        """
+        Columnar version of ProcessReportBaseAction._read_stream_data.
+        Readings are grouped by stream, so that slugs, the enabled check and value
+        conversion are computed once per distinct stream. StreamData objects are only
+        built for enabled streams, and are kept in report order.
+        """
+        pid = self._device.project.formatted_gid
+        did = self._device.formatted_gid
+
+        batch = ReportReadingBatch(parser.readings, last_id=self._streamer.last_id)
+        if not len(batch):
+            return
+
+        # Keep track of the actual start/end incremental IDs
+        self._actual_first_id = batch.first_id
+        self._actual_last_id = batch.last_id
+
+        seq_ids = batch.seq_id.tolist()
+        device_timestamps = batch.device_timestamp.tolist()
+        int_values = batch.int_value.tolist()
+        timestamps = batch.get_timestamps(base_dt)
+
+        stream_groups = [
+            (formatted_gsid(pid=pid, did=did, vid=int2vid(stream)), indexes) for stream, indexes in batch.get_stream_groups()
+        ]
+        # Load all streams in the report with a single query
+        self._data_builder.prefetch_streams([stream_slug for stream_slug, indexes in stream_groups])
+
+        entries = [None] * len(batch)
+        for stream_slug, indexes in stream_groups:
+            if not self._data_builder.check_if_stream_is_enabled(stream_slug):
+                continue
+            indexes = indexes.tolist()
+            stream_entries = self._data_builder.build_data_obj_list(
+                stream_slug=stream_slug,
+                streamer_local_ids=[seq_ids[i] for i in indexes],
+                device_timestamps=[device_timestamps[i] for i in indexes],
+                timestamps=[timestamps[i] for i in indexes],
+                int_values=[int_values[i] for i in indexes]
+            )
+            for i, stream_data in zip(indexes, stream_entries):
+                entries[i] = stream_data
+
+        new_entries = [item for item in entries if item is not None]
+        self._data_entries.extend(new_entries)
+        self._count += len(new_entries)
+
+        reboot_ids = batch.get_seq_ids_for_stream(gid2int(SYSTEM_VID['REBOOT'])).tolist()
+        if reboot_ids:
+            logger.info('Found Reboots: {}'.format(reboot_ids))
+        self._reboot_ids.extend(reboot_ids)
+
+    def _get_previous_report_base_ts(self):
+        """
+        Base timestamp of the previous report, from the streamer time-base state
+
+        :return: datetime, or None if the state does not apply to this report (e.g. not yet known,
+                 or reports processed out of order)
+        """
+        base_ts = self._streamer.last_base_ts
+        if base_ts and self._data_entries and self._streamer.last_id < self._data_entries[0].streamer_local_id:
+            return base_ts
+        return None
+
     def _handle_reboots_if_needed(self, reference_reboot=None):
-        contains_trip_system_data = False
-        end_of_block_dt = self._received_dt
+        """
+        Fix up the timestamps of all data entries that are not RTC based.
+
+        Going backwards, every reboot starts a new block. The right most block is based on the
+        report's sent timestamp (or the reference reboot) and is clean. Every other block is assumed
+        to end one second before the start of the next block, and is dirty.
+        Blocks are resolved first, and then all timestamps are computed in a single vectorized pass.
+
+        :param reference_reboot: First reboot after a chopped report, if handling a chopped report
+        """
+        entries = self._data_entries
         if reference_reboot:
             # Use this method for handling chopped reports
             # In this case, the reference is the first reboot after the chopped report
-            last = self._data_entries[-1]
+            last = entries[-1]
             base_ts = reference_reboot.timestamp - datetime.timedelta(seconds=last.device_timestamp)
             logger.info('_received_dt={0}, ref_reboot={1}, base_ts={2}'.format(
                 self._received_dt, reference_reboot.timestamp, base_ts
@@ -96,40 +176,61 @@ class ProcessReportV2Action(ProcessReportBaseAction):
             logger.info('_received_dt={0}, device_sent_ts={1}, base_ts={2}'.format(
                 self._received_dt, self._streamer_report.device_sent_timestamp, base_ts
             ))
-        no_reboots_found = True
-        for i in reversed(range(len(self._data_entries))):
-            item = self._data_entries[i]
-            # If timestamp was already based on UTC (with the device RTC)
-            # then do not process reboot
-            if item.has_utc_synchronized_device_timestamp:
-                item.status = 'utc'
-                item.dirty_ts = False
-                if item.timestamp is None:
-                    # If timestamp is not set, set it here
-                    item.timestamp = get_utc_read_data_timestamp(base_ts, item.device_timestamp)
-                continue
-            # Do not fix TRIP START/END records. We will special handle them below
-            if get_vid_from_gvid(item.variable_slug) in [SYSTEM_VID['TRIP_START'], SYSTEM_VID['TRIP_END']]:
-                # Need to handle trip system data
-                contains_trip_system_data = True
-                continue
 
-            if not base_ts:
-                base_ts = end_of_block_dt - datetime.timedelta(seconds=item.device_timestamp)
-                logger.info("Base ts at the end of block {}".format(base_ts))
-
-            item.timestamp = convert_to_utc(base_ts + datetime.timedelta(seconds=item.device_timestamp))
-            item.status = 'cln' if no_reboots_found else 'drt'
-            item.dirty_ts = (item.status == 'drt')
-            if get_vid_from_gvid(item.variable_slug) == SYSTEM_VID['REBOOT']:
-                if no_reboots_found:
-                    no_reboots_found = False
-                logger.info('Base ts resetted to None after reboot={}'.format(item.incremental_id))
-                # Because we don't know any better at this poing, simple assume the begining of
-                # this block is the end of the next block (remember, we are going backwards)
-                end_of_block_dt = base_ts - datetime.timedelta(seconds=1)
-                logger.info('end_of_block_dt={0}, base_ts={1}'.format(end_of_block_dt, base_ts))
-                base_ts = None
+        # Only a handful of variables per report, so parse every variable slug once
+        vid_by_slug = {slug: get_vid_from_gvid(slug) for slug in set([item.variable_slug for item in entries])}
+        vids = [vid_by_slug[item.variable_slug] for item in entries]
+        device_timestamps = np.array([item.device_timestamp for item in entries], dtype=np.int64)
+        is_utc = np.array([item.has_utc_synchronized_device_timestamp for item in entries], dtype=bool)
+        # Do not fix TRIP START/END records. We will special handle them below
+        trip_vids = [SYSTEM_VID['TRIP_START'], SYSTEM_VID['TRIP_END']]
+        is_trip = np.array([vid in trip_vids for vid in vids], dtype=bool)
+        is_reboot = np.array([vid == SYSTEM_VID['REBOOT'] for vid in vids], dtype=bool)
+
+        to_fix = ~is_utc & ~is_trip
+        reboots = to_fix & is_reboot
+        # Block of every entry: the number of reboots to its right (a reboot belongs to the block it starts)
+        blocks = np.cumsum(reboots[::-1])[::-1] - reboots
+
+        # Base timestamp for every block, going backwards. A block is based on its right most entry
+        fix_indexes = np.flatnonzero(to_fix)
+        block_bases = []
+        if fix_indexes.size:
+            reversed_indexes = fix_indexes[::-1]
+            present_blocks, positions = np.unique(blocks[reversed_indexes], return_index=True)
+            last_index_in_block = dict(zip(present_blocks.tolist(), reversed_indexes[positions].tolist()))
+            block_base_ts = convert_to_utc(base_ts)
+            for block in range(int(blocks[fix_indexes[0]]) + 1):
+                if block:
+                    # Because we don't know any better at this point, simply assume the end
+                    # of this block is the beginning of the next block (remember, we are going backwards)
+                    end_of_block_dt = block_base_ts - datetime.timedelta(seconds=1)
+                    block_base_ts = end_of_block_dt - datetime.timedelta(
+                        seconds=int(device_timestamps[last_index_in_block[block]])
+                    )
+                    logger.info('end_of_block_dt={0}, base_ts={1}'.format(end_of_block_dt, block_base_ts))
+                block_bases.append(np.datetime64(block_base_ts.replace(tzinfo=None), 'us'))
+
+            fix_blocks = blocks[fix_indexes]
+            naive_timestamps = np.array(block_bases)[fix_blocks] + device_timestamps[fix_indexes].astype('timedelta64[s]')
+            for i, naive_ts, block in zip(fix_indexes.tolist(), naive_timestamps.tolist(), fix_blocks.tolist()):
+                item = entries[i]
+                item.timestamp = naive_ts.replace(tzinfo=pytz.utc)
+                item.status = 'drt' if block else 'cln'
+                item.dirty_ts = bool(block)
+
+        # If timestamp was already based on UTC (with the device RTC)
+        # then do not process reboot
+        for i in np.flatnonzero(is_utc).tolist():
+            item = entries[i]
+            item.status = 'utc'
+            item.dirty_ts = False
+            if item.timestamp is None:
+                # If timestamp is not set, set it here
+                item.timestamp = get_utc_read_data_timestamp(base_ts, item.device_timestamp)
+
+        contains_trip_system_data = bool((is_trip & ~is_utc).any())
+        logger.info('Fixed {0} entries in {1} blocks'.format(fix_indexes.size, len(block_bases)))
 
         if contains_trip_system_data:
             self._handle_trip_system_data()
@@ -138,22 +239,27 @@ class ProcessReportV2Action(ProcessReportBaseAction):
         # to clean. Only do this if we left if drt on the lagorithm above
         if self._data_entries[0].status == 'drt':
             logger.info('Cleaning up left most block')
-            # Get the base_ts of the previous report and use that
-            reports = self._streamer.reports.filter(incremental_id__lt=self._streamer_report.incremental_id, actual_last_id__gt=0)
-            if reports:
-                last_report = reports.order_by('incremental_id').last()
-                if last_report:
-                    base_ts = last_report.sent_timestamp - datetime.timedelta(seconds=last_report.device_sent_timestamp)
-                    for i in range(len(self._data_entries)):
-                        item = self._data_entries[i]
-                        assert item.streamer_local_id > last_report.actual_last_id
-                        if get_vid_from_gvid(item.variable_slug) == SYSTEM_VID['REBOOT']:
-                            break
-                        item.timestamp = convert_to_utc(base_ts + datetime.timedelta(seconds=item.device_timestamp))
-                        item.status = 'cln'
-                        item.dirty_ts = False
-                else:
-                    raise WorkerInternalError('Was not able to fetch last streamer report')
+            # Use the base_ts of the previous report, from the streamer time-base state if possible
+            base_ts = self._get_previous_report_base_ts()
+            previous_last_id = self._streamer.last_id
+            if base_ts is None:
+                reports = self._streamer.reports.filter(incremental_id__lt=self._streamer_report.incremental_id, actual_last_id__gt=0)
+                if reports:
+                    last_report = reports.order_by('incremental_id').last()
+                    if last_report:
+                        previous_last_id = last_report.actual_last_id
+                        base_ts = last_report.sent_timestamp - datetime.timedelta(seconds=last_report.device_sent_timestamp)
+                    else:
+                        raise WorkerInternalError('Was not able to fetch last streamer report')
+            if base_ts is not None:
+                for i in range(len(entries)):
+                    item = entries[i]
+                    assert item.streamer_local_id > previous_last_id
+                    if vids[i] == SYSTEM_VID['REBOOT']:
+                        break
+                    item.timestamp = convert_to_utc(base_ts + datetime.timedelta(seconds=item.device_timestamp))
+                    item.status = 'cln'
+                    item.dirty_ts = False
             else:
                 # If the device got just claimed, it may not have any previous reports.
                 # In that case, the left most block will stay based on the most right block
@@ -167,44 +273,21 @@ class ProcessReportV2Action(ProcessReportBaseAction):
         For every stream of type E2 (Unstructured Events with Data Pointer),
         Find all associated events, and for each, update its timestamp
         """
-        for stream in self._data_builder.get_cached_streams():
-            if stream and stream.enabled and stream.data_type == 'E2':
-                seq_ids = []
-                data_map = {}
-                for stream_data in self._data_entries:
-                    # If the data point has RTC synchronized timing, ignore
-                    if not stream_data.has_utc_synchronized_device_timestamp:
-                        if stream_data.stream_slug == stream.slug:
-                            seq_id = stream_data.int_value
-                            seq_ids.append(seq_id)
-                            data_map[seq_id] = stream_data
-                if seq_ids:
-                    event_qs = DataManager.filter_qs('event', streamer_local_id__in=seq_ids, stream_slug=stream.slug)
-                    # Django’s default behavior is to run in autocommit mode
-                    # An atomic transaction reduces this overhead
-                    unprocessed_seq_ids = []
-                    with transaction.atomic():
-                        for event in event_qs:
-                            data_item = data_map.pop(event.incremental_id, None)
-                            if data_item:
-                                logger.info('Updating event {} with timestamp from data {}'.format(
-                                    event.id, data_item.id
-                                ))
-                                event.timestamp = data_item.timestamp
-                                event.device_timestamp = data_item.device_timestamp
-                                DataManager.save('event', event)
-                            else:
-                                logger.warning(
-                                    'Found event without a data pointer: {}:{}'.format(
-                                        event.stream_slug, event.incremental_id
-                                    )
-                                )
-                                unprocessed_seq_ids.append(event.incremental_id)
-
-                    if unprocessed_seq_ids:
-                        sns_staff_notification('The following events for {} had no data pointer: {}'.format(
-                            stream.slug, str(unprocessed_seq_ids)
-                        ))
+        e2_slugs = set([
+            stream.slug for stream in self._data_builder.get_cached_streams()
+            if stream and stream.enabled and stream.data_type == 'E2'
+        ])
+        if not e2_slugs:
+            return
+
+        pointers = get_e2_data_pointers(self._data_entries, e2_slugs)
+        for stream_slug, stream_pointers in pointers.items():
+            updated, unprocessed_seq_ids = sync_e2_event_timestamps(stream_slug, stream_pointers)
+            if unprocessed_seq_ids:
+                logger.warning('Found events without a data pointer: {}:{}'.format(stream_slug, unprocessed_seq_ids))
+                sns_staff_notification('The following events for {} had no data pointer: {}'.format(
+                    stream_slug, str(unprocessed_seq_ids)
+                ))
 
     def _process_encoded_stream_data(self):
         """
@@ -214,14 +297,24 @@ class ProcessReportV2Action(ProcessReportBaseAction):
         :return: Nothing
         """
         msgs = []
-        for stream in self._data_builder.get_cached_streams():
-            if stream and stream.enabled and stream.is_encoded:
+        encoded_streams = [
+            stream for stream in self._data_builder.get_cached_streams()
+            if stream and stream.enabled and stream.is_encoded
+        ]
+        if not encoded_streams:
+            return
+
+        # Group the data of the encoded streams with a single pass, so every helper only sees its own stream
+        encoded_entries = {stream.slug: [] for stream in encoded_streams}
+        for stream_data in self._data_entries:
+            if stream_data.stream_slug in encoded_entries:
+                encoded_entries[stream_data.stream_slug].append(stream_data)
+
+        for stream in encoded_streams:
+            if encoded_entries[stream.slug]:
                 encoded_event_helper = EncodedStreamToEventDataHelper(stream)
-                for stream_data in self._data_entries:
-                    # The following function will create stream events when appropriate
-                    event = encoded_event_helper.process_data_point(stream_data)
-                    if event:
-                        self._event_entries.append(event)
+                # The following function will create stream events for every complete packet
+                self._event_entries += encoded_event_helper.process_data_points(encoded_entries[stream.slug])
 
                 if encoded_event_helper.error_count:
                     if self._streamer and self._streamer_report:
@@ -292,7 +385,8 @@ class ProcessReportV2Action(ProcessReportBaseAction):
         if self._count and (self._actual_first_id is not None) and (self._actual_last_id is not None):
 
             # Fixup any needed timestamps
-            self._handle_reboots_if_needed()
+            with self._profile_stage('reboot_fixup'):
+                self._handle_reboots_if_needed()
 
             # Because reboots exist on all streams, we need to remove them from user streams
             # to ensure we don't get duplicates
@@ -333,8 +427,8 @@ class ProcessReportV2Action(ProcessReportBaseAction):
                 self._streamer_report.actual_first_id = self._actual_first_id
                 self._streamer_report.actual_last_id = self._actual_last_id
                 self._streamer_report.save()
+                self._update_streamer_time_base(base_dt_utc)
                 self._streamer.last_id = self._streamer_report.actual_last_id
-                self._streamer.last_reboot_ts = base_dt_utc
                 self._streamer.save()
                 # Update Device Status for Hearthbeat notifications
                 if self._streamer_report.actual_last_id > device_status.last_known_id:
@@ -372,7 +466,8 @@ class ProcessReportV2Action(ProcessReportBaseAction):
         base_dt_utc = convert_to_utc(base_dt)
 
         # 1. Parse readings from report
-        self._read_stream_data(base_dt=base_dt, parser=parser)
+        with self._profile_stage('read_stream_data'):
+            self._read_stream_data(base_dt=base_dt, parser=parser)
 
         # 1.5. Ensure this is not a V/V1 selector
         if parser.header['streamer_selector'] == STREAMER_SELECTOR['USER_NO_REBOOTS']:
@@ -380,32 +475,38 @@ class ProcessReportV2Action(ProcessReportBaseAction):
             raise WorkerActionHardError('Unexpected selector for V2 engine: {}'.format(hex(STREAMER_SELECTOR['USER_NO_REBOOTS'])))
 
         # 2. Do any post-processing on the array of data data_entries
-        self._post_read_stream_data()
+        with self._profile_stage('post_read_stream_data'):
+            self._post_read_stream_data()
 
         # 3. Commit all stream data data_entries
-        self._commit_stream_data(parser=parser)
+        with self._profile_stage('commit_stream_data'):
+            self._commit_stream_data(parser=parser)
 
         # 4. If any stream is encoded, create stream events here
         # We are assuming devices with these functionality will also send user reports
         # with reboots merged, so we will need to be sure reboots get fixed on the data_entries
         # before we call this.
         # For now, don't worry about reboots
-        self._process_encoded_stream_data()
-        self._commit_stream_event_data()
+        with self._profile_stage('encoded_events'):
+            self._process_encoded_stream_data()
+            self._commit_stream_event_data()
 
         # 5. Update all associated records (e.g. streamer and streamer report)
-        self._update_streamer_and_streamer_report(parser=parser, base_dt_utc=base_dt_utc)
+        with self._profile_stage('update_streamer_and_report'):
+            self._update_streamer_and_streamer_report(parser=parser, base_dt_utc=base_dt_utc)
 
         if self._count:
             if self._chopped_report:
                 self._scheduled_chopped_report_fixup()
             else:
                 # 6. Schedule any additional tasks
-                filter_helper = FilterHelper()
-                filter_helper.process_filter_report(self._data_entries, self._all_stream_filters, user_slug=self._user.slug)
+                with self._profile_stage('filters'):
+                    filter_helper = FilterHelper()
+                    filter_helper.process_filter_report(self._data_entries, self._all_stream_filters, user_slug=self._user.slug)
 
                 # 7. For any stream.data_type == E2, update the associated StreamEvent records ts
-                self._syncup_e2_data()
+                with self._profile_stage('e2_sync'):
+                    self._syncup_e2_data()
 
             # Finally, forward the streamer report to any ArchFx Cloud (if enabled)
             ForwardStreamerReportAction.schedule(args={
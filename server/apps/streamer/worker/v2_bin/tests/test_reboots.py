@@ -206,6 +206,64 @@ class StreamerV2RebootsTestCase(TestMixin, TestCase):
         for point in action._data_entries[8:12]:
             self.assertEqual(point.status, 'cln')
 
+    def testTwoRebootWithTimeBaseState(self):
+        action = ProcessReportV2Action()
+        action._received_dt = parse_datetime('2016-09-28T10:00:00Z')
+        # Time-base state left by the previous report: sent at 09:54:00, 60sec after the device base
+        self.user_streamer1.last_id = 3
+        self.user_streamer1.last_base_ts = parse_datetime('2016-09-28T09:53:00Z')
+        self.user_streamer1.save()
+        action._streamer = self.user_streamer1
+        action._device = self.pd1
+        action._streamer_report = StreamerReport.objects.create(streamer=self.user_streamer1,
+                                                                original_first_id=5,
+                                                                original_last_id=12,
+                                                                device_sent_timestamp=240,
+                                                                sent_timestamp=action._received_dt,
+                                                                incremental_id=14,
+                                                                created_by=self.u1 )
+
+        helper = StreamDataBuilderHelper()
+        reboot_slug = get_reboot_slug(self.s1.project, self.s1.device, '5c00')
+        stream_payload = [
+            (self.s1.slug, 10, 5),
+            (self.s1.slug, 20, 6),
+            (reboot_slug, 2, 1),
+            (self.s1.slug, 10, 15),
+            (self.s1.slug, 20, 16),
+            (reboot_slug, 2, 1),
+            (self.s1.slug, 10, 25),
+        ]
+        action._data_entries = create_test_data(helper, stream_payload, 5)
+        # No need to look for previous reports (or data)
+        with self.assertNumQueries(0):
+            action._handle_reboots_if_needed()
+
+        self.assertEqual(action._data_entries[0].timestamp, parse_datetime('2016-09-28T09:53:10Z'))
+        self.assertEqual(action._data_entries[1].timestamp, parse_datetime('2016-09-28T09:53:20Z'))
+        for point in action._data_entries[0:2]:
+            self.assertEqual(point.status, 'cln')
+        for point in action._data_entries[2:5]:
+            self.assertEqual(point.status, 'drt')
+        for point in action._data_entries[5:7]:
+            self.assertEqual(point.status, 'cln')
+
+        # Update state with this report
+        action._reboot_ids = [7, 10]
+        action._actual_last_id = 11
+        action._update_streamer_time_base(convert_to_utc(parse_datetime('2016-09-28T09:56:00Z')))
+        self.assertEqual(self.user_streamer1.last_reboot_id, 10)
+        self.assertEqual(self.user_streamer1.last_base_ts, parse_datetime('2016-09-28T09:56:00Z'))
+
+        # An older report (processed out of order) does not move the time base back
+        self.user_streamer1.last_id = 11
+        action._reboot_ids = []
+        action._actual_last_id = 4
+        action._streamer_report.sent_timestamp = parse_datetime('2016-09-28T09:50:00Z')
+        action._update_streamer_time_base(convert_to_utc(parse_datetime('2016-09-28T09:46:00Z')))
+        self.assertEqual(self.user_streamer1.last_reboot_id, 10)
+        self.assertEqual(self.user_streamer1.last_base_ts, parse_datetime('2016-09-28T09:56:00Z'))
+
     def testRebootsWithNoPreviousReports(self):
         action = ProcessReportV2Action()
         action._received_dt = parse_datetime('2016-09-28T10:00:00Z')
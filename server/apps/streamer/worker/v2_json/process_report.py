@@ -12,7 +12,8 @@ from rest_framework.parsers import JSONParser
 from iotile_cloud.utils.gid import IOTileStreamSlug, IOTileVariableSlug
 
 from apps.physicaldevice.models import DeviceStatus
-from apps.sqsworker.exceptions import WorkerActionHardError, WorkerInternalError
+from apps.sqsworker.exceptions import WorkerActionHardError, WorkerActionSoftError, WorkerInternalError
+from apps.stream.metadata import StreamMetadataResolver
 from apps.streamdata.helpers import StreamDataBuilderHelper
 from apps.streamer.msg_pack import Python2CompatMessagePackParser
 from apps.streamer.serializers import StreamerReportJsonPostSerializer
@@ -168,6 +169,13 @@ class ProcessReportV2JsonAction(ProcessReportBaseAction):
         """
         Do a bulk commit for every event on the list
         """
+        failures = self._event_build_helper.upload_event_data()
+        if failures:
+            # Most likely a transient S3 error. Nothing has been committed yet, and every event
+            # has a fixed S3 key, so retry the whole report later
+            raise WorkerActionSoftError('Unable to upload data for {0} events: {1}'.format(
+                len(failures), ', '.join(['{0} ({1})'.format(key, error) for bucket, key, error in failures])
+            ))
         if self._event_entries:
             DataManager.bulk_create('event', self._event_entries)
 
@@ -248,8 +256,8 @@ class ProcessReportV2JsonAction(ProcessReportBaseAction):
                 self._streamer_report.actual_first_id = self._actual_first_id
                 self._streamer_report.actual_last_id = self._actual_last_id
                 self._streamer_report.save()
+                self._update_streamer_time_base(base_dt_utc)
                 self._streamer.last_id = self._streamer_report.actual_last_id
-                self._streamer.last_reboot_ts = base_dt_utc
                 self._streamer.save()
                 # Update Device Status for Hearthbeat notifications
                 if self._streamer_report.actual_last_id > device_status.last_known_id:
@@ -341,8 +349,12 @@ class ProcessReportV2JsonAction(ProcessReportBaseAction):
 
             self._initialize_device()
 
-            self._event_build_helper = StreamEventDataBuilderHelper()
-            self._data_build_helper = StreamDataBuilderHelper()
+            # Both helpers share the device streams, loaded with a single query
+            resolver = StreamMetadataResolver()
+            resolver.prefetch_device(self._device)
+            # Event data is uploaded to S3 (in parallel) right before the events are committed
+            self._event_build_helper = StreamEventDataBuilderHelper(parallel_uploads=True, resolver=resolver)
+            self._data_build_helper = StreamDataBuilderHelper(resolver=resolver)
 
             self._process_event_data()
             self._process_data()
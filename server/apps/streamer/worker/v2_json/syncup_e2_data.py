@@ -4,7 +4,6 @@ from pprint import pprint
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import transaction
 from django.utils.dateparse import parse_datetime
 
 from apps.sqsworker.action import Action
@@ -14,6 +13,8 @@ from apps.utils.aws.sns import sns_staff_notification
 from apps.utils.data_helpers.manager import DataManager
 from apps.utils.timezone_utils import formatted_ts
 
+from ..common.e2_sync import sync_e2_event_timestamps
+
 user_model = get_user_model()
 logger = logging.getLogger(__name__)
 
@@ -49,25 +50,18 @@ class SyncUpE2DataAction(Action):
                     'event', streamer_local_id__in=self._seq_ids, stream_slug=self._stream_slug
                 )
                 if data_qs.count() and event_qs.count():
-                    event_map = {}
-                    for event in event_qs:
-                        seq_id = event.incremental_id
-                        event_map[seq_id] = event
-
-                    logger.info('Processing {} events'.format(len(event_map.keys())))
-
-                    with transaction.atomic():
-                        for data in data_qs:
-                            if data.int_value in event_map:
-                                # Get event from event map, but also remove so we don't re-process
-                                event = event_map.pop(data.int_value)
-                                if event.timestamp != None:
-                                    event.timestamp = parse_datetime(formatted_ts(data.timestamp))
-                                    event.device_timestamp = data.device_timestamp
-                                    DataManager.save('event', event)
+                    pointers = {}
+                    for int_value, timestamp, device_timestamp in data_qs.values_list(
+                        'int_value', 'timestamp', 'device_timestamp'
+                    ):
+                        pointers.setdefault(int_value, (parse_datetime(formatted_ts(timestamp)), device_timestamp))
+
+                    logger.info('Processing {} events'.format(len(self._seq_ids)))
 
                     # Update array with any left off ids, in case we only got partial list
-                    self._seq_ids = event_map.keys()
+                    updated, self._seq_ids = sync_e2_event_timestamps(
+                        self._stream_slug, pointers, seq_ids=self._seq_ids, skip_events_with_no_timestamp=True
+                    )
                 else:
                     msg = 'SyncUpE2DataAction failed to find either events ({}) or data ({}) for {}'. format(
                         event_qs.count(), data_qs.count(), self._stream.slug
@@ -11,6 +11,7 @@ from django.utils.dateparse import parse_datetime
 
 from apps.physicaldevice.models import Device
 from apps.sensorgraph.models import SensorGraph
+from apps.sqsworker.exceptions import WorkerActionSoftError
 from apps.sqsworker.tests import QueueTestMock
 from apps.sqsworker.workerhelper import Worker
 from apps.stream.models import StreamId, StreamVariable
@@ -714,4 +715,16 @@ class StreamerV2JsonProcessReportTestCase(TestMixin, TestCase):
             self.assertEqual(streamer_report.original_last_id, 618915600)
             self.assertEqual(streamer_report.actual_first_id, 618913800)
             self.assertEqual(streamer_report.actual_last_id, 618915600)
-            self.assertEqual(streamer.last_id, 618915600)
\ No newline at end of file
+            self.assertEqual(streamer.last_id, 618915600)
+
+    @mock.patch('apps.utils.data_helpers.manager.DataManager.bulk_create')
+    def testEventUploadFailure(self, mock_bulk_create):
+        action = ProcessReportV2JsonAction()
+        action._event_entries = [StreamEventData(stream_slug=self.s1.slug, streamer_local_id=1)]
+        action._event_build_helper = mock.MagicMock()
+        action._event_build_helper.upload_event_data.return_value = [('bucket', 'key1', 'Timeout')]
+
+        # The report is retried later, and no event is committed without its data
+        with self.assertRaises(WorkerActionSoftError):
+            action._commit_stream_event_data()
+        self.assertEqual(mock_bulk_create.call_count, 0)
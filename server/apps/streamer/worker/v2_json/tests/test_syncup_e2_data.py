@@ -1,3 +1,4 @@
+import datetime
 import json
 import os
 from unittest import mock
@@ -19,6 +20,7 @@ from apps.streamevent.models import StreamEventData
 from apps.utils.test_util import TestMixin
 from apps.utils.timezone_utils import *
 
+from ...common.e2_sync import get_e2_data_pointers, sync_e2_event_timestamps
 from ...common.test_utils import *
 from ..syncup_e2_data import SyncUpE2DataAction
 
@@ -177,6 +179,55 @@ class SynupE2DataTestCase(TestMixin, TestCase):
         e2 = StreamEventData.objects.last()
         self.assertEqual(e2.timestamp, parse_datetime("2018-01-20T01:12:00Z"))
 
+    def testSyncE2EventTimestamps(self):
+        data_helper = StreamDataBuilderHelper()
+        data_entries = []
+        for i in range(10):
+            data_entries.append(data_helper.build_data_obj(
+                stream_slug=self.s1.slug,
+                streamer_local_id=10 + i,
+                device_timestamp=100 + i,
+                timestamp=parse_datetime("2017-01-10T10:00:00Z") + datetime.timedelta(seconds=i),
+                int_value=i + 1
+            ))
+        # Other streams are ignored
+        data_entries.append(data_helper.build_data_obj(
+            stream_slug='s--0000-0001--0000-0000-0000-0002--5020',
+            streamer_local_id=30,
+            timestamp=parse_datetime("2017-01-10T11:00:00Z"),
+            int_value=1
+        ))
+
+        pointers = get_e2_data_pointers(data_entries, set([self.s1.slug]))
+        self.assertEqual(list(pointers.keys()), [self.s1.slug])
+        self.assertEqual(len(pointers[self.s1.slug]), 10)
+        self.assertEqual(pointers[self.s1.slug][3], (parse_datetime("2017-01-10T10:00:02Z"), 102))
+
+        event_helper = StreamEventDataBuilderHelper()
+        event_entries = []
+        for i in range(12):
+            event_entries.append(event_helper.process_serializer_data({
+                "stream_slug": self.s1.slug,
+                "timestamp": "2018-01-20T00:00:00Z",
+                "streamer_local_id": i + 1,
+                "extra_data": {}
+            }))
+        StreamEventData.objects.bulk_create(event_entries)
+
+        # One query to read the events, and a single UPDATE
+        with self.assertNumQueries(2):
+            updated, no_pointer_seq_ids = sync_e2_event_timestamps(
+                self.s1.slug, pointers[self.s1.slug], seq_ids=list(range(1, 13))
+            )
+        self.assertEqual(len(updated), 10)
+        self.assertEqual(sorted(no_pointer_seq_ids), [11, 12])
+
+        e3 = StreamEventData.objects.get(stream_slug=self.s1.slug, streamer_local_id=3)
+        self.assertEqual(e3.timestamp, parse_datetime("2017-01-10T10:00:02Z"))
+        self.assertEqual(e3.device_timestamp, 102)
+        e11 = StreamEventData.objects.get(stream_slug=self.s1.slug, streamer_local_id=11)
+        self.assertEqual(e11.timestamp, parse_datetime("2018-01-20T00:00:00Z"))
+
     def testNoSyncUpIfE3(self):
 
         self.s1.data_type = 'E3'
@@ -168,12 +168,14 @@ class APIStreamEventDataViewSet(viewsets.ModelViewSet):
         raise PermissionDenied
 
     def perform_create(self, serializer):
-        helper = StreamEventDataBuilderHelper()
-        entries = []
         many = isinstance(serializer.validated_data, list)
+        # For multiple events, upload all event data at once (in parallel), after all access checks
+        helper = StreamEventDataBuilderHelper(parallel_uploads=many)
+        entries = []
 
         if many:
             count = 0
+            helper.prefetch_streams([item['stream_slug'] for item in serializer.validated_data])
             for item in serializer.validated_data:
                 event = helper.process_serializer_data(item, user_slug=self.request.user.slug)
                 if event and helper.user_has_write_access(event=event, user=self.request.user):
@@ -183,6 +185,8 @@ class APIStreamEventDataViewSet(viewsets.ModelViewSet):
                     if event:
                         raise PermissionDenied('Not allowed to upload to {0}'.format(event.stream_slug))
                     raise PermissionDenied('Stream not enabled {0}'.format(item['stream_slug']))
+            if helper.upload_event_data():
+                raise ValidationError('Unable to upload Event Data')
             logger.info('Committing batch of {0} data event entries'.format(count))
             if count:
                 StreamEventData.objects.bulk_create(entries)
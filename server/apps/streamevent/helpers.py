@@ -2,6 +2,7 @@ import logging
 import os
 import struct
 
+import numpy as np
 import structpp
 
 from django.shortcuts import get_object_or_404
@@ -10,10 +11,10 @@ from rest_framework.exceptions import ValidationError
 
 from apps.physicaldevice.models import Device
 from apps.project.models import Project
-from apps.stream.models import StreamId
+from apps.stream.metadata import StreamMetadataResolver
 from apps.streamfilter.cache_utils import cached_serialized_filter_for_slug
 from apps.streamfilter.process import FilterHelper
-from apps.utils.aws.s3 import upload_blob, upload_json_data_from_object
+from apps.utils.aws.s3 import S3ParallelUploader, upload_blob, upload_json_data_from_object
 from apps.utils.mdo.helpers import MdoHelper
 
 from .models import StreamEventData
@@ -26,18 +27,34 @@ class StreamEventDataBuilderHelper(object):
     _streams = {}
     _all_stream_filters = {}
     _has_access = {}
+    _uploader = None
+    _resolver = None
 
-    def __init__(self):
+    def __init__(self, parallel_uploads=False, resolver=None):
+        """
+        :param parallel_uploads: If True, event data is not uploaded by process_serializer_data,
+                                 but by upload_event_data (all at once)
+        :param resolver: StreamMetadataResolver to share with other helpers (a new one is used by default)
+        """
         self._streams = {}
         self._has_access = {}
+        self._resolver = resolver or StreamMetadataResolver()
+        if parallel_uploads:
+            self._uploader = S3ParallelUploader(upload_func=self._upload_event_data)
+
+    def _upload_event_data(self, bucket, key, data):
+        return upload_json_data_from_object(bucket=bucket, key=key, data=data)
 
     def _add_stream(self, stream_slug):
-        try:
-            stream = StreamId.objects.get(slug=stream_slug)
-        except StreamId.DoesNotExist:
-            stream = None
+        self._streams[stream_slug] = self._resolver.get_stream(stream_slug)
+
+    def prefetch_streams(self, slugs):
+        """
+        Load all given streams with a single query, before processing events for them
 
-        self._streams[stream_slug] = stream
+        :param slugs: iterable of stream slugs
+        """
+        self._resolver.prefetch(slugs)
 
     def get_cached_streams(self):
         return [self._streams[key] for key in self._streams.keys() ]
@@ -74,9 +91,12 @@ class StreamEventDataBuilderHelper(object):
 
             bucket = event.s3bucket
             key = event.s3key
-            success = upload_json_data_from_object(bucket=bucket, key=key, data=data)
-            if not success:
-                raise ValidationError('Unable to upload Event Data')
+            if self._uploader is not None:
+                self._uploader.add(bucket=bucket, key=key, data=data)
+            else:
+                success = self._upload_event_data(bucket=bucket, key=key, data=data)
+                if not success:
+                    raise ValidationError('Unable to upload Event Data')
 
         stream_slug = item['stream_slug']
         # Filter information is cached to avoid the multiple queries to form a filter
@@ -86,6 +106,16 @@ class StreamEventDataBuilderHelper(object):
             filter_helper.process_filter(event, this_filter, user_slug=user_slug)
         return event
 
+    def upload_event_data(self):
+        """
+        Upload the data of all events processed so far (only if parallel_uploads is set)
+
+        :return: list of (bucket, key, error) for every upload that failed
+        """
+        if self._uploader is None:
+            return []
+        return self._uploader.run()
+
     def manual_file_upload(self, event, fp):
         filename = str(fp)
         logger.debug('[APIStreamEventUploadView] filename: {}'.format(filename))
@@ -176,6 +206,13 @@ class EncodedStreamToEventDataHelper(object):
         self._decoder = var_type.decoder
         assert self._decoder
         self.error_count = 0
+        # The decoding format and packer are the same for every packet
+        self._decoding_format = '<' + ''.join(self._decoder.packet_info['decoding'])
+        try:
+            self._packer = struct.Struct(self._decoder.raw_packet_format)
+        except struct.error as e:
+            logger.error(e)
+            self._packer = None
 
         self._begin(None)
 
@@ -226,16 +263,13 @@ class EncodedStreamToEventDataHelper(object):
 
         values = [point.int_value for point in self._packet]
         try:
-            blob = struct.pack(self._decoder.raw_packet_format, *values)
+            blob = self._packer.pack(*values)
         except Exception as e:
             logger.error(e)
             return {}
 
         # Now decode using the decoder's packer info for this SG
-        raw_format = '<'
-        for item in self._decoder.packet_info['decoding']:
-            raw_format += item
-        extra_data = structpp.unpack(raw_format, blob, asdict=True)
+        extra_data = structpp.unpack(self._decoding_format, blob, asdict=True)
 
         if 'transform' in self._decoder.packet_info and self._decoder.packet_info['transform']:
             # Do some MDO processing or mapping to strings
@@ -288,3 +322,53 @@ class EncodedStreamToEventDataHelper(object):
         else:
             self._packet.append(stream_data)
         return None
+
+    def process_data_points(self, data_entries):
+        """
+        Batch version of process_data_point, for the data of this helper's stream only.
+        Packet boundaries (P-0 and P-1 elements) are found with a single vectorized pass
+        over the entry types, and every packet is then decoded from its own slice of entries.
+        Any packet left open is kept, so a following call (or process_data_point) can complete it
+
+        :param data_entries: list of StreamData for this stream, in streamer_local_id order
+        :return: list of new StreamEventData
+        """
+        # Continue with any open packet from previous calls
+        entries = ([self._start] if self._start else []) + self._packet + list(data_entries)
+        if not entries:
+            return []
+
+        types = np.array([stream_data.type for stream_data in entries], dtype=object)
+        begin_idx = np.flatnonzero(types == 'P-0')
+        end_idx = np.flatnonzero(types == 'P-1')
+        element_mask = (types != 'P-0') & (types != 'P-1')
+
+        def _elements(first, last):
+            # Packet data elements in entries[first:last]
+            return [entries[i] for i in (first + np.flatnonzero(element_mask[first:last])).tolist()]
+
+        events = []
+        # For every END, the packet starts at the closest BEGIN before it (if any)
+        start_pos = np.searchsorted(begin_idx, end_idx) - 1
+        for end, pos in zip(end_idx.tolist(), start_pos.tolist()):
+            if pos < 0:
+                self._start = None
+                self._packet = _elements(0, end)
+            else:
+                begin = int(begin_idx[pos])
+                self._start = entries[begin]
+                self._packet = _elements(begin + 1, end)
+            event = self._end(entries[end])
+            if event:
+                events.append(event)
+
+        # Leave the helper in the same state process_data_point would have
+        if begin_idx.size:
+            last_begin = int(begin_idx[-1])
+            self._start = entries[last_begin]
+            self._packet = _elements(last_begin + 1, len(entries))
+        else:
+            self._start = None
+            self._packet = _elements(0, len(entries))
+
+        return events
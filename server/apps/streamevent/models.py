@@ -21,6 +21,49 @@ SNS_DELETE_S3 = getattr(settings, 'SNS_DELETE_S3')
 logger = logging.getLogger(__name__)
 
 
+def get_event_s3_bucket(format_version):
+    """
+    S3 bucket of a StreamEventData (see StreamEventData.s3bucket),
+    for callers that only read the required columns (i.e. with values_list)
+    """
+    # For v1, s3 Bucket is hard-coded to a single location based on
+    # STREAM_EVENT_DATA_BUCKET_NAME.
+    # If we ever need to use different locations, this property
+    # should become a real table column in the database
+    if format_version <= 2:
+        return getattr(settings, 'STREAM_EVENT_DATA_BUCKET_NAME')
+    return None
+
+
+def get_event_s3_key(uuid, stream_slug, s3_key_path, ext, format_version):
+    """
+    S3 key of a StreamEventData (see StreamEventData.s3key),
+    for callers that only read the required columns (i.e. with values_list)
+    """
+    if format_version == 2 and s3_key_path != '':
+        # For v2, s3 path is stored on the record itself and constructed
+        # as /<type>/2017/08/31/08/<uuid>.<ext>
+        key_template = getattr(settings, 'STREAM_EVENT_DATA_S3_KEY_FORMAT_V2')
+        return key_template.format(path=s3_key_path, id=str(uuid), ext=ext)
+    elif format_version == 1 and stream_slug:
+        # For v1, s3 Key is hard-coded to a predefined format based on
+        # STREAM_EVENT_DATA_S3_KEY_FORMAT.
+        key_template = getattr(settings, 'STREAM_EVENT_DATA_S3_KEY_FORMAT_V1')
+
+        # HACK BEGIN For blocks, need to use the original stream ID
+        stream_slug = IOTileStreamSlug(stream_slug)
+        parts = stream_slug.get_parts()
+        block_slug = IOTileBlockSlug(parts['device'])
+        device_slug = IOTileDeviceSlug(block_slug.get_id())
+        project_slug = IOTileProjectSlug(parts['project'])
+        variable_slug = IOTileVariableSlug(parts['variable'])
+        stream_slug.from_parts(project_slug, device_slug, variable_slug)
+        # HACK END
+
+        return key_template.format(slug=str(stream_slug), id=str(uuid), ext=ext)
+    return None
+
+
 class StreamEventData(StreamDataBase):
     # We need a UUID to use on the s3 key. Cannot just use the record
     # id as the id is not known until after the record is committed to
@@ -57,38 +100,11 @@ class StreamEventData(StreamDataBase):
 
     @property
     def s3bucket(self):
-        # For v1, s3 Bucket is hard-coded to a single location based on
-        # STREAM_EVENT_DATA_BUCKET_NAME.
-        # If we ever need to use different locations, this property
-        # should become a real table column in the database
-        if self.format_version <= 2:
-            return getattr(settings, 'STREAM_EVENT_DATA_BUCKET_NAME')
-        return None
+        return get_event_s3_bucket(self.format_version)
 
     @property
     def s3key(self):
-        if self.format_version == 2 and self.s3_key_path != '':
-            # For v2, s3 path is stored on the record itself and constructed
-            # as /<type>/2017/08/31/08/<uuid>.<ext>
-            key_template = getattr(settings, 'STREAM_EVENT_DATA_S3_KEY_FORMAT_V2')
-            return key_template.format(path=self.s3_key_path, id=str(self.uuid), ext=self.ext)
-        elif self.format_version == 1 and self.stream_slug:
-            # For v1, s3 Key is hard-coded to a predefined format based on
-            # STREAM_EVENT_DATA_S3_KEY_FORMAT.
-            key_template = getattr(settings, 'STREAM_EVENT_DATA_S3_KEY_FORMAT_V1')
-
-            # HACK BEGIN For blocks, need to use the original stream ID
-            stream_slug = IOTileStreamSlug(self.stream_slug)
-            parts = stream_slug.get_parts()
-            block_slug = IOTileBlockSlug(parts['device'])
-            device_slug = IOTileDeviceSlug(block_slug.get_id())
-            project_slug = IOTileProjectSlug(parts['project'])
-            variable_slug = IOTileVariableSlug(parts['variable'])
-            stream_slug.from_parts(project_slug, device_slug, variable_slug)
-            # HACK END
-
-            return key_template.format(slug=str(stream_slug), id=str(self.uuid), ext=self.ext)
-        return None
+        return get_event_s3_key(self.uuid, self.stream_slug, self.s3_key_path, self.ext, self.format_version)
 
     @property
     def url(self):
@@ -366,3 +366,51 @@ class EncodedStreamHelperTestCase(TestMixin, TestCase):
 
 
 
+
+    def testProcessDataPoints(self):
+        var_type = VarType.objects.create(
+            name='Accelerometer',
+            storage_units_full='Encoded',
+            created_by=self.u
+        )
+        VarTypeDecoder.objects.create(var_type=var_type, created_by=self.u,
+                                      raw_packet_format='<LL',
+                                      packet_info={
+                                          'decoding': [
+                                              "l{k1}",
+                                              "H{k2}",
+                                              "h{k3}",
+                                          ]
+                                        })
+        s1 = StreamId.objects.create(device=self.d, variable=self.v, project=self.p, var_type=var_type,
+                                     created_by=self.u, mdo_type = 'V')
+
+        t0 = dateutil.parser.parse('2016-09-28T10:00:00Z')
+        data_stream = self._add_dummy_data(stream=s1, ts=t0, dts=20, sigid=5, data=[0xFFFFFFFB, 0x00020001])
+        data_stream += self._add_dummy_data(stream=s1, ts=t0, dts=80, sigid=9, data=[0xFFFFFFFB, 0xFFFB0001])
+        # Last packet is incomplete
+        data_stream += self._add_dummy_data(stream=s1, ts=t0, dts=90, sigid=13, data=[0x1, 0x2])[0:2]
+        self.assertEqual(len(data_stream), 10)
+
+        helper = EncodedStreamToEventDataHelper(s1)
+        events = helper.process_data_points(data_stream)
+        self.assertEqual(len(events), 2)
+        self.assertEqual(events[0].incremental_id, 5)
+        self.assertEqual(events[0].extra_data['k3'], 2)
+        self.assertEqual(events[1].incremental_id, 9)
+        self.assertEqual(events[1].device_timestamp, 80)
+        self.assertEqual(events[1].extra_data['k1'], -5)
+        self.assertEqual(events[1].extra_data['k3'], -5)
+
+        # The open packet can be completed later
+        end = self._add_dummy_data(stream=s1, ts=t0, dts=90, sigid=13, data=[0x1, 0x2])[2:]
+        events = helper.process_data_points(end)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].incremental_id, 13)
+        self.assertEqual(events[0].extra_data['k1'], 1)
+
+        # Same results as processing one point at a time
+        one_by_one = EncodedStreamToEventDataHelper(s1)
+        events = [one_by_one.process_data_point(point) for point in data_stream + end]
+        events = [event for event in events if event]
+        self.assertEqual([e.incremental_id for e in events], [5, 9, 13])
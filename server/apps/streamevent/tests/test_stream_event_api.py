@@ -66,6 +66,7 @@ class StreamEventAPITests(TestMixin, TestStreamAliasHelper, APITestCase):
             cache.clear()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamFilterAction.objects.all().delete()
         StreamFilterTrigger.objects.all().delete()
         StreamFilter.objects.all().delete()
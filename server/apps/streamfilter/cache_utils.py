@@ -3,76 +3,84 @@ import logging
 from django.conf import settings
 from django.core.cache import cache
 
+from apps.stream.models import StreamId
+from apps.utils.local_cache import LocalCache
+
+from .cache_version import bump_filter_cache_version, get_filter_cache_version
 from .models import StreamFilter
 from .serializers import StreamFilterSerializer
 
 logger = logging.getLogger(__name__)
 
+# Filters and negative entries are invalidated through the filter cache version,
+# so the timeout only limits how long unused entries stay in the cache
+FILTER_CACHE_TIMEOUT = 3000
+
 
 _stream_filter_format = lambda elements: '--'.join(['f', ] + elements[1:])
 _project_filter_format = lambda elements: '--'.join(['f', elements[1], '', elements[3]])
 
 
-def _get_filter_cache_key(slug):
-    return ':'.join(['filter', slug])
+# Stream slug versioned cache key -> serialized filter for the stream ({'empty': True} if none)
+_local_filters = LocalCache(max_entries=4096)
 
 
-def _get_cached_filter(key):
-    if cache:
-        key = _get_filter_cache_key(key)
-        result = cache.get(key)
-        if result:
-            logger.debug('StreamFilter: cache(HIT)={0}'.format(key))
-            return result
-    return None
+def _get_filter_cache_key(slug):
+    return ':'.join(['filter', slug])
 
 
-def _cache_filter(key, obj):
-    serializer = StreamFilterSerializer(obj)
-    data = serializer.data
-    if cache:
-        key = _get_filter_cache_key(key)
-        logger.info('StreamFilter: cache(SET)={0}'.format(key))
-        cache.set(key, data, timeout=3000)
-    return data
+def _get_versioned_filter_cache_key(slug, version):
+    return ':'.join([_get_filter_cache_key(slug), version])
 
 
 def _cached_serialized_filter_for_slug_elements(elements):
     assert(len(elements) == 4)
-
-    # 1.- Check if results are already on the cache for a stream
     filter_stream_slug = _stream_filter_format(elements)
-    result = _get_cached_filter(filter_stream_slug)
+    filter_project_slug = _project_filter_format(elements)
+
+    if not cache:
+        return _serialized_filter_from_db(filter_stream_slug, filter_project_slug)
+
+    # All keys include the project's filter cache version, so any filter change in the project
+    # invalidates all of them (including the negative entries), on all processes
+    version = get_filter_cache_version(filter_stream_slug)
+    stream_key = _get_versioned_filter_cache_key(filter_stream_slug, version)
+    project_key = _get_versioned_filter_cache_key(filter_project_slug, version)
+
+    # 1.- Check the in-process cache, which keeps the result (filter or {'empty': True}) for each stream
+    result = _local_filters.get(stream_key)
     if result:
         return result
 
-    # 2.- Check cache again, but now for a project filter
-    filter_project_slug = _project_filter_format(elements)
-    result = _get_cached_filter(filter_project_slug)
+    # 2.- Check the shared cache, first for a stream and then for a project filter, with a single request
+    results = cache.get_many([stream_key, project_key])
+    result = results.get(stream_key) or results.get(project_key)
     if result:
-        return result
+        logger.debug('StreamFilter: cache(HIT)={0}'.format(filter_stream_slug))
+    else:
+        # ======================== Not found in Cache. Read from Database
+        result = _serialized_filter_from_db(filter_stream_slug, filter_project_slug)
+        if 'empty' in result or result['slug'] == filter_stream_slug:
+            key = stream_key
+        else:
+            key = project_key
+        logger.info('StreamFilter: cache(SET)={0}'.format(key))
+        cache.set(key, result, timeout=FILTER_CACHE_TIMEOUT)
 
-    # ======================== Not found in Cache. Read from Database
+    _local_filters.set(stream_key, result, timeout=getattr(settings, 'STREAM_FILTER_LOCAL_CACHE_TIMEOUT'))
+    return result
 
-    # 3.- First, see if there is a filter defined for the full stream slug
-    obj = None
-    try:
-        obj = StreamFilter.objects.get(slug=filter_stream_slug)
-        return _cache_filter(filter_stream_slug, obj)
-    except StreamFilter.DoesNotExist:
-        logger.info('StreamFilter not found for Stream {}'.format(filter_stream_slug))
 
-    # 4.- If not, check for a project wide filter
-    if not obj:
-        try:
-            obj = StreamFilter.objects.get(slug=filter_project_slug)
-            return _cache_filter(filter_project_slug, obj)
-        except StreamFilter.DoesNotExist:
-            logger.info('StreamFilter not found for Project {}'.format(filter_project_slug))
+def _serialized_filter_from_db(filter_stream_slug, filter_project_slug):
+    # A filter defined for the full stream slug has priority over a project wide filter
+    filters = {
+        f.slug: f for f in StreamFilter.objects.filter(slug__in=[filter_stream_slug, filter_project_slug])
+    }
+    for slug in [filter_stream_slug, filter_project_slug]:
+        if slug in filters:
+            return StreamFilterSerializer(filters[slug]).data
 
-    if cache:
-        logger.info('StreamFilter: cache(SET-EMPTY)={0}'.format(filter_stream_slug))
-        cache.set(_get_filter_cache_key(filter_stream_slug), {'empty': True})
+    logger.info('StreamFilter not found for Stream {0} or Project {1}'.format(filter_stream_slug, filter_project_slug))
     return {'empty': True}
 
 
@@ -87,15 +95,33 @@ def cached_serialized_filter_for_gsid(gsid):
 
 
 def clear_serialized_filter_for_slug(slug):
-    key = _get_filter_cache_key(slug)
-    logger.info('Attempting to delete cache entries for {0} ({1})'.format(key, slug))
+    logger.info('Attempting to clear cache entries for {0}'.format(slug))
     if cache:
-        if cache.get(key):
-            logger.info('Cache: Deleting{}'.format(key))
-            cache.delete(key)
-        state_key_patern = get_current_state_cache_pattern(slug)
-        logger.info('Cache: Deleting {}'.format(state_key_patern))
-        cache.delete_pattern(state_key_patern)
+        bump_filter_cache_version(slug)
+        state_keys = [_get_current_state_cache_key(stream_slug) for stream_slug in _get_filter_stream_slugs(slug)]
+        logger.info('Cache: Deleting {} current state(s)'.format(len(state_keys)))
+        cache.delete_many(state_keys)
+        if slug.split('--')[2] == '':
+            # A project filter also applies to streams with no StreamId (i.e. with data only)
+            state_key_patern = get_current_state_cache_pattern(slug)
+            logger.info('Cache: Deleting {}'.format(state_key_patern))
+            try:
+                cache.delete_pattern(state_key_patern)
+            except Exception:
+                logger.warning('Cannot delete current states: delete_pattern not available')
+
+
+def _get_filter_stream_slugs(slug):
+    # Given a filter slug, which could represent a project filter slug
+    # return the slugs of all streams the filter applies to
+    elements = slug.split('--')
+    assert(len(elements) == 4)
+    if elements[2] == '':
+        qs = StreamId.objects.filter(
+            slug__startswith='--'.join(['s', elements[1], '']), slug__endswith='--'.join(['', elements[3]])
+        )
+        return list(qs.values_list('slug', flat=True))
+    return ['--'.join(['s', ] + elements[1:])]
 
 
 def _get_current_state_cache_key(slug):
@@ -118,6 +144,32 @@ def set_current_cached_filter_state_for_slug(slug, state):
         cache.set(key=key, value=state, timeout=None)
 
 
+def get_current_cached_filter_states_for_slugs(slugs):
+    """
+    Get the current filter state for several streams, with a single cache request
+
+    :param slugs: list of stream slugs
+    :return: dict of stream slug -> current state (or None)
+    """
+    result = {slug: None for slug in slugs}
+    if cache and slugs:
+        keys = {_get_current_state_cache_key(slug): slug for slug in slugs}
+        for key, value in cache.get_many(list(keys.keys())).items():
+            result[keys[key]] = value
+    return result
+
+
+def set_current_cached_filter_states(states):
+    """
+    Set the current filter state for several streams, with a single cache request
+
+    :param states: dict of stream slug -> state
+    """
+    if cache and states:
+        # Never expires
+        cache.set_many({_get_current_state_cache_key(slug): state for slug, state in states.items()}, timeout=None)
+
+
 def get_current_state_cache_pattern(slug):
     # Given a filter slug, which could represent a project filter slug
     # return all current_state instances in the cache
@@ -0,0 +1,65 @@
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.utils.local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+# Project slug -> current filter cache version, as last read from the cache.
+# Entries expire after STREAM_FILTER_CACHE_VERSION_CHECK_INTERVAL seconds, so a change
+# made by another process is seen, at most, that many seconds later
+_local_versions = LocalCache(max_entries=4096)
+
+
+def _get_project_key(slug):
+    # Works for both stream and filter slugs: [s|f]--<projectID>--<deviceID>--<variableID>
+    elements = slug.split('--')
+    assert(len(elements) == 4)
+    return elements[1]
+
+
+def _get_filter_version_cache_key(project_key):
+    return ':'.join(['filter-version', project_key])
+
+
+def get_filter_cache_version(slug):
+    """
+    Version of the filter cache for the project a stream or filter belongs to.
+    Versions are random tokens, so a version is never reused (even after the cache is cleared)
+
+    :param slug: Stream or StreamFilter slug
+    :return: version string, or None if there is no cache
+    """
+    if not cache:
+        return None
+    project_key = _get_project_key(slug)
+    version = _local_versions.get(project_key)
+    if version is None:
+        key = _get_filter_version_cache_key(project_key)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(key)
+        _local_versions.set(
+            project_key, version, timeout=getattr(settings, 'STREAM_FILTER_CACHE_VERSION_CHECK_INTERVAL')
+        )
+    return version
+
+
+def bump_filter_cache_version(slug):
+    """
+    Invalidate all cached filters (positive and negative entries, on all tiers and all processes)
+    for the project a stream or filter belongs to, without having to find or delete any key
+
+    :param slug: Stream or StreamFilter slug
+    """
+    if not cache:
+        return
+    project_key = _get_project_key(slug)
+    version = uuid.uuid4().hex
+    logger.debug('StreamFilter: cache(VERSION)={0}:{1}'.format(project_key, version))
+    cache.set(_get_filter_version_cache_key(project_key), version, timeout=None)
+    _local_versions.delete(project_key)
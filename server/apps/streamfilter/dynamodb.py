@@ -79,3 +79,27 @@ def create_filter_log(target_slug, timestamp, src, dst, triggers):
     except Exception as e:
         logging.error('Error creating filter log: %s' % str(e))
     return None
+
+
+def create_filter_logs(logs):
+    """
+    Batch version of create_filter_log
+
+    :param logs: list of dicts with target_slug, timestamp, src, dst and triggers
+    :return: list of filter log IDs
+    """
+    if not getattr(settings, 'USE_DYNAMODB_FILTERLOG_DB') or not logs:
+        return []
+    filter_ids = []
+    try:
+        with DynamoFilterLogModel.batch_write() as batch:
+            for attributes in logs:
+                if not attributes['src']:
+                    attributes = dict(attributes, src='*')
+                filter_id = uuid.uuid4()
+                batch.save(DynamoFilterLogModel(uuid=str(filter_id), **attributes))
+                filter_ids.append(filter_id)
+    except Exception as e:
+        logging.error('Error creating filter logs: %s' % str(e))
+        return []
+    return filter_ids
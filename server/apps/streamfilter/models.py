@@ -18,6 +18,7 @@ from apps.utils.gid.convert import formatted_gfid
 from apps.vartype.models import VarTypeOutputUnit
 
 from .actions.types import *
+from .cache_version import bump_filter_cache_version
 from .processing.trigger import evaluate_trigger
 
 AUTH_USER_MODEL = getattr(settings, 'AUTH_USER_MODEL')
@@ -27,7 +28,7 @@ logger = logging.getLogger(__name__)
 def delete_serialized_filter_cache_for_slug(slug):
     if cache:
         logger.debug('StreamFilter: cache(DELETE)={0}'.format(slug))
-        cache.delete(slug)
+        bump_filter_cache_version(slug)
 
 
 class StreamFilterManager(Manager):
@@ -331,3 +332,18 @@ def post_save_state_transition_callback(sender, **kwargs):
     transition = kwargs['instance']
     logger.debug('post-save-state: {0}'.format(transition.filter.slug))
     delete_serialized_filter_cache_for_slug(transition.filter.slug)
+
+
+@receiver(post_save, sender=StreamFilterTrigger)
+def post_save_trigger_callback(sender, **kwargs):
+    trigger = kwargs['instance']
+    logger.debug('post-save-trigger: {0}'.format(trigger.filter.slug))
+    delete_serialized_filter_cache_for_slug(trigger.filter.slug)
+
+
+@receiver(post_save, sender=StreamFilterAction)
+def post_save_action_callback(sender, **kwargs):
+    action = kwargs['instance']
+    if action.state and action.state.filter:
+        logger.debug('post-save-action: {0}'.format(action.state.filter.slug))
+        delete_serialized_filter_cache_for_slug(action.state.filter.slug)
@@ -6,8 +6,12 @@ from apps.streamfilter.models import StreamFilter
 from apps.utils.data_helpers.manager import DataManager
 
 from .actions.factory import action_factory
-from .cache_utils import get_current_cached_filter_state_for_slug, set_current_cached_filter_state_for_slug
-from .dynamodb import create_filter_log
+from .cache_utils import (
+    get_current_cached_filter_state_for_slug, get_current_cached_filter_states_for_slugs,
+    set_current_cached_filter_state_for_slug, set_current_cached_filter_states,
+)
+from .dynamodb import create_filter_log, create_filter_logs
+from .processing.compiled import CompiledFilter
 from .processing.trigger import evaluate_cached_transition
 
 # Get an instance of a logger
@@ -23,6 +27,12 @@ class FilterHelper(object):
         self.skip_dynamo_logs = skip_dynamo_logs
         self.filter_dict = None
         self.derived_data = []
+        self._compiled_filters = {}
+        # Only set while processing a report (see process_filter_report). Otherwise, states are
+        # read from and written to the cache, and logs are created, for every transition
+        self._current_states = None
+        self._modified_states = {}
+        self._filter_logs = None
 
     def _create_derived_data(self):
         if len(self.derived_data) > 0:
@@ -34,15 +44,8 @@ class FilterHelper(object):
                 DataManager.bulk_create('data', self.derived_data)
 
     def _transition_should_execute(self, src, dst, current_state, transition, data):
-        if src:
-            # if the transition has a src and dst, then this transition should only be consider if the
-            # transition src is the current state
-            if current_state and src['slug'] != current_state:
-                return False
-        else:
-            # If there is no src state, then only transition if current_state is different that dst state
-            if current_state and current_state == dst['slug']:
-                return False
+        if not CompiledFilter.transition_allowed(src, dst, current_state):
+            return False
 
         """
         If data is a StreamData instance, evaluate triggers of the transition
@@ -54,6 +57,49 @@ class FilterHelper(object):
         elif DataManager.is_instance('event', data):
             return True
 
+    def _get_compiled_filter(self, cached_filter):
+        compiled = self._compiled_filters.get(cached_filter['slug'])
+        if compiled is None or compiled.source is not cached_filter:
+            compiled = CompiledFilter(cached_filter)
+            self._compiled_filters[cached_filter['slug']] = compiled
+        return compiled
+
+    def _get_current_state(self, stream_slug):
+        if self._current_states is None:
+            return get_current_cached_filter_state_for_slug(stream_slug)
+        return self._current_states.get(stream_slug)
+
+    def _set_current_state(self, stream_slug, state):
+        if self._current_states is None:
+            set_current_cached_filter_state_for_slug(stream_slug, state)
+        else:
+            self._current_states[stream_slug] = state
+            self._modified_states[stream_slug] = state
+
+    def _log_transition(self, stream_slug, timestamp, src_label, dst_label, triggers):
+        if self.skip_dynamo_logs:
+            return
+        if self._filter_logs is None:
+            create_filter_log(stream_slug, timestamp, src_label, dst_label, triggers)
+        else:
+            self._filter_logs.append({
+                'target_slug': stream_slug,
+                'timestamp': timestamp,
+                'src': src_label,
+                'dst': dst_label,
+                'triggers': triggers,
+            })
+
+    def _flush_report_state(self):
+        """Write back all filter states changed during the report, and the transition logs"""
+        if self._modified_states:
+            set_current_cached_filter_states(self._modified_states)
+        if self._filter_logs:
+            create_filter_logs(self._filter_logs)
+        self._current_states = None
+        self._modified_states = {}
+        self._filter_logs = None
+
     def _execute_action_if_needed(self, slug, transition, state, data, action_on, user_slug=None):
         if not state:
             return
@@ -83,75 +129,78 @@ class FilterHelper(object):
         """
         # 1.- Check if filter available for stream
         if cached_filter:
-            states = cached_filter['states']
-            states_map = {}
-            for state in states:
-                states_map[state['id']] = state
-            for transition in cached_filter['transitions']:
-                src = None
-                assert transition['dst'] in states_map
-                dst = states_map[transition['dst']]
-                assert dst
-                if 'src' in transition and transition['src'] and transition['src'] in states_map:
-                    src = states_map[transition['src']]
-                current_state = get_current_cached_filter_state_for_slug(data.stream_slug)
-
-                if self._transition_should_execute(src, dst, current_state, transition, data):
-                    if src and 'label' in src and src['label']:
-                        src_label = src['label']
-                    elif current_state:
-                        src_label = current_state
-                    else:
-                        src_label = '*'
-                    logger.info('--> Transition from {0} to {1}: {2}'.format(src_label, dst['slug'], data.stream_slug))
-                    if not self.skip_dynamo_logs:
-                        create_filter_log(
-                            data.stream_slug, data.timestamp, src_label, dst['label'], transition['triggers']
-                        )
-
-                    # Execute any actions on state exit
-                    if src:
-                        self._execute_action_if_needed(
-                            slug=cached_filter['slug'],
-                            transition=transition,
-                            state=src,
-                            data=data,
-                            action_on='exit',
-                            user_slug=user_slug,
-                        )
-                    # Execute any actions on state entry
+            compiled = self._get_compiled_filter(cached_filter)
+            current_state = self._get_current_state(data.stream_slug)
+            """
+            If data is a StreamData instance, evaluate triggers of the transition
+            If data is a StreamEventData instance, no value to evaluate, the transition is triggered in all case
+            """
+            is_data = DataManager.is_instance('data', data)
+            if not is_data and not DataManager.is_instance('event', data):
+                return cached_filter
+
+            for transition, src, dst in compiled.get_candidate_transitions(current_state):
+                if is_data and not evaluate_cached_transition(transition, data.value):
+                    continue
+
+                if src and 'label' in src and src['label']:
+                    src_label = src['label']
+                elif current_state:
+                    src_label = current_state
+                else:
+                    src_label = '*'
+                logger.info('--> Transition from {0} to {1}: {2}'.format(src_label, dst['slug'], data.stream_slug))
+                self._log_transition(data.stream_slug, data.timestamp, src_label, dst['label'], transition['triggers'])
+
+                # Execute any actions on state exit
+                if src:
                     self._execute_action_if_needed(
-                        slug=cached_filter['slug'],
+                        slug=compiled.slug,
                         transition=transition,
-                        state=dst,
+                        state=src,
                         data=data,
-                        action_on='entry',
+                        action_on='exit',
                         user_slug=user_slug,
                     )
-
-                    # Finally, Udate filter current state and log transition
-                    set_current_cached_filter_state_for_slug(data.stream_slug, dst['slug'])
-
-                    # Currentry only ever executing on transition, so if found, exit
-                    return cached_filter
+                # Execute any actions on state entry
+                self._execute_action_if_needed(
+                    slug=compiled.slug,
+                    transition=transition,
+                    state=dst,
+                    data=data,
+                    action_on='entry',
+                    user_slug=user_slug,
+                )
+
+                # Finally, Udate filter current state and log transition
+                self._set_current_state(data.stream_slug, dst['slug'])
+
+                # Currentry only ever executing on transition, so if found, exit
+                return cached_filter
 
         return cached_filter
 
     def process_filter_report(self, entries, all_stream_filters, user_slug=None):
         # filter_dict contains only non null filters
         self.filter_dict = {}
-        initial_states = {}
         for stream_slug, f in all_stream_filters.items():
             # if value:
             if 'empty' not in f:
                 self.filter_dict[stream_slug] = f
-                initial_states[f['slug']] = get_current_cached_filter_state_for_slug(stream_slug)
         if len(self.filter_dict) > 0:
             logger.info('{} filters found! Starting filter process...'.format(len(self.filter_dict)))
-            for data in entries:
-                # filters[data.stream_slug] isn't in filters if there is no filter for data.stream_slug
-                if data.stream_slug in self.filter_dict:
-                    self.process_filter(data, self.filter_dict[data.stream_slug], user_slug=user_slug)
+            # Filter states are read with a single request, kept in memory while processing
+            # the report, and only written back (with the transition logs) at the end
+            self._current_states = get_current_cached_filter_states_for_slugs(list(self.filter_dict.keys()))
+            self._modified_states = {}
+            self._filter_logs = []
+            try:
+                for data in entries:
+                    # filters[data.stream_slug] isn't in filters if there is no filter for data.stream_slug
+                    if data.stream_slug in self.filter_dict:
+                        self.process_filter(data, self.filter_dict[data.stream_slug], user_slug=user_slug)
+            finally:
+                self._flush_report_state()
 
             # TODO: Need to add a persistent record to store current_state (on top of redis copy)
 
@@ -0,0 +1,57 @@
+class CompiledFilter(object):
+    """
+    Pre-processed version of a cached (serialized) StreamFilter.
+
+    The states map and transition table are built once, instead of for every data point,
+    and the transitions that can be taken from a given current state are computed once
+    per state, so processing a data point only needs to evaluate the transition triggers.
+    """
+    source = None
+    slug = None
+    states_map = None
+    transitions = None
+
+    def __init__(self, cached_filter):
+        self.source = cached_filter
+        self.slug = cached_filter['slug']
+        self.states_map = {}
+        for state in cached_filter['states']:
+            self.states_map[state['id']] = state
+
+        # List of (transition, src, dst), in the filter's transition order
+        self.transitions = []
+        for transition in cached_filter['transitions']:
+            src = None
+            assert transition['dst'] in self.states_map
+            dst = self.states_map[transition['dst']]
+            assert dst
+            if 'src' in transition and transition['src'] and transition['src'] in self.states_map:
+                src = self.states_map[transition['src']]
+            self.transitions.append((transition, src, dst))
+
+        self._candidates = {}
+
+    @staticmethod
+    def transition_allowed(src, dst, current_state):
+        if src:
+            # if the transition has a src and dst, then this transition should only be consider if the
+            # transition src is the current state
+            if current_state and src['slug'] != current_state:
+                return False
+        else:
+            # If there is no src state, then only transition if current_state is different that dst state
+            if current_state and current_state == dst['slug']:
+                return False
+        return True
+
+    def get_candidate_transitions(self, current_state):
+        """
+        :param current_state: Current state slug (or None)
+        :return: List of (transition, src, dst) that can be taken from current_state, in order
+        """
+        if current_state not in self._candidates:
+            self._candidates[current_state] = [
+                (transition, src, dst) for transition, src, dst in self.transitions
+                if self.transition_allowed(src, dst, current_state)
+            ]
+        return self._candidates[current_state]
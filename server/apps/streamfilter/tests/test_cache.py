@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.core.cache import cache
 from django.test import TestCase
 
@@ -84,6 +86,40 @@ class StreamFilterCacheTestCase(TestMixin, TestCase):
         cached_value = cached_serialized_filter_for_slug(self.s1.slug)
         self.assertEqual(cached_value, ser.data)
 
+    def testFilterCacheInvalidation(self):
+        # Negative entry, cached on both tiers
+        self.assertEqual(cached_serialized_filter_for_slug(self.s1.slug), {'empty': True})
+        self.assertEqual(cached_serialized_filter_for_slug(self.s1.slug), {'empty': True})
+
+        # Creating a project filter invalidates the negative entry for the stream
+        f = StreamFilter.objects.create_filter_from_project_and_variable(
+            name='Filter 1', proj=self.s1.project, var=self.s1.variable, created_by=self.u2
+        )
+        self.assertEqual(cached_serialized_filter_for_slug(self.s1.slug)['slug'], f.slug)
+
+        # And a stream filter has priority over the cached project filter
+        f2 = StreamFilter.objects.create_filter_from_streamid(
+            name='Filter 2', input_stream=self.s1, created_by=self.u2
+        )
+        self.assertEqual(cached_serialized_filter_for_slug(self.s1.slug)['slug'], f2.slug)
+
+        f2.name = 'Filter 2b'
+        f2.save()
+        self.assertEqual(cached_serialized_filter_for_slug(self.s1.slug)['name'], 'Filter 2b')
+
+    def testClearFilterState(self):
+        f = StreamFilter.objects.create_filter_from_project_and_variable(
+            name='Filter 1', proj=self.s1.project, var=self.s1.variable, created_by=self.u2
+        )
+        set_current_cached_filter_state_for_slug(self.s1.slug, 'state1')
+        clear_serialized_filter_for_slug(f.slug)
+        self.assertIsNone(get_current_cached_filter_state_for_slug(self.s1.slug))
+
+        # Streams with no StreamId are cleared by pattern (only supported by Redis)
+        with mock.patch.object(cache, 'delete_pattern', create=True) as mock_delete_pattern:
+            clear_serialized_filter_for_slug(f.slug)
+            mock_delete_pattern.assert_called_once_with(get_current_state_cache_pattern(f.slug))
+
     def testCachePattern(self):
         patterns = get_current_state_cache_pattern('f--0000-0001----5001')
         self.assertEqual(patterns, 'current-state:s--0000-0001--*--5001')
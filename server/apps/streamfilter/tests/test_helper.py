@@ -1,4 +1,5 @@
 import datetime
+from unittest import mock
 
 import dateutil.parser
 
@@ -15,6 +16,7 @@ from ..actions.action import *
 from ..cache_utils import cached_serialized_filter_for_slug, get_current_cached_filter_state_for_slug
 from ..models import *
 from ..process import FilterHelper
+from ..processing.compiled import CompiledFilter
 from ..processing.trigger import evaluate_cached_transition
 from ..serializers import *
 
@@ -209,6 +211,40 @@ class StreamFilterHelperTestCase(TestMixin, TestCase):
         )
         self.assertTrue(res)
 
+    def testCompiledFilter(self):
+        self._dummy_basic_filter()
+        cached_filter = cached_serialized_filter_for_slug(self.s1.slug)
+        compiled = CompiledFilter(cached_filter)
+        self.assertEqual(len(compiled.transitions), 2)
+
+        candidates = compiled.get_candidate_transitions(None)
+        self.assertEqual([dst['slug'] for t, src, dst in candidates], ['state2', 'state1'])
+        candidates = compiled.get_candidate_transitions('state1')
+        self.assertEqual([dst['slug'] for t, src, dst in candidates], ['state2'])
+        candidates = compiled.get_candidate_transitions('state2')
+        self.assertEqual([dst['slug'] for t, src, dst in candidates], ['state1'])
+
+    def testProcessFilterReportBatchedState(self):
+        self._dummy_basic_filter()
+        cached_filter = cached_serialized_filter_for_slug(self.s1.slug)
+
+        t0 = dateutil.parser.parse('2016-09-28T10:00:00Z')
+        data = [
+            (t0, 1),
+            (t0 + datetime.timedelta(seconds=50), 11),
+            (t0 + datetime.timedelta(seconds=100), 5),
+            (t0 + datetime.timedelta(seconds=150), 15),
+        ]
+        data_entries = self._dummy_data(self.s1.slug, data)
+
+        filter_helper = FilterHelper(True)
+        with mock.patch('apps.streamfilter.process.set_current_cached_filter_state_for_slug') as mock_set:
+            filter_helper.process_filter_report(data_entries, {self.s1.slug: cached_filter})
+            # States are only written back once, at the end of the report
+            mock_set.assert_not_called()
+        self.assertEqual(get_current_cached_filter_state_for_slug(self.s1.slug), 'state2')
+        self.assertIsNone(filter_helper._current_states)
+
     def testBasic1Flow(self):
 
         filter_info = self._dummy_basic_filter()
@@ -263,9 +263,9 @@
 #         self.assertEqual(StreamData.objects.count(), 9)
 #         self.assertEqual(StreamTimeSeriesValue.objects.count(), 7)
 
-#     @mock.patch.object(MigrateDataAction, '_write_stream_batch')
+#     @mock.patch('apps.utils.aws.kinesis.FirehoseSender.put')
 #     @override_settings(USE_FIREHOSE_STREAMTIMESERIES=True)
-#     def testMigrateDataUsingFirehose(self, mock_write_stream_batch):
+#     def testMigrateDataUsingFirehose(self, mock_put):
 #         self._create_stream_data()
 
 #         queue = QueueTestMock()
@@ -289,17 +289,17 @@
 #         self.assertEqual(StreamData.objects.count(), 9)
 #         # new data isn't created since firehose payload is sent instead
 #         self.assertEqual(StreamTimeSeriesValue.objects.count(), 0)
-#         mock_write_stream_batch.assert_called_once_with([
-#             {
-#                 'Data': '{{"stream_slug": "{}", "project_id": {}, "device_id": {}, "variable_id": {}, "device_seqid": 5, "timestamp": "2016-09-28T10:00:10.000000Z", "status": "unk", "type": "Num", "raw_value": 5}}'
-#                 .format(
-#                     self.s1.slug,
-#                     converted_data.project_id,
-#                     converted_data.device_id,
-#                     converted_data.variable_id,
-#                 )
-#             }
-#         ])
+#         mock_put.assert_called_once_with({
+#             'stream_slug': self.s1.slug,
+#             'project_id': converted_data.project_id,
+#             'device_id': converted_data.device_id,
+#             'variable_id': converted_data.variable_id,
+#             'device_seqid': 5,
+#             'timestamp': '2016-09-28T10:00:10.000000Z',
+#             'status': 'unk',
+#             'type': 'Num',
+#             'raw_value': 5,
+#         })
 
 #     def testMigrateEvents(self):
 #         self._create_stream_events()
@@ -351,9 +351,9 @@
 #         self.assertEqual(stse.device_seqid, 5)
 #         self.assertEqual(stse.extra_data, {'some_data': 5})
 
-#     @mock.patch.object(MigrateDataAction, '_write_stream_batch')
+#     @mock.patch('apps.utils.aws.kinesis.FirehoseSender.put')
 #     @override_settings(USE_FIREHOSE_STREAMTIMESERIES=True)
-#     def testMigrateEventsUsingFirehose(self, mock_write_stream_batch):
+#     def testMigrateEventsUsingFirehose(self, mock_put):
 #         self._create_stream_events()
 
 #         queue = QueueTestMock()
@@ -377,18 +377,46 @@
 #         self.assertEqual(StreamEventData.objects.count(), 9)
 #         # new event isn't created since firehose payload is sent instead
 #         self.assertEqual(StreamTimeSeriesEvent.objects.count(), 0)
-#         mock_write_stream_batch.assert_called_once_with([
-#             {
-#                 'Data': '{{"stream_slug": "{}", "project_id": {}, "device_id": {}, "variable_id": {}, "device_seqid": 5, "timestamp": "2016-09-28T10:00:10.000000Z", "status": "unk", "uuid": "{}", "s3_key_path": "", "ext": "json", "extra_data": "{{\\"some_data\\": 5}}", "format_version": 2}}'
-#                 .format(
-#                     self.s1.slug,
-#                     converted_event.project_id,
-#                     converted_event.device_id,
-#                     converted_event.variable_id,
-#                     converted_event.uuid,
-#                 )
-#             }
-#         ])
+#         mock_put.assert_called_once_with({
+#             'stream_slug': self.s1.slug,
+#             'project_id': converted_event.project_id,
+#             'device_id': converted_event.device_id,
+#             'variable_id': converted_event.variable_id,
+#             'device_seqid': 5,
+#             'timestamp': '2016-09-28T10:00:10.000000Z',
+#             'status': 'unk',
+#             'uuid': converted_event.uuid,
+#             's3_key_path': '',
+#             'ext': 'json',
+#             'extra_data': '{"some_data": 5}',
+#             'format_version': 2,
+#         })
+
+#     @mock.patch.object(MigrateDataAction, 'schedule')
+#     def testMigrateDataInSlices(self, mock_schedule):
+#         self._create_stream_data()
+#         args = {
+#             'migration_type': 'data',
+#             'stream_slug': self.s1.slug,
+#             'start': 5,
+#             'end': 10,
+#             'slice_size': 3,
+#         }
+
+#         action = MigrateDataAction()
+#         action.execute(args)
+#         self.assertEqual(StreamTimeSeriesValue.objects.filter(stream_slug=self.s1.slug).count(), 3)
+#         self.assertEqual(
+#             list(StreamTimeSeriesValue.objects.order_by('device_seqid').values_list('device_seqid', flat=True)),
+#             [5, 6, 7]
+#         )
+#         # The rest of the range is migrated by a new action, starting at the checkpoint
+#         mock_schedule.assert_called_once_with(args=dict(args, start=8))
+
+#         action = MigrateDataAction()
+#         action.execute(dict(args, start=8))
+#         self.assertEqual(StreamTimeSeriesValue.objects.filter(stream_slug=self.s1.slug).count(), 5)
+#         self.assertEqual(mock_schedule.call_count, 1)
 
 #     def testException(self):
 #         action = MigrateDataAction()
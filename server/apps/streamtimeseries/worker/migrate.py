@@ -1,10 +1,8 @@
-import datetime
-import json
 import logging
-
-import boto3
+from itertools import islice
 
 from django.conf import settings
+from django.db import router, transaction
 from django.db.models import Q
 
 from apps.sqsworker.action import Action
@@ -12,20 +10,34 @@ from apps.sqsworker.exceptions import WorkerActionHardError
 from apps.streamdata.models import StreamData
 from apps.streamevent.models import StreamEventData
 from apps.streamtimeseries.models import StreamTimeSeriesEvent, StreamTimeSeriesValue
-from apps.utils.aws.common import AWS_REGION
+from apps.utils.aws.kinesis import FirehoseSender
+from apps.utils.data_helpers.bulk_copy import copy_bulk_create, copy_is_supported
 from apps.utils.data_helpers.convert import DataConverter
+from apps.utils.data_helpers.misc import get_every_id
+from apps.utils.data_helpers.seqid_slice import StreamerLocalIdSlice
 
 logger = logging.getLogger(__name__)
 
+_COMMON_FIELDS = (
+    'stream_slug', 'project_slug', 'device_slug', 'variable_slug',
+    'streamer_local_id', 'device_timestamp', 'timestamp', 'status',
+)
+
 
 class MigrateDataAction(Action):
     """
     This action will migrate data/event to create its StreamTimeSeries counterpart
     It supports AWS Kinesis Firehose
+
+    Old rows are read with a server side cursor, in streamer_local_id order, and are converted
+    and written in chunks, so memory use does not depend on the size of the stream.
+    Each action migrates at most slice_size rows. If there are more, a new action is scheduled
+    to resume from the next streamer_local_id (the checkpoint)
     """
     _MODELS = {
         'data': {
             'old': StreamData,
+            'fields': _COMMON_FIELDS + ('type', 'value', 'int_value'),
             'model_converter': DataConverter.data_to_tsvalue,
             'firehose_converter': DataConverter.tsvalue_to_firehose,
             'new': StreamTimeSeriesValue,
@@ -33,6 +45,7 @@ class MigrateDataAction(Action):
         },
         'event': {
             'old': StreamEventData,
+            'fields': _COMMON_FIELDS + ('uuid', 's3_key_path', 'ext', 'extra_data', 'format_version'),
             'model_converter': DataConverter.event_to_tsevent,
             'firehose_converter': DataConverter.tsevent_to_firehose,
             'new': StreamTimeSeriesEvent,
@@ -52,46 +65,10 @@ class MigrateDataAction(Action):
             optional=[
                 'start',
                 'end',
+                'slice_size',
             ],
         )
 
-    def _datetime_handler(self, x):
-        if isinstance(x, datetime.datetime):
-            return x.isoformat()
-        raise TypeError('Unknown type')
-
-    def _write_stream_batch(self, records):
-        try:
-            response = self._firehose_client.put_record_batch(
-                DeliveryStreamName=self._firehose_stream_name,
-                Records=records
-            )
-            if 'FailedPutCount' in response and response['FailedPutCount']:
-                logger.error('Firehose: {} upload failures detected'.format(response['FailedPutCount']))
-
-        except Exception as e:
-            logger.debug(e)
-            logger.exception('Firehose: upload failures detected. {}'.format(str(e)[0:50]))
-
-    def _send_to_firehose(self, data_entries, batch_num=490):
-        batch_payload = []
-        count = 1
-        for item in data_entries:
-            batch_item = {
-                'Data': json.dumps(item, default=self._datetime_handler)
-            }
-            batch_payload.append(batch_item)
-            count += 1
-            if count == batch_num:
-                logger.info('Uploading {} records'.format(batch_num))
-                self._write_stream_batch(batch_payload)
-                batch_payload = []
-                count = 1
-
-        if batch_payload:
-            logger.info('Uploading final {} records'.format(len(batch_payload)))
-            self._write_stream_batch(batch_payload)
-
     def _check_migration_type(self, migration_type):
         if migration_type not in self._MODELS:
             raise WorkerActionHardError(
@@ -100,45 +77,85 @@ class MigrateDataAction(Action):
                 )
             )
         self._old_model = self._MODELS[migration_type]['old']
+        self._old_fields = self._MODELS[migration_type]['fields']
         self._model_converter = self._MODELS[migration_type]['model_converter']
         self._firehose_converter = self._MODELS[migration_type]['firehose_converter']
         self._new_model = self._MODELS[migration_type]['new']
-        self._firehose_stream_name = getattr(
-            settings,
-            'FIREHOSE_STREAMTIMESERIES_STREAM_NAME'
-        )[self._MODELS[migration_type]['firehose_stream_name_key']]
+        if self._use_firehose:
+            self._firehose_stream_name = getattr(
+                settings,
+                'FIREHOSE_STREAMTIMESERIES_STREAM_NAME'
+            )[self._MODELS[migration_type]['firehose_stream_name_key']]
 
-    def _build_list_of_new_objects(self, stream_slug, start, end):
-        new_list = []
+    def _iter_new_objects(self, stream_slug, start, end, slice_size):
+        """
+        Convert the old rows of a slice of at most (about) slice_size rows, in streamer_local_id order.
+        The checkpoint for the next slice is left in self._next_start
+        (None when the whole range has been migrated)
+        """
+        self._next_start = None
         q = Q(stream_slug=stream_slug)
         if start is not None:
             q &= Q(streamer_local_id__gte=start)
         if end is not None:
             q &= Q(streamer_local_id__lt=end)
-        for old in self._old_model.objects.filter(q):
-            new_list.append(self._model_converter(old))
-        return new_list
+        rows = StreamerLocalIdSlice(
+            self._old_model.objects.filter(q).only(*self._old_fields), slice_size, chunk_size=self._chunk_size
+        )
 
-    def _create_new_data(self, new_list):
+        # All rows of a stream normally have the same slugs, so the ids are only computed once
+        ids_by_slugs = {}
+        for old in rows:
+            slugs = (old.project_slug, old.device_slug, old.variable_slug)
+            if slugs not in ids_by_slugs:
+                ids_by_slugs[slugs] = get_every_id(old)
+            yield self._model_converter(old, ids=ids_by_slugs[slugs])
+        self._next_start = rows.next_start
+
+    def _create_new_data(self, new_objects):
+        count = 0
         if self._use_firehose:
-            firehose_data_entries = [self._firehose_converter(timeseries) for timeseries in new_list]
             logger.debug('Using firehose (Production - {})'.format(getattr(settings, 'PRODUCTION')))
-            self._send_to_firehose(firehose_data_entries, batch_num=490)
+            with FirehoseSender(stream_name=self._firehose_stream_name) as sender:
+                for timeseries in new_objects:
+                    sender.put(self._firehose_converter(timeseries))
+            count = sender.stats['records']
         else:
-            self._new_model.objects.bulk_create(new_list)
-        logger.info('{} {} objects created'.format(len(new_list), self._new_model))
+            use_copy = getattr(settings, 'DATA_MANAGER_USE_COPY') and copy_is_supported(self._new_model)
+            # A slice is written atomically, so a failed action can be retried from the same checkpoint
+            with transaction.atomic(using=router.db_for_write(self._new_model)):
+                while True:
+                    chunk = list(islice(new_objects, self._chunk_size))
+                    if not chunk:
+                        break
+                    if use_copy:
+                        copy_bulk_create(self._new_model, chunk)
+                    else:
+                        self._new_model.objects.bulk_create(chunk)
+                    count += len(chunk)
+        logger.info('{} {} objects created'.format(count, self._new_model))
+        return count
 
     def execute(self, arguments):
         super(MigrateDataAction, self).execute(arguments)
         if MigrateDataAction._arguments_ok(arguments):
-            self._use_firehose = getattr(settings, 'USE_FIREHOSE_STREAMTIMESERIES') is True
-            self._firehose_client = boto3.client('firehose', region_name=AWS_REGION)
+            self._use_firehose = getattr(settings, 'USE_FIREHOSE_STREAMTIMESERIES', False) is True
+            self._chunk_size = getattr(settings, 'STREAMTIMESERIES_MIGRATION_CHUNK_SIZE')
             self._check_migration_type(arguments['migration_type'])
+            slice_size = arguments.get('slice_size') or getattr(settings, 'STREAMTIMESERIES_MIGRATION_SLICE_SIZE')
 
-            new_list = self._build_list_of_new_objects(arguments['stream_slug'], arguments.get('start'), arguments.get('end'))
-
-            # only if all the old data has been processed do we create the new data
-            self._create_new_data(new_list)
+            new_objects = self._iter_new_objects(
+                arguments['stream_slug'], arguments.get('start'), arguments.get('end'), slice_size
+            )
+            self._create_new_data(new_objects)
+
+            if self._next_start is not None:
+                logger.info('Migration of {} will continue from streamer_local_id={}'.format(
+                    arguments['stream_slug'], self._next_start
+                ))
+                args = dict(arguments)
+                args['start'] = self._next_start
+                MigrateDataAction.schedule(args=args)
 
     @classmethod
     def schedule(cls, args, queue_name=getattr(settings, 'SQS_WORKER_QUEUE_NAME'), delay_seconds=None):
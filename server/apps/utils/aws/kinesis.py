@@ -4,6 +4,8 @@ import datetime
 import json
 import logging
 import pprint
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import boto3
 
@@ -16,34 +18,15 @@ logger = logging.getLogger(__name__)
 
 FIREHOSE_STREAM_NAME = getattr(settings, 'FIREHOSE_STREAM_NAME')
 
-firehose_client = boto3.client('firehose', region_name=AWS_REGION)
-
-
-def _write_stream(stream, firehose_client):
-    try:
-        response = firehose_client.put_record(
-            DeliveryStreamName=FIREHOSE_STREAM_NAME,
-            Record={
-                'Data': json.dumps(stream)
-            }
-        )
-        logging.info(response)
-    except Exception:
-        logging.exception('Problem pushing to firehose')
-
+# PutRecordBatch limits
+FIREHOSE_MAX_BATCH_RECORDS = 500
+FIREHOSE_MAX_BATCH_BYTES = 4 * 1024 * 1024
+FIREHOSE_MAX_IN_FLIGHT = 4
+FIREHOSE_MAX_RETRIES = 3
+FIREHOSE_RETRY_DELAY = 0.2
+FIREHOSE_THROTTLE_ERROR = 'ServiceUnavailableException'
 
-def _write_stream_batch(records, firehose_client):
-    try:
-        response = firehose_client.put_record_batch(
-            DeliveryStreamName=FIREHOSE_STREAM_NAME,
-            Records=records
-        )
-        if 'FailedPutCount' in response and response['FailedPutCount']:
-            logger.error('Firehose: {0} upload failures detected'.format(response['FailedPutCount']))
-
-    except Exception as e:
-        logging.debug(e)
-        logging.exception('Firehose: upload failures detected. {}'.format(str(e)[0:50]))
+firehose_client = boto3.client('firehose', region_name=AWS_REGION)
 
 
 def datetime_handler(x):
@@ -52,23 +35,164 @@ def datetime_handler(x):
     raise TypeError("Unknown type")
 
 
-def send_to_firehose(data, batch_num):
-
-    batch_payload = []
-    count = 1
-    for item in data:
-        # print(str(stream_payload))
-        batch_item = {
-            'Data': json.dumps(item, default=datetime_handler)
+def firehose_timestamp(dt):
+    """Same as dt.strftime('%Y-%m-%d %H:%M:%S.%f'), but a lot faster"""
+    return dt.replace(tzinfo=None).isoformat(sep=' ', timespec='microseconds')
+
+
+class FirehoseSender(object):
+    """
+    Incremental PutRecordBatch sender.
+
+    Records are serialized as they are added, and packed into batches limited by both
+    the number of records (batch_num) and the 4MiB request size. Up to max_in_flight
+    batches are uploaded in parallel; put() blocks when that limit is reached, so
+    memory use is bounded no matter how many records are sent.
+    Only records that failed are retried (with backoff), up to max_retries times.
+    Records that still fail after that are logged as errors, and counted in stats.
+
+    Usage:
+        with FirehoseSender() as sender:
+            for item in generator:
+                sender.put(item)
+        logger.info(sender.stats)
+    """
+    stream_name = None
+    batch_num = FIREHOSE_MAX_BATCH_RECORDS
+    max_in_flight = FIREHOSE_MAX_IN_FLIGHT
+    max_retries = FIREHOSE_MAX_RETRIES
+
+    def __init__(self, stream_name=None, client=None, batch_num=FIREHOSE_MAX_BATCH_RECORDS,
+                 max_in_flight=FIREHOSE_MAX_IN_FLIGHT, max_retries=FIREHOSE_MAX_RETRIES):
+        self.stream_name = stream_name or FIREHOSE_STREAM_NAME
+        self._client = client or firehose_client
+        self.batch_num = min(batch_num, FIREHOSE_MAX_BATCH_RECORDS)
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self._batch = []
+        self._batch_bytes = 0
+        self._executor = None
+        self._futures = set()
+        self.stats = {
+            'records': 0,
+            'bytes': 0,
+            'batches': 0,
+            'retried': 0,
+            'throttled': 0,
+            'failed': 0,
+            'max_latency': 0.0,
+            'total_latency': 0.0,
         }
-        batch_payload.append(batch_item)
-        count += 1
-        if count == batch_num:
-            logger.info('Uploading {0} records'.format(batch_num))
-            _write_stream_batch(batch_payload, firehose_client)
-            batch_payload = []
-            count = 1
-
-    if len(batch_payload):
-        logger.info('Uploading final {0} records'.format(len(batch_payload)))
-        _write_stream_batch(batch_payload, firehose_client)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put(self, item):
+        """
+        Add a record to the current batch, uploading the batch if full
+
+        :param item: JSON serializable dict
+        """
+        data = json.dumps(item, default=datetime_handler).encode('utf-8')
+        if self._batch and (len(self._batch) >= self.batch_num or self._batch_bytes + len(data) > FIREHOSE_MAX_BATCH_BYTES):
+            self.flush()
+        self._batch.append({'Data': data})
+        self._batch_bytes += len(data)
+        self.stats['records'] += 1
+        self.stats['bytes'] += len(data)
+
+    def put_many(self, items):
+        for item in items:
+            self.put(item)
+
+    def flush(self):
+        """Upload the current batch (without waiting for it to complete)"""
+        if not self._batch:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        while len(self._futures) >= self.max_in_flight:
+            self._wait(return_when=FIRST_COMPLETED)
+        self._futures.add(self._executor.submit(self._put_batch, self._batch))
+        self._batch = []
+        self._batch_bytes = 0
+
+    def close(self):
+        """
+        Upload any pending records, and wait for all uploads to complete
+        """
+        self.flush()
+        if self._executor is not None:
+            self._wait()
+            self._executor.shutdown()
+            self._executor = None
+        if self.stats['batches']:
+            logger.info('Firehose: {records} records ({bytes} bytes) in {batches} batches, '
+                        'retried={retried}, throttled={throttled}, failed={failed}, '
+                        'max_latency={max_latency:.3f}s'.format(**self.stats))
+        if self.stats['failed']:
+            logger.error('Firehose: {0} upload failures detected'.format(self.stats['failed']))
+
+    def _wait(self, return_when=None):
+        if return_when:
+            done, self._futures = wait(self._futures, return_when=return_when)
+        else:
+            done, self._futures = wait(self._futures)
+        for future in done:
+            batch_stats = future.result()
+            self.stats['batches'] += 1
+            for key in ['retried', 'throttled', 'failed']:
+                self.stats[key] += batch_stats[key]
+            self.stats['total_latency'] += batch_stats['latency']
+            self.stats['max_latency'] = max(self.stats['max_latency'], batch_stats['latency'])
+
+    def _put_batch(self, records):
+        batch_stats = {'retried': 0, 'throttled': 0, 'failed': 0, 'latency': 0.0}
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                batch_stats['retried'] += len(records)
+                time.sleep(FIREHOSE_RETRY_DELAY * 2 ** (attempt - 1))
+            start = time.time()
+            try:
+                response = self._client.put_record_batch(
+                    DeliveryStreamName=self.stream_name,
+                    Records=records
+                )
+            except Exception as e:
+                logger.warning('Firehose: batch upload failed (attempt {0}). {1}'.format(attempt + 1, str(e)[0:50]))
+                continue
+            finally:
+                latency = time.time() - start
+                batch_stats['latency'] += latency
+                logger.debug('Firehose: {0} records uploaded in {1:.3f}s'.format(len(records), latency))
+
+            if not response.get('FailedPutCount'):
+                return batch_stats
+
+            # Only retry the records that failed
+            failed = []
+            for record, result in zip(records, response['RequestResponses']):
+                if 'ErrorCode' in result:
+                    failed.append(record)
+                    if result['ErrorCode'] == FIREHOSE_THROTTLE_ERROR:
+                        batch_stats['throttled'] += 1
+            logger.warning('Firehose: {0} of {1} records failed (attempt {2})'.format(len(failed), len(records), attempt + 1))
+            records = failed
+
+        batch_stats['failed'] += len(records)
+        return batch_stats
+
+
+def send_to_firehose(data, batch_num=FIREHOSE_MAX_BATCH_RECORDS, stream_name=None):
+    """
+    Upload records to Firehose
+
+    :param data: iterable (i.e. list or generator) of JSON serializable dicts
+    :param batch_num: Max number of records per PutRecordBatch request
+    :param stream_name: Delivery stream (FIREHOSE_STREAM_NAME if not set)
+    """
+    with FirehoseSender(stream_name=stream_name, batch_num=batch_num) as sender:
+        sender.put_many(data)
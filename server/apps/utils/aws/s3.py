@@ -10,6 +10,7 @@ import logging
 import os
 import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO, StringIO
 
 import boto3
@@ -22,6 +23,12 @@ logger = logging.getLogger(__name__)
 s3 = boto3.client('s3')
 s3_resource = boto3.resource('s3')
 
+# S3ParallelUploader defaults. Keep max workers below the s3 client connection pool size (10),
+# so all threads can reuse the client connections
+S3_UPLOAD_MAX_WORKERS = 8
+S3_UPLOAD_MAX_RETRIES = 3
+S3_UPLOAD_RETRY_DELAY = 0.5
+
 
 def get_s3_url(bucket_name, key_name):
     # Generate the URL to get 'key-name' from 'bucket-name'
@@ -119,6 +126,78 @@ def upload_json_data_from_object(bucket, key, data):
     return False
 
 
+class S3ParallelUploader(object):
+    """
+    Collect S3 uploads, and run them with a bounded thread pool.
+    All threads share the (thread safe) module s3 client, so HTTP connections are reused.
+    Failed uploads are retried, and all failures are returned together.
+
+    Usage:
+        uploader = S3ParallelUploader()
+        for ...:
+            uploader.add(bucket, key, data)
+        failures = uploader.run()
+    """
+
+    def __init__(self, upload_func=None, max_workers=S3_UPLOAD_MAX_WORKERS, max_retries=S3_UPLOAD_MAX_RETRIES):
+        """
+        :param upload_func: Function called as upload_func(bucket=, key=, data=), returning True on success
+                            (defaults to upload_json_data_from_object)
+        :param max_workers: Max number of concurrent uploads
+        :param max_retries: Max number of retries for each upload
+        """
+        self._upload_func = upload_func or upload_json_data_from_object
+        self._max_workers = max_workers
+        self._max_retries = max_retries
+        self._pending = []
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, bucket, key, data):
+        self._pending.append((bucket, key, data))
+
+    def _upload(self, item):
+        bucket, key, data = item
+        error = None
+        for attempt in range(self._max_retries + 1):
+            if attempt:
+                time.sleep(S3_UPLOAD_RETRY_DELAY * (2 ** (attempt - 1)))
+            try:
+                if self._upload_func(bucket=bucket, key=key, data=data):
+                    return None
+                error = 'Upload failed'
+            except Exception as e:
+                error = str(e)
+            logger.warning('Failed to upload {0}:{1} (attempt {2}): {3}'.format(bucket, key, attempt + 1, error))
+        return error
+
+    def run(self):
+        """
+        Upload all pending items
+
+        :return: list of (bucket, key, error) for all uploads that failed after all retries
+        """
+        pending = self._pending
+        self._pending = []
+        if not pending:
+            return []
+
+        start_time = time.time()
+        workers = min(self._max_workers, len(pending))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                errors = list(executor.map(self._upload, pending))
+        else:
+            errors = [self._upload(item) for item in pending]
+
+        failures = [(bucket, key, error) for (bucket, key, data), error in zip(pending, errors) if error]
+        logger.info('Uploaded {0} S3 objects ({1} failed) in {2:.3f} sec'.format(
+            len(pending), len(failures), time.time() - start_time
+        ))
+        return failures
+
+
 def download_text_as_object(bucket, key):
     obj = s3_resource.Object(bucket, key)
     text_data = obj.get()['Body'].read().decode('utf-8')
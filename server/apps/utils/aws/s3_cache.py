@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+from apps.utils.local_cache import LocalCache
+
+from .s3 import s3
+
+logger = logging.getLogger(__name__)
+
+# Max number of objects to keep HEAD information for, and for how long (in seconds).
+# Only needs to cover getting the metadata and then the file, while processing the object
+HEAD_INFO_MAX_ENTRIES = 4096
+HEAD_INFO_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class S3FileCache(object):
+    """
+    Bounded, content-addressed local cache for S3 objects and their metadata.
+
+    Objects are stored on disk keyed by bucket, key and ETag (as returned by the download),
+    so a changed object is never served from the cache once its HEAD information expires.
+    A single HEAD request gives both the ETag and the user metadata (kept in memory for
+    HEAD_INFO_TIMEOUT seconds), replacing the separate get_s3_metadata call. When the total
+    size on disk goes over max_bytes, least recently used files are removed.
+    The total size is only read from disk on the first download, and then again whenever the
+    sizes of the files downloaded since would take it over max_bytes (files downloaded by other
+    workers sharing the directory are only seen at that point).
+
+    Files are written to a temp file and then renamed, so several workers can share the directory.
+    """
+    root = None
+    max_bytes = 0
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Estimated size of all files in the cache. None until read from disk
+        self._total_bytes = None
+        # (bucket, key) -> HEAD info, to avoid a second HEAD when downloading after getting metadata
+        self._head_info = LocalCache(max_entries=HEAD_INFO_MAX_ENTRIES, timeout=HEAD_INFO_TIMEOUT)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _digest(self, bucket, key, etag):
+        return hashlib.sha256('\n'.join([bucket, key, etag]).encode('utf-8')).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest)
+
+    def _set_head_info(self, bucket, key, response):
+        """Keep the ETag and user metadata from a HEAD or GET response"""
+        info = {
+            'etag': response.get('ETag', '').strip('"'),
+            'metadata': response['Metadata']
+        }
+        self._head_info.set((bucket, key), info)
+        return info
+
+    def _head(self, bucket, key):
+        info = self._head_info.get((bucket, key))
+        if info is None:
+            info = self._set_head_info(bucket, key, s3.head_object(Bucket=bucket, Key=key))
+        return info
+
+    def _touch(self, path):
+        try:
+            os.utime(path, None)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _evict(self):
+        """Read the total size from disk, and remove least recently used files until it fits within max_bytes"""
+        entries = []
+        total = 0
+        with os.scandir(self.root) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith('tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+
+        if total > self.max_bytes:
+            for mtime, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+                if total <= self.max_bytes:
+                    break
+            logger.info('S3 file cache evicted down to {} bytes'.format(total))
+        self._total_bytes = total
+
+    def _add_file_size(self, size):
+        if self._total_bytes is not None and self._total_bytes + size <= self.max_bytes:
+            self._total_bytes += size
+        else:
+            self._evict()
+
+    def get_metadata(self, bucket, key):
+        """
+        :return: S3 user metadata of the object (same as get_s3_metadata)
+        """
+        return self._head(bucket, key)['metadata']
+
+    def get_file_path(self, bucket, key):
+        """
+        Download the object into the cache, if not already there
+
+        :return: Local path to the cached file
+        """
+        info = self._head(bucket, key)
+        path = self._path(self._digest(bucket, key, info['etag']))
+        if self._touch(path):
+            logger.info('S3 file cache hit: {0}/{1}'.format(bucket, key))
+            return path
+
+        logger.info('Downloading {0} from bucket {1}'.format(key, bucket))
+        with tempfile.NamedTemporaryFile(mode='w+b', prefix='tmp', dir=self.root, delete=False) as fp:
+            try:
+                response = s3.get_object(Bucket=bucket, Key=key)
+                shutil.copyfileobj(response['Body'], fp, DOWNLOAD_CHUNK_SIZE)
+                size = fp.tell()
+            except Exception:
+                os.remove(fp.name)
+                raise
+        # The object may have changed since the HEAD: store it under the version actually downloaded
+        info = self._set_head_info(bucket, key, response)
+        path = self._path(self._digest(bucket, key, info['etag']))
+        os.replace(fp.name, path)
+        self._add_file_size(size)
+        return path
+
+    def open(self, bucket, key):
+        """
+        :return: Cached file, opened for reading (binary)
+        """
+        return open(self.get_file_path(bucket, key), 'rb')
+
+    def open_mmap(self, bucket, key):
+        """
+        :return: Read only memory map of the cached file. Supports seek/read, like a file.
+                 Should be closed by the caller when done
+        """
+        with self.open(bucket, key) as fp:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def forget(self, bucket, key):
+        """Clear the in-memory HEAD info for an object (files are only removed by eviction)"""
+        self._head_info.delete((bucket, key))
+
+
+_report_file_cache = None
+
+
+def get_report_file_cache():
+    """
+    :return: Shared S3FileCache for streamer reports, or None if STREAMER_REPORT_CACHE_DIR is not set
+    """
+    global _report_file_cache
+
+    root = getattr(settings, 'STREAMER_REPORT_CACHE_DIR', None)
+    if not root:
+        return None
+    if _report_file_cache is None or _report_file_cache.root != root:
+        _report_file_cache = S3FileCache(root, getattr(settings, 'STREAMER_REPORT_CACHE_MAX_BYTES'))
+    return _report_file_cache
@@ -14,9 +14,17 @@ SNS_STREAM_WORKER = getattr(settings, 'SNS_STREAM_WORKER')
 SNS_STAFF_NOTIFICATION = getattr(settings, 'SNS_STAFF_NOTIFICATION')
 SNS_ARCH_SLACK_NOTIFICATION = getattr(settings, 'SNS_ARCH_SLACK_NOTIFICATION')
 
+# SNS message size limit, and max number of items in each message sent by sns_lambda_message_batches
+SNS_MAX_MESSAGE_BYTES = 256 * 1024
+SNS_LAMBDA_BATCH_SIZE = 500
+
 sns_client = boto3.client('sns', AWS_REGION)
 
 
+def _get_lambda_message_size(message):
+    return len(json.dumps({'default': json.dumps(message)}).encode('utf-8'))
+
+
 def sns_lambda_message(topic, message):
     '''
     Use SNS to send a task to a background Lambda Function
@@ -38,6 +46,35 @@ def sns_lambda_message(topic, message):
     return False
 
 
+def sns_lambda_message_batches(topic, items, batch_size=SNS_LAMBDA_BATCH_SIZE):
+    '''
+    Same as sns_lambda_message, for a list message that may be too large for a single SNS message.
+    Items are sent in as many messages as needed, each with at most batch_size items,
+    and never above the SNS message size limit
+
+    :param topic: SNS ARN
+    :param items: iterable of JSON serializable items
+    :return: Number of messages published
+    '''
+    count = 0
+    batch = []
+    batch_size_bytes = 0
+    for item in items:
+        # Size of the item once encoded twice (the message, and then the SNS payload), plus the separator
+        item_size = len(json.dumps(json.dumps(item)).encode('utf-8'))
+        if batch and (len(batch) >= batch_size or _get_lambda_message_size([]) + batch_size_bytes + item_size > SNS_MAX_MESSAGE_BYTES):
+            sns_lambda_message(topic, batch)
+            count += 1
+            batch = []
+            batch_size_bytes = 0
+        batch.append(item)
+        batch_size_bytes += item_size
+    if batch:
+        sns_lambda_message(topic, batch)
+        count += 1
+    return count
+
+
 def _sns_text_based_notification(topic, message):
     """
     Generic method to publish an SNS notification
@@ -115,6 +115,54 @@ def change_sqs_message_visibility(message, time_out):
         raise err
 
 
+def _sqs_batch_entries(messages, **extra):
+    return [
+        dict(Id=str(i), ReceiptHandle=message.receipt_handle, **extra) for i, message in enumerate(messages)
+    ]
+
+
+def delete_sqs_message_batch(queue, messages):
+    """Delete up to 10 messages from the queue with a single request
+    :param queue: Boto3 SQS Queue object
+    :param messages: List of messages to delete (max 10)
+    :return: List of messages that failed to be deleted
+    """
+    if not messages:
+        return []
+    try:
+        response = queue.delete_messages(Entries=_sqs_batch_entries(messages))
+    except Exception as err:
+        logger.error("Fail to delete SQS messages: {}".format(str(err)))
+        raise err
+    failed = response.get('Failed', [])
+    for item in failed:
+        logger.warning("Fail to delete SQS message: {}".format(item.get('Message')))
+    return [messages[int(item['Id'])] for item in failed]
+
+
+def change_sqs_message_visibility_batch(queue, messages, time_out):
+    """Change visibility timeout of up to 10 messages with a single request
+    Used to keep messages of long running tasks from being requeued
+    :param queue: Boto3 SQS Queue object
+    :param messages: List of messages to change (max 10)
+    :param time_out: New visibility timeout in seconds
+    :return: List of messages that failed to be changed
+    """
+    if not messages:
+        return []
+    try:
+        response = queue.change_message_visibility_batch(
+            Entries=_sqs_batch_entries(messages, VisibilityTimeout=time_out)
+        )
+    except Exception as err:
+        logger.error("Fail to change SQS change_visibility: {}".format(str(err)))
+        raise err
+    failed = response.get('Failed', [])
+    for item in failed:
+        logger.warning("Fail to change SQS message visibility: {}".format(item.get('Message')))
+    return [messages[int(item['Id'])] for item in failed]
+
+
 class SqsPublisher(object):
     """
     Used to publish message to sqs queue
@@ -14,8 +14,20 @@ class DataConverter:
     """
 
     @staticmethod
-    def data_to_tsvalue(data):
-        """Convert a StreamData object into a StreamTimeSeriesValue object."""
+    def _set_every_id(timeseries, stream, ids):
+        if ids is None:
+            update_every_id(timeseries, stream)
+        else:
+            for key, value in ids.items():
+                setattr(timeseries, key, value)
+
+    @staticmethod
+    def data_to_tsvalue(data, ids=None):
+        """
+        Convert a StreamData object into a StreamTimeSeriesValue object.
+
+        :param ids: Optional result of get_every_id(data), to avoid parsing the slugs again
+        """
 
         ts_value = StreamTimeSeriesValue(
             stream_slug=data.stream_slug,
@@ -27,7 +39,7 @@ class DataConverter:
             raw_value=data.int_value,
         )
 
-        update_every_id(ts_value, data)
+        DataConverter._set_every_id(ts_value, data, ids)
         update_timestamp(ts_value, data)
 
         return ts_value
@@ -53,8 +65,12 @@ class DataConverter:
         return data
 
     @staticmethod
-    def event_to_tsevent(event):
-        """Convert a StreamEvent object into a StreamTimeSeriesEvent object."""
+    def event_to_tsevent(event, ids=None):
+        """
+        Convert a StreamEvent object into a StreamTimeSeriesEvent object.
+
+        :param ids: Optional result of get_every_id(event), to avoid parsing the slugs again
+        """
 
         ts_event = StreamTimeSeriesEvent(
             stream_slug=event.stream_slug,
@@ -69,7 +85,7 @@ class DataConverter:
             format_version=event.format_version,
         )
 
-        update_every_id(ts_event, event)
+        DataConverter._set_every_id(ts_event, event, ids)
 
         return ts_event
 
@@ -1,9 +1,17 @@
+import logging
 import types
 import uuid
 from datetime import datetime
 
+from django.conf import settings
+from django.db import router, transaction
+
 from iotile_cloud.utils.gid import *
 
+from apps.utils.data_helpers.bulk_copy import copy_bulk_create, copy_is_supported
+
+logger = logging.getLogger(__name__)
+
 
 class ClassMethodsOnly(type):
     def __new__(cls, name, bases, attrs):
@@ -141,8 +149,87 @@ class DjangoBaseDataManager(metaclass=ClassMethodsOnly):
         assert cls.is_instance(model, obj)
         return obj.save(**kwargs)
 
-    def bulk_create(cls, model, payload):
-        return cls.get_model(model).objects.bulk_create(payload)
+    def bulk_create(cls, model, payload, use_copy=None):
+        """Creates all objects in the payload
+
+        Args:
+            model (str): type of model to create
+            payload (list): list of model instances
+            use_copy (bool): use COPY FROM STDIN instead of INSERT statements (faster, but
+                primary keys are not set on the instances). Defaults to settings.DATA_MANAGER_USE_COPY.
+                Ignored if the database does not support COPY (i.e. Redshift)
+        """
+        model_class = cls.get_model(model)
+        if use_copy is None:
+            use_copy = getattr(settings, 'DATA_MANAGER_USE_COPY')
+        if use_copy and copy_is_supported(model_class):
+            return copy_bulk_create(model_class, payload)
+        return model_class.objects.bulk_create(payload)
+
+    def bulk_update(cls, model, objs, fields, batch_size=None):
+        """Updates the given fields of all objects, with one UPDATE statement per batch
+
+        Args:
+            model (str): type of model to update
+            objs (list): list of (already saved) model instances
+            fields (list): names of the fields to update
+            batch_size (int): max number of objects per UPDATE statement
+        """
+        assert all([cls.is_instance(model, obj) for obj in objs])
+        return cls.get_model(model).objects.bulk_update(objs, fields, batch_size=batch_size)
+
+    def _pre_delete_chunk(cls, model, chunk_qs):
+        """Called (within the chunk transaction) before every delete_in_chunks DELETE.
+        Managers should do here anything the model delete signals would have done"""
+        pass
+
+    def delete_in_chunks(cls, model, chunk_size=None, start_after_id=0, progress=None, **kwargs):
+        """Deletes all objects matching the given filters, with one raw DELETE statement
+        (and transaction) per chunk of at most chunk_size rows, in primary key order.
+        Unlike QuerySet.delete(), rows are never loaded (and delete signals are not sent).
+
+        As every chunk is committed, an interrupted delete can just be called again,
+        or resumed from the last reported id with start_after_id
+
+        Args:
+            model (str): type of model to delete
+            chunk_size (int): max rows per DELETE. Defaults to settings.DATA_MANAGER_DELETE_CHUNK_SIZE
+            start_after_id (int): only delete rows with a primary key greater than this one
+            progress (callable): called after every chunk with the current result dict
+            kwargs: same filter arguments as filter_qs
+
+        Returns:
+            dict: {'deleted': total rows deleted, 'chunks': number of DELETEs, 'last_id': last deleted chunk bound}
+        """
+        if chunk_size is None:
+            chunk_size = getattr(settings, 'DATA_MANAGER_DELETE_CHUNK_SIZE')
+        assert chunk_size > 0
+        qs = cls.filter_qs(model, **kwargs)
+        using = router.db_for_write(cls.get_model(model))
+
+        result = {'deleted': 0, 'chunks': 0, 'last_id': start_after_id}
+        while True:
+            chunk_qs = qs.filter(id__gt=result['last_id'])
+            # The id of the last row of the chunk (if the chunk is full) is the upper bound of the DELETE
+            upper_ids = list(chunk_qs.order_by('id').values_list('id', flat=True)[chunk_size - 1:chunk_size])
+            if upper_ids:
+                chunk_qs = chunk_qs.filter(id__lte=upper_ids[0])
+
+            with transaction.atomic(using=using):
+                cls._pre_delete_chunk(model, chunk_qs)
+                deleted = chunk_qs._raw_delete(using=using)
+
+            result['deleted'] += deleted or 0
+            result['chunks'] += 1
+            if upper_ids:
+                result['last_id'] = upper_ids[0]
+            if progress:
+                progress(dict(result))
+            if not upper_ids:
+                break
+
+        logger.info('Deleted {0} {1} rows in {2} chunk(s)'.format(result['deleted'], model, result['chunks']))
+        return result
 
     def send_to_firehose(cls, model, payload):
         raise NotImplementedError
@@ -5,13 +5,16 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import Q
 
 from apps.streamdata.models import StreamData
-from apps.streamevent.models import StreamEventData
-from apps.utils.aws.kinesis import send_to_firehose
+from apps.streamevent.models import StreamEventData, get_event_s3_bucket, get_event_s3_key
+from apps.utils.aws.kinesis import firehose_timestamp, send_to_firehose
+from apps.utils.aws.sns import sns_lambda_message_batches
 
 from .base import DjangoBaseDataManager
 
 logger = logging.getLogger(__name__)
 
+SNS_DELETE_S3 = getattr(settings, 'SNS_DELETE_S3')
+
 
 class DjangoStreamDataManager(DjangoBaseDataManager):
     """
@@ -28,7 +31,7 @@ class DjangoStreamDataManager(DjangoBaseDataManager):
             'type': stream_data.type,
             'dirty_ts': stream_data.dirty_ts,
             'status': stream_data.status,
-            'timestamp': stream_data.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')
+            'timestamp': firehose_timestamp(stream_data.timestamp)
         }
         if stream_data.device_timestamp is not None:
             payload['device_timestamp'] = stream_data.device_timestamp
@@ -46,25 +49,39 @@ class DjangoStreamDataManager(DjangoBaseDataManager):
             'event': StreamEventData,
         }[name]
 
+    def _pre_delete_chunk(cls, model, chunk_qs):
+        """Same as the StreamEventData pre_delete signal, but with as few SNS messages as possible per chunk"""
+        if model == 'event':
+            rows = chunk_qs.values_list('uuid', 'stream_slug', 's3_key_path', 'ext', 'format_version')
+            msg = [{
+                "uuid": str(uuid),
+                "bucket": get_event_s3_bucket(format_version),
+                "key": get_event_s3_key(uuid, stream_slug, s3_key_path, ext, format_version)
+            } for uuid, stream_slug, s3_key_path, ext, format_version in rows]
+            if msg:
+                logger.info('pre-delete {0} stream events'.format(len(msg)))
+                sns_lambda_message_batches(SNS_DELETE_S3, msg)
+
     def send_to_firehose(cls, model, payload):
         """Sends the payload to Firehose
 
         Args:
             model (str): type of model sent to Firehose (ONLY 'data' is valid for this manager).
-            payload (list): list of model instances.
+            payload (iterable): list (or generator) of model instances.
                 This list/collection should be a collection of StreamData
                 instances that have to be sent to Firehose. They'll be
-                serialized to a JSON payload by this method.
+                serialized to a JSON payload by this method, as they are uploaded.
         """
         assert model == 'data'
-        firehose_data_entries = []
+        logger.debug('Using firehose (Production = {0})'.format(getattr(settings, 'PRODUCTION')))
+        send_to_firehose(cls._iter_firehose_payloads(payload))
+
+    def _iter_firehose_payloads(cls, payload):
         for data in payload:
             firehose_payload = cls._get_firehose_payload(data)
             assert (firehose_payload['int_value'] is not None)
             assert (firehose_payload['int_value'] == data.int_value)
-            firehose_data_entries.append(firehose_payload)
-        logger.debug('Using firehose (Production = {0})'.format(getattr(settings, 'PRODUCTION')))
-        send_to_firehose(firehose_data_entries, batch_num=490)
+            yield firehose_payload
 
     def build(cls, model, **kwargs):
         cls._validate_kwargs(model, 'build', kwargs)
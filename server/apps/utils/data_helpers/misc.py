@@ -1,3 +1,5 @@
+from types import SimpleNamespace
+
 from iotile_cloud.utils.gid import *
 
 from apps.utils.timezone_utils import convert_to_utc
@@ -38,6 +40,18 @@ def update_every_id(timeseries, stream):
     update_variable_id(timeseries, stream)
 
 
+def get_every_id(stream):
+    """
+    Get the project_id, device_id, block_id, and variable_id matching the stream information,
+    so they can be computed once and reused for every data point with the same slugs
+
+    :return: dict with the ids that could be computed (missing ones are not included)
+    """
+    ids = SimpleNamespace()
+    update_every_id(ids, stream)
+    return vars(ids)
+
+
 def update_project_and_variable_slug(stream, timeseries):
     """Update stream.project_slug and stream.variable_slug by using timeseries information"""
     if timeseries.project_id:
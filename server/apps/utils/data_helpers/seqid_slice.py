@@ -0,0 +1,52 @@
+class StreamerLocalIdSlice(object):
+    """
+    Bounded slice of a StreamData/StreamEventData queryset, in streamer_local_id order,
+    used to process very large streams in resumable steps.
+
+    Every query is bounded (by a LIMIT, or to a single streamer_local_id), so no query ever
+    returns the rest of the stream, even if the database does not support server side cursors.
+    A slice never ends in the middle of rows with the same streamer_local_id, so the next slice
+    can safely start at next_start (the checkpoint).
+
+    Usage:
+        rows = StreamerLocalIdSlice(qs, slice_size=100000)
+        for row in rows:
+            ...
+        if rows.next_start is not None:
+            # Process the next slice, i.e. with qs.filter(streamer_local_id__gte=rows.next_start)
+    """
+    qs = None
+    slice_size = 0
+    chunk_size = 0
+    count = 0
+    next_start = None
+
+    def __init__(self, qs, slice_size, chunk_size=2000):
+        self.qs = qs
+        self.slice_size = slice_size
+        self.chunk_size = chunk_size
+        self.count = 0
+        self.next_start = None
+
+    def __iter__(self):
+        self.count = 0
+        self.next_start = None
+        last = None
+        for row in self.qs.order_by('streamer_local_id', 'id')[:self.slice_size].iterator(chunk_size=self.chunk_size):
+            self.count += 1
+            last = row
+            yield row
+
+        if self.count < self.slice_size:
+            # The whole stream (or range) was read
+            return
+
+        # Complete the slice with the remaining rows with the same streamer_local_id as the last one
+        same_seqid_qs = self.qs.filter(streamer_local_id=last.streamer_local_id, id__gt=last.id).order_by('id')
+        for row in same_seqid_qs.iterator(chunk_size=self.chunk_size):
+            self.count += 1
+            yield row
+
+        self.next_start = self.qs.filter(
+            streamer_local_id__gt=last.streamer_local_id
+        ).order_by('streamer_local_id').values_list('streamer_local_id', flat=True).first()
@@ -1,3 +1,4 @@
+import json
 from datetime import timedelta
 from unittest import mock
 
@@ -13,6 +14,9 @@ from apps.physicaldevice.models import Device
 from apps.stream.models import StreamId, StreamVariable
 from apps.streamdata.helpers import StreamDataBuilderHelper
 from apps.streamdata.models import StreamData
+from apps.streamevent.models import StreamEventData
+from apps.utils.aws.sns import SNS_LAMBDA_BATCH_SIZE, SNS_MAX_MESSAGE_BYTES
+from apps.utils.data_helpers.bulk_copy import copy_is_supported
 from apps.utils.data_helpers.manager import DataManager
 from apps.utils.test_util import TestMixin
 
@@ -396,6 +400,95 @@ class TestDataManager(TestMixin, TestCase):
         self.assertEqual(StreamData.objects.filter(timestamp__gte=self.ts_now + timedelta(seconds=1000)).count(), 10)
         self.assertEqual(StreamData.objects.filter(int_value__gte=100).count(), 10)
 
+    def testBulkCreateWithCopy(self):
+        if not copy_is_supported(StreamData):
+            self.skipTest('COPY not supported by the streamdata database')
+        helper = StreamDataBuilderHelper()
+        payload = []
+        for i in range(10):
+            stream_data = helper.build_data_obj(
+                stream_slug=self.s3.slug,
+                timestamp=self.ts_now + timedelta(seconds=1000 + i * 10),
+                int_value=100 + i,
+                streamer_local_id=i + 1,
+            )
+            payload.append(stream_data)
+        DataManager.bulk_create('data', payload, use_copy=True)
+
+        self.assertEqual(StreamData.objects.all().count(), 16)
+        qs = StreamData.objects.filter(stream_slug=self.s3.slug, int_value__gte=100).order_by('streamer_local_id')
+        self.assertEqual(qs.count(), 10)
+        first = qs.first()
+        self.assertEqual(first.timestamp, self.ts_now + timedelta(seconds=1000))
+        self.assertEqual(first.int_value, 100)
+        self.assertEqual(first.value, payload[0].value)
+        self.assertEqual(first.device_slug, payload[0].device_slug)
+        self.assertEqual(first.dirty_ts, False)
+
+    def testBulkUpdate(self):
+        items = list(StreamData.objects.filter(stream_slug=self.s1.slug))
+        for item in items:
+            item.timestamp = self.ts_now + timedelta(seconds=5000)
+            item.int_value = 70
+        with self.assertRaises(AssertionError):
+            DataManager.bulk_update('event', items, ['timestamp'])
+        with self.assertNumQueries(1):
+            DataManager.bulk_update('data', items, ['timestamp'])
+
+        qs = StreamData.objects.filter(stream_slug=self.s1.slug)
+        self.assertEqual(qs.filter(timestamp=self.ts_now + timedelta(seconds=5000)).count(), len(items))
+        # Only the given fields are updated
+        self.assertEqual(qs.filter(int_value=70).count(), 0)
+
+    def testDeleteInChunks(self):
+        progress = []
+        result = DataManager.delete_in_chunks('data', chunk_size=2, progress=progress.append, stream_slug=self.s1.slug)
+        self.assertEqual(result['deleted'], 3)
+        self.assertEqual(result['chunks'], 2)
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(progress[0]['deleted'], 2)
+        self.assertEqual(progress[0]['last_id'], self.sd2.id)
+        self.assertEqual(StreamData.objects.filter(stream_slug=self.s1.slug).count(), 0)
+        self.assertEqual(StreamData.objects.all().count(), 3)
+
+        # Resume after a given id
+        result = DataManager.delete_in_chunks('data', start_after_id=self.sd4.id, stream_slug=self.s2.slug)
+        self.assertEqual(result['deleted'], 1)
+        self.assertEqual(StreamData.objects.filter(stream_slug=self.s2.slug).first().id, self.sd4.id)
+
+        with self.assertRaises(AssertionError):
+            DataManager.delete_in_chunks('data', foo='bar')
+
+        for i in range(3):
+            StreamEventData.objects.create(
+                stream_slug=self.s1.slug, timestamp=self.ts_now, streamer_local_id=i + 1, extra_data={}
+            )
+        with mock.patch('apps.utils.aws.sns.sns_lambda_message') as sns:
+            result = DataManager.delete_in_chunks('event', chunk_size=2, stream_slug=self.s1.slug)
+        self.assertEqual(result['deleted'], 3)
+        # One S3 delete message per chunk, instead of one per event
+        self.assertEqual(sns.call_count, 2)
+        self.assertEqual(len(sns.call_args_list[0][0][1]), 2)
+        self.assertEqual(StreamEventData.objects.filter(stream_slug=self.s1.slug).count(), 0)
+
+        # Large chunks are split in several messages, all within the SNS size limit
+        events = [StreamEventData(
+            stream_slug=self.s1.slug, timestamp=self.ts_now, streamer_local_id=i + 1, s3_key_path='2017/08/31/08'
+        ) for i in range(2000)]
+        StreamEventData.objects.bulk_create(events)
+        with mock.patch('apps.utils.aws.sns.sns_lambda_message') as sns:
+            result = DataManager.delete_in_chunks('event', chunk_size=2000, stream_slug=self.s1.slug)
+        self.assertEqual(result['deleted'], 2000)
+        self.assertEqual(sum([len(call[0][1]) for call in sns.call_args_list]), 2000)
+        for call in sns.call_args_list:
+            self.assertLessEqual(len(call[0][1]), SNS_LAMBDA_BATCH_SIZE)
+            payload = json.dumps({'default': json.dumps(call[0][1])})
+            self.assertLessEqual(len(payload.encode('utf-8')), SNS_MAX_MESSAGE_BYTES)
+        self.assertEqual(
+            set([item['key'] for call in sns.call_args_list for item in call[0][1]]),
+            set([event.s3key for event in events])
+        )
+
     def testSave(self):
         self.assertEqual(StreamData.objects.all().count(), 6)
         new_data = StreamData(
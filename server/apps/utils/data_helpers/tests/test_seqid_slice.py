@@ -0,0 +1,56 @@
+from django.test import TestCase
+from django.utils import timezone
+
+from apps.streamdata.models import StreamData
+from apps.utils.data_helpers.misc import get_every_id
+from apps.utils.data_helpers.seqid_slice import StreamerLocalIdSlice
+
+
+class StreamerLocalIdSliceTestCase(TestCase):
+
+    def setUp(self):
+        self.stream_slug = 's--0000-0008--0000-0000-0000-0053--5003'
+        ts_now = timezone.now()
+        # Two readings for seqid 3
+        for seqid in [1, 2, 3, 3, 4, 5, 6]:
+            StreamData.objects.create(
+                stream_slug=self.stream_slug, type='Num', timestamp=ts_now, int_value=seqid, streamer_local_id=seqid
+            )
+        StreamData.objects.create(
+            stream_slug='s--0000-0008--0000-0000-0000-0054--5003', type='Num', timestamp=ts_now, streamer_local_id=1
+        )
+
+    def tearDown(self):
+        StreamData.objects.all().delete()
+
+    def testSlices(self):
+        qs = StreamData.objects.filter(stream_slug=self.stream_slug)
+
+        rows = StreamerLocalIdSlice(qs, slice_size=3, chunk_size=2)
+        # The slice is extended to include all rows for the last seqid
+        with self.assertNumQueries(3):
+            self.assertEqual([row.streamer_local_id for row in rows], [1, 2, 3, 3])
+        self.assertEqual(rows.count, 4)
+        self.assertEqual(rows.next_start, 4)
+
+        rows = StreamerLocalIdSlice(qs.filter(streamer_local_id__gte=rows.next_start), slice_size=3)
+        self.assertEqual([row.streamer_local_id for row in rows], [4, 5, 6])
+        # Slice ends with the last row, so it takes one more query to know there is nothing else
+        self.assertIsNone(rows.next_start)
+
+        rows = StreamerLocalIdSlice(qs.filter(streamer_local_id__gte=5), slice_size=3)
+        with self.assertNumQueries(1):
+            self.assertEqual([row.streamer_local_id for row in rows], [5, 6])
+        self.assertIsNone(rows.next_start)
+
+    def testGetEveryId(self):
+        data = StreamData.objects.filter(stream_slug=self.stream_slug).first()
+        self.assertEqual(get_every_id(data), {'project_id': 8, 'device_id': 83, 'variable_id': 20483})
+
+        block_data = StreamData(
+            stream_slug='s--0000-0000--0001-0000-0000-0051--5001',
+            project_slug='',
+            device_slug='b--0001-0000-0000-0051',
+            variable_slug='v--0000-0007--5001',
+        )
+        self.assertEqual(get_every_id(block_data), {'device_id': 81, 'block_id': 1, 'variable_id': 20481})
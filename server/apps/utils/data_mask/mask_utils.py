@@ -1,5 +1,7 @@
 import logging
 
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 
 from apps.streamnote.models import StreamNote
@@ -8,6 +10,45 @@ from apps.utils.iotile.variable import SYSTEM_VID
 
 logger = logging.getLogger(__name__)
 
+# Cached value for devices or blocks with no data mask
+_NO_MASK = {'empty': True}
+
+
+def _get_data_mask_cache_key(mask_stream_slug):
+    return ':'.join(['data-mask', str(mask_stream_slug)])
+
+
+def _get_data_mask_cache_timeout():
+    # A timeout of zero disables the data mask cache
+    if cache:
+        return getattr(settings, 'DATA_MASK_CACHE_TIMEOUT', 0)
+    return 0
+
+
+def _set_cached_data_mask(mask_stream_slug, mask):
+    timeout = _get_data_mask_cache_timeout()
+    if timeout:
+        cache.set(_get_data_mask_cache_key(mask_stream_slug), mask or _NO_MASK, timeout=timeout)
+
+
+def clear_cached_data_mask(mask_stream_slug):
+    """
+    Remove the cached data mask for a device or block data mask stream.
+    Needs to be called by anything modifying the mask events without using set_data_mask or clear_data_mask
+
+    :param mask_stream_slug: Data Mask Stream Slug
+    """
+    if cache:
+        cache.delete(_get_data_mask_cache_key(mask_stream_slug))
+
+
+def _data_mask_from_event(event):
+    if event:
+        assert('start' in event.extra_data)
+        assert('end' in event.extra_data)
+        return event.extra_data
+    return None
+
 
 def _log_data_mask_as_note(obj, start, end, user):
     if start or end:
@@ -69,6 +110,7 @@ def set_data_mask(obj, start, end, data_exceptions, event_excetions, user):
 
     DataManager.save('event', event)
     logger.info('Created/Updated new Device Mask Event: {}'.format(stream_slug))
+    _set_cached_data_mask(stream_slug, payload)
 
     _log_data_mask_as_note(obj=obj, start=start, end=end, user=user)
 
@@ -88,6 +130,8 @@ def clear_data_mask(obj, user, notify=True):
 
     stream_slug = obj.get_stream_slug_for(SYSTEM_VID['DEVICE_DATA_MASK'])
 
+    # The mask event may have been deleted without clearing the cache (e.g. on a device reset)
+    clear_cached_data_mask(stream_slug)
     qs = DataManager.filter_qs('event', stream_slug=stream_slug)
     if qs.exists():
         qs.delete()
@@ -112,22 +156,26 @@ def get_data_mask_date_range(obj):
     :param obj: Device or DataBlock Object
     :return: A Dict with {'start': '<datetime_str>', 'end': '<datetime_str>'}. None if not set
     """
-    event = get_data_mask_event(obj)
-    if event:
-        assert('start' in event.extra_data)
-        assert('end' in event.extra_data)
-        return event.extra_data
+    mask_stream_slug = obj.get_stream_slug_for(SYSTEM_VID['DEVICE_DATA_MASK'])
+    if mask_stream_slug:
+        return get_data_mask_date_range_for_slug(mask_stream_slug)
     return None
 
 
 def get_data_mask_date_range_for_slug(mask_stream_slug):
     """
+    Cached (see DATA_MASK_CACHE_TIMEOUT) data mask for a device or block
+
     :param mask_stream_slug: Stream Slug
-    :return: StreamEventData if a mask has been set
+    :return: A Dict with {'start': '<datetime_str>', 'end': '<datetime_str>'}. None if not set
     """
+    timeout = _get_data_mask_cache_timeout()
+    if timeout:
+        mask = cache.get(_get_data_mask_cache_key(mask_stream_slug))
+        if mask is not None:
+            return None if mask == _NO_MASK else mask
+
     event = DataManager.filter_qs('event', stream_slug=str(mask_stream_slug)).last()
-    if event:
-        assert('start' in event.extra_data)
-        assert('end' in event.extra_data)
-        return event.extra_data
-    return None
+    mask = _data_mask_from_event(event)
+    _set_cached_data_mask(mask_stream_slug, mask)
+    return mask
@@ -33,6 +33,7 @@ class BlockDataMaskTests(TestMixin, TestCase):
         self.s2 = StreamId.objects.filter(variable=self.v2).first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         StreamId.objects.all().delete()
         StreamVariable.objects.all().delete()
         StreamNote.objects.all().delete()
@@ -141,3 +142,29 @@ class BlockDataMaskTests(TestMixin, TestCase):
         mask_data = get_data_mask_date_range_for_slug(str(mask_slug))
         self.assertEqual(mask_data['start'], '2017-01-10T10:00:00Z')
         self.assertEqual(mask_data['end'], '2018-01-10T10:00:00Z')
+
+    def testCachedDataMask(self):
+        mask_slug2 = str(self.pd2.get_stream_slug_for(SYSTEM_VID['DEVICE_DATA_MASK']))
+
+        set_data_mask(self.pd1, '2017-01-10T10:00:00Z', None, [], [], self.u1)
+        # Written through on set
+        with self.assertNumQueries(0):
+            mask_data = get_data_mask_date_range(self.pd1)
+        self.assertEqual(mask_data['start'], '2017-01-10T10:00:00Z')
+
+        # Devices with no mask are also cached
+        self.assertIsNone(get_data_mask_date_range_for_slug(mask_slug2))
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_data_mask_date_range_for_slug(mask_slug2))
+
+        set_data_mask(self.pd2, None, '2018-01-10T10:00:00Z', [], [], self.u1)
+        self.assertEqual(get_data_mask_date_range_for_slug(mask_slug2)['end'], '2018-01-10T10:00:00Z')
+
+        # Deleting the mask event directly needs an explicit invalidation
+        StreamEventData.objects.filter(stream_slug=mask_slug2).delete()
+        self.assertIsNotNone(get_data_mask_date_range(self.pd2))
+        clear_cached_data_mask(mask_slug2)
+        self.assertIsNone(get_data_mask_date_range(self.pd2))
+
+        clear_data_mask(self.pd1, self.u1)
+        self.assertIsNone(get_data_mask_date_range(self.pd1))
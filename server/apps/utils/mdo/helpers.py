@@ -1,3 +1,8 @@
+import math
+
+import numpy as np
+
+
 class MdoHelper(object):
     _m = 1
     _d = 1
@@ -18,6 +23,56 @@ class MdoHelper(object):
         ret_value += (value * self._m / self._d)
         return ret_value
 
+    def compute_array(self, values):
+        """
+        Vectorized version of compute() for a numpy array, pandas Series/DataFrame column (or list) of values.
+        Results are the same as calling compute() on each value.
+
+        :param values: array-like of numbers
+        :return: numpy array of floats (or pandas Series, with the same index, if values is a Series)
+        """
+        if hasattr(values, 'astype'):
+            values = values.astype(np.float64)
+        else:
+            values = np.asarray(values, dtype=np.float64)
+        ret_values = values * self._m / self._d
+        if self._o:
+            ret_values = ret_values + self._o
+        return ret_values
+
+    def compose(self, other):
+        """
+        Build a single MDO equivalent to applying this MDO and then the other MDO:
+        other.compute(self.compute(x)) == self.compose(other).compute(x)
+        (except for floating point rounding)
+
+        :param other: MdoHelper to apply after this one (None is a no-op)
+        :return: MdoHelper
+        """
+        if other is None:
+            return self
+        m = self._m * other._m
+        d = self._d * other._d
+        gcd = math.gcd(m, d)
+        if d < 0:
+            gcd = -gcd
+        o = None
+        if self._o or other._o:
+            o = float(self._o or 0.0) * other._m / other._d + float(other._o or 0.0)
+        return MdoHelper(m // gcd, d // gcd, o)
+
+    @classmethod
+    def chain(cls, *mdos):
+        """
+        Compose a list of MDOs (in order of application) into a single one. None items are ignored
+
+        :return: MdoHelper (the identity MDO if there are no MDOs)
+        """
+        result = cls(1, 1)
+        for mdo in mdos:
+            result = result.compose(mdo)
+        return result
+
     def compute_reverse(self, value):
         ret_value = float(value)
         if self._o:
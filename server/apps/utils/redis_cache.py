@@ -0,0 +1,135 @@
+"""
+Atomic operations on the default cache, for the cases that cannot be expressed with the Django cache API.
+
+With django_redis, these run as single Redis commands, Lua scripts or MULTI/EXEC pipelines.
+Other cache backends (i.e. LocMemCache, used by tests) fall back to equivalent, but not atomic,
+Django cache calls.
+"""
+import logging
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Only delete or extend a key if it still has the value we set (i.e. we still own the lock)
+_DELETE_IF_VALUE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_EXPIRE_IF_VALUE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _get_redis_client():
+    """
+    :return: django_redis client of the default cache, or None if the cache is not a Redis cache
+    """
+    client = getattr(cache, 'client', None)
+    if client is None or not hasattr(client, 'get_client'):
+        return None
+    return client
+
+
+def delete_if_value(key, value):
+    """
+    Delete the key, but only if it is set to the given value
+
+    :return: True if the key was deleted
+    """
+    client = _get_redis_client()
+    if client is None:
+        if cache.get(key) == value:
+            cache.delete(key)
+            return True
+        return False
+
+    redis_client = client.get_client(write=True)
+    script = redis_client.register_script(_DELETE_IF_VALUE_SCRIPT)
+    return bool(script(keys=[client.make_key(key)], args=[client.encode(value)]))
+
+
+def expire_if_value(key, value, timeout):
+    """
+    Reset the key timeout, but only if it is set to the given value
+
+    :param timeout: New timeout, in seconds
+    :return: True if the key timeout was reset
+    """
+    client = _get_redis_client()
+    if client is None:
+        if cache.get(key) == value:
+            cache.set(key, value, timeout)
+            return True
+        return False
+
+    redis_client = client.get_client(write=True)
+    script = redis_client.register_script(_EXPIRE_IF_VALUE_SCRIPT)
+    return bool(script(keys=[client.make_key(key)], args=[client.encode(value), int(timeout * 1000)]))
+
+
+def set_add(key, members, timeout):
+    """
+    Add strings to the set stored in the key (Redis SADD)
+
+    :param members: list of strings
+    :param timeout: Timeout of the whole set, in seconds
+    """
+    if not members:
+        return
+    client = _get_redis_client()
+    if client is None:
+        cache.set(key, set(cache.get(key, set())) | set(members), timeout)
+        return
+
+    redis_key = client.make_key(key)
+    pipe = client.get_client(write=True).pipeline()
+    pipe.sadd(redis_key, *members)
+    pipe.expire(redis_key, timeout)
+    pipe.execute()
+
+
+def set_members(key):
+    """
+    :return: set of strings stored in the key by set_add (Redis SMEMBERS)
+    """
+    client = _get_redis_client()
+    if client is None:
+        return set(cache.get(key, set()))
+
+    members = client.get_client(write=False).smembers(client.make_key(key))
+    return set(m.decode('utf-8') if isinstance(m, bytes) else m for m in members)
+
+
+def pop_many(keys):
+    """
+    Get and delete the given keys, in a single transaction (Redis MULTI/GET/DEL/EXEC),
+    so no update made between the get and the delete can be lost
+
+    :return: dict of key -> value, for the keys that exist
+    """
+    if not keys:
+        return {}
+    client = _get_redis_client()
+    if client is None:
+        values = cache.get_many(keys)
+        cache.delete_many(keys)
+        return values
+
+    pipe = client.get_client(write=True).pipeline(transaction=True)
+    for key in keys:
+        redis_key = client.make_key(key)
+        pipe.get(redis_key)
+        pipe.delete(redis_key)
+    results = pipe.execute()
+
+    values = {}
+    for key, value in zip(keys, results[::2]):
+        if value is not None:
+            values[key] = client.decode(value)
+    return values
@@ -1,4 +1,14 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class LargeResultsSetPagination(PageNumberPagination):
@@ -16,3 +26,109 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination on (<ordering>, id), in ascending order.
+
+    Unlike PageNumberPagination, getting a page does not require an OFFSET scan, so deep pages
+    are as fast as the first one, and no COUNT(*) is done.
+    The first page is requested with an empty cursor (e.g. `?cursor=`) and each page returns
+    a `next` link with the cursor for the following page (None on the last page).
+    Rows with a NULL <ordering> value are returned last.
+    """
+    page_size = 1000
+    page_size_query_param = 'page_size'
+    max_page_size = 10000
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    # First field is the default ordering
+    ordering_fields = ['timestamp']
+    datetime_fields = ['timestamp']
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.ordering_fields[0])
+        if ordering not in self.ordering_fields:
+            raise ValidationError('ordering must be one of: {}'.format(', '.join(self.ordering_fields)))
+        return ordering
+
+    def encode_cursor(self, obj):
+        value = getattr(obj, self.ordering)
+        if value is not None and self.ordering in self.datetime_fields:
+            value = value.isoformat()
+        data = json.dumps([value, obj.id]).encode('utf-8')
+        return base64.urlsafe_b64encode(data).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param, '')
+        if not encoded:
+            return None
+        try:
+            value, pk = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if value is not None and self.ordering in self.datetime_fields:
+                value = parse_datetime(value)
+                assert value is not None
+            return value, int(pk)
+        except Exception:
+            raise NotFound('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+
+        queryset = queryset.order_by(self.ordering, 'id')
+        position = self.decode_cursor(request)
+        if position:
+            value, pk = position
+            if value is None:
+                queryset = queryset.filter(**{self.ordering + '__isnull': True, 'id__gt': pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{self.ordering + '__gt': value}) |
+                    Q(**{self.ordering: value, 'id__gt': pk}) |
+                    Q(**{self.ordering + '__isnull': True})
+                )
+
+        # Get one extra row to know if there is a next page
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+class DataKeysetPagination(KeysetPagination):
+    ordering_fields = ['timestamp', 'streamer_local_id']
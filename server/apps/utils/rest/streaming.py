@@ -0,0 +1,90 @@
+import csv
+import datetime
+import io
+import json
+
+import msgpack
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import StreamingHttpResponse
+from django.utils.text import get_valid_filename
+
+from apps.utils.timezone_utils import str_utc
+
+EXPORT_CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'msgpack': 'application/msgpack',
+}
+# Rows are sent to the client in chunks of about this size (in bytes)
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Number of rows fetched from the database server-side cursor at a time
+EXPORT_FETCH_SIZE = 2000
+
+
+def _export_value(value):
+    if isinstance(value, datetime.datetime):
+        return str_utc(value)
+    return value
+
+
+def _get_row_encoder(fields, output):
+    if output == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def encode(row):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(row)
+            return buffer.getvalue().encode('utf-8')
+    elif output == 'ndjson':
+        def encode(row):
+            return (json.dumps(dict(zip(fields, row))) + '\n').encode('utf-8')
+    else:
+        # A msgpack stream: one map per row (read with msgpack.Unpacker)
+        def encode(row):
+            return msgpack.packb(dict(zip(fields, row)))
+    return encode
+
+
+def iter_export(rows, fields, output):
+    """
+    Encode the rows in the given output format, yielding chunks of about EXPORT_CHUNK_BYTES
+
+    :param rows: iterable of tuples (e.g. queryset.values_list(...).iterator())
+    :param fields: list of field names, one per tuple item
+    :param output: 'ndjson', 'csv' or 'msgpack'
+    :return: generator of bytes
+    """
+    encode = _get_row_encoder(fields, output)
+    chunk = bytearray()
+    if output == 'csv':
+        chunk += encode(fields)
+    for row in rows:
+        chunk += encode([_export_value(value) for value in row])
+        if len(chunk) >= EXPORT_CHUNK_BYTES:
+            yield bytes(chunk)
+            chunk = bytearray()
+    if chunk:
+        yield bytes(chunk)
+
+
+def streaming_export_response(rows, fields, output, filename=None):
+    """
+    Build a StreamingHttpResponse for the rows, so that the full result set never needs to be in memory
+
+    :param rows: iterable of tuples
+    :param fields: list of field names
+    :param output: 'ndjson', 'csv' or 'msgpack'
+    :param filename: If set, the response is sent as an attachment. May come from the user, so it gets sanitized
+    :return: StreamingHttpResponse
+    """
+    response = StreamingHttpResponse(iter_export(rows, fields, output), content_type=EXPORT_CONTENT_TYPES[output])
+    if filename:
+        try:
+            filename = get_valid_filename(filename) or 'data'
+        except SuspiciousFileOperation:
+            filename = 'data'
+        response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(filename, output)
+    return response
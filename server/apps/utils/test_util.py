@@ -10,6 +10,9 @@ from apps.project.models import Project
 from apps.projecttemplate.models import ProjectTemplate
 from apps.sensorgraph.models import *
 from apps.stream.models import StreamVariable
+from apps.streamevent.models import StreamEventData
+from apps.utils.data_mask.mask_utils import clear_cached_data_mask
+from apps.utils.iotile.variable import SYSTEM_VID
 
 user_model = get_user_model()
 
@@ -137,6 +140,12 @@ class TestMixin(object):
         self.pd2 = Device.objects.create_device(project=self.p2, sg=self.sg1, label='d2', active=True,
                                                 template=self.dt1, created_by=self.u3)
 
+    def dataMaskTestTearDown(self):
+        """ Should be called before deleting the stream events, as tests delete mask events directly """
+        mask_qs = StreamEventData.objects.filter(stream_slug__endswith='--{}'.format(SYSTEM_VID['DEVICE_DATA_MASK']))
+        for stream_slug in mask_qs.values_list('stream_slug', flat=True).distinct():
+            clear_cached_data_mask(stream_slug)
+
     def sensorGraphTestTearDown(self):
         VarTypeInputUnit.objects.all().delete()
         VarTypeOutputUnit.objects.all().delete()
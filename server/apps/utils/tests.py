@@ -1,5 +1,12 @@
-from unittest import TestCase
+import io
+import os
+import tempfile
+from unittest import TestCase, mock
 
+from .aws.kinesis import FIREHOSE_MAX_BATCH_BYTES, FirehoseSender
+from .aws.s3 import S3ParallelUploader
+from .aws.s3_cache import S3FileCache
+from .local_cache import LocalCache
 from .timezone_utils import nb_seconds_since_2000, parse_datetime
 
 
@@ -11,3 +18,179 @@ class TimezoneUtilsTestCase(TestCase):
         n2 = nb_seconds_since_2000(pst_dt)
         self.assertEqual(n1, 100)
         self.assertEqual(n2, 7 * 3600)
+
+
+class LocalCacheTestCase(TestCase):
+    def testLruAndTimeout(self):
+        cache = LocalCache(max_entries=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        # 'b' is the least recently used
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+        with mock.patch('apps.utils.local_cache.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('a'))
+        # A zero timeout means no caching
+        cache.set('d', 4, timeout=0)
+        self.assertIsNone(cache.get('d'))
+
+
+class S3FileCacheTestCase(TestCase):
+
+    def _head(self, Bucket, Key):
+        return {'ETag': '"{}"'.format(self.etags[Key]), 'Metadata': {'x-amz-meta-uuid': Key}}
+
+    def _get(self, Bucket, Key):
+        response = self._head(Bucket, Key)
+        response['Body'] = io.BytesIO(self.content[Key])
+        return response
+
+    @mock.patch('apps.utils.aws.s3_cache.s3')
+    def testCacheHitAndEviction(self, mock_s3):
+        self.content = {'a': b'A' * 100, 'b': b'B' * 100}
+        self.etags = {'a': 'a1', 'b': 'b1'}
+        mock_s3.head_object.side_effect = self._head
+        mock_s3.get_object.side_effect = self._get
+
+        with tempfile.TemporaryDirectory() as root:
+            cache = S3FileCache(root, max_bytes=150)
+            self.assertEqual(cache.get_metadata('bucket', 'a'), {'x-amz-meta-uuid': 'a'})
+            with cache.open('bucket', 'a') as fp:
+                self.assertEqual(fp.read(), self.content['a'])
+            mm = cache.open_mmap('bucket', 'a')
+            self.assertEqual(mm.read(), self.content['a'])
+            mm.close()
+            # A single HEAD and a single download for both the metadata and the file
+            self.assertEqual(mock_s3.head_object.call_count, 1)
+            self.assertEqual(mock_s3.get_object.call_count, 1)
+
+            # Over max_bytes: least recently used file is evicted
+            path_a = cache.get_file_path('bucket', 'a')
+            os.utime(path_a, (0, 0))
+            cache.get_file_path('bucket', 'b')
+            self.assertFalse(os.path.exists(path_a))
+            self.assertEqual(len(os.listdir(root)), 1)
+
+    @mock.patch('apps.utils.aws.s3_cache.s3')
+    def testIncrementalSize(self, mock_s3):
+        self.content = {'a': b'A' * 100, 'b': b'B' * 100, 'c': b'C' * 100}
+        self.etags = {'a': 'a1', 'b': 'b1', 'c': 'c1'}
+        mock_s3.head_object.side_effect = self._head
+        mock_s3.get_object.side_effect = self._get
+
+        with tempfile.TemporaryDirectory() as root:
+            cache = S3FileCache(root, max_bytes=250)
+            with mock.patch('apps.utils.aws.s3_cache.os.scandir', wraps=os.scandir) as mock_scandir:
+                # Only the first download reads the size from disk
+                path_a = cache.get_file_path('bucket', 'a')
+                cache.get_file_path('bucket', 'b')
+                self.assertEqual(mock_scandir.call_count, 1)
+
+                # Going over max_bytes reads it again, and evicts
+                os.utime(path_a, (0, 0))
+                cache.get_file_path('bucket', 'c')
+                self.assertEqual(mock_scandir.call_count, 2)
+                self.assertFalse(os.path.exists(path_a))
+                self.assertEqual(len(os.listdir(root)), 2)
+
+    @mock.patch('apps.utils.aws.s3_cache.s3')
+    def testChangedObject(self, mock_s3):
+        self.content = {'a': b'A' * 10}
+        self.etags = {'a': 'a1'}
+        mock_s3.head_object.side_effect = self._head
+        mock_s3.get_object.side_effect = self._get
+
+        with tempfile.TemporaryDirectory() as root:
+            cache = S3FileCache(root, max_bytes=1000)
+            self.assertEqual(cache.get_metadata('bucket', 'a'), {'x-amz-meta-uuid': 'a'})
+
+            # Overwritten between the HEAD and the download: stored under the downloaded version
+            self.content['a'] = b'a' * 10
+            self.etags['a'] = 'a2'
+            path_a2 = cache.get_file_path('bucket', 'a')
+            with open(path_a2, 'rb') as fp:
+                self.assertEqual(fp.read(), b'a' * 10)
+            self.assertEqual(cache.get_file_path('bucket', 'a'), path_a2)
+
+            # Overwritten again: served once the HEAD information expires
+            self.content['a'] = b'B' * 10
+            self.etags['a'] = 'a3'
+            with mock.patch('apps.utils.local_cache.time.monotonic', return_value=10 ** 9):
+                with cache.open('bucket', 'a') as fp:
+                    self.assertEqual(fp.read(), b'B' * 10)
+            self.assertEqual(mock_s3.head_object.call_count, 2)
+            self.assertEqual(mock_s3.get_object.call_count, 2)
+
+
+class S3ParallelUploaderTestCase(TestCase):
+    @mock.patch('apps.utils.aws.s3.S3_UPLOAD_RETRY_DELAY', 0)
+    def testUploadWithRetries(self):
+        attempts = {}
+
+        def upload(bucket, key, data):
+            attempts[key] = attempts.get(key, 0) + 1
+            if key == 'bad':
+                raise Exception('Access Denied')
+            # 'flaky' fails on the first attempt
+            return key != 'flaky' or attempts[key] > 1
+
+        uploader = S3ParallelUploader(upload_func=upload, max_workers=4, max_retries=2)
+        for i in range(20):
+            uploader.add('bucket', 'key{}'.format(i), {'i': i})
+        uploader.add('bucket', 'flaky', {})
+        uploader.add('bucket', 'bad', {})
+        self.assertEqual(len(uploader), 22)
+
+        failures = uploader.run()
+        self.assertEqual(failures, [('bucket', 'bad', 'Access Denied')])
+        self.assertEqual(attempts['key7'], 1)
+        self.assertEqual(attempts['flaky'], 2)
+        self.assertEqual(attempts['bad'], 3)
+        self.assertEqual(len(uploader), 0)
+        self.assertEqual(uploader.run(), [])
+
+
+class FakeFirehoseClient(object):
+
+    def __init__(self, fail_first=0):
+        self.fail_first = fail_first
+        self.requests = []
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        self.requests.append(len(Records))
+        responses = []
+        for record in Records:
+            if self.fail_first:
+                self.fail_first -= 1
+                responses.append({'ErrorCode': 'ServiceUnavailableException'})
+            else:
+                responses.append({'RecordId': '1'})
+        failed = len([r for r in responses if 'ErrorCode' in r])
+        return {'FailedPutCount': failed, 'RequestResponses': responses}
+
+
+class FirehoseSenderTestCase(TestCase):
+
+    @mock.patch('apps.utils.aws.kinesis.FIREHOSE_RETRY_DELAY', 0)
+    def testBatchingAndRetries(self):
+        client = FakeFirehoseClient(fail_first=3)
+        with FirehoseSender(stream_name='test', client=client, batch_num=10, max_in_flight=1) as sender:
+            sender.put_many({'value': i} for i in range(25))
+        self.assertEqual(sender.stats['records'], 25)
+        self.assertEqual(sender.stats['batches'], 3)
+        self.assertEqual(sender.stats['throttled'], 3)
+        self.assertEqual(sender.stats['retried'], 3)
+        self.assertEqual(sender.stats['failed'], 0)
+        # Only the 3 failed records were sent again
+        self.assertEqual(client.requests, [10, 3, 10, 5])
+
+    def testBatchBytesLimit(self):
+        client = FakeFirehoseClient()
+        item = {'data': 'x' * (FIREHOSE_MAX_BATCH_BYTES // 3)}
+        with FirehoseSender(stream_name='test', client=client) as sender:
+            sender.put_many([item, item, item, item])
+        self.assertEqual(client.requests, [2, 2])
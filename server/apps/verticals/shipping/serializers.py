@@ -9,6 +9,7 @@ from apps.physicaldevice.models import Device
 from apps.project.models import Project
 from apps.streamdata.serializers import StreamDataSerializer
 from apps.utils.data_helpers.manager import DataManager
+from apps.utils.data_mask.mask_utils import get_data_mask_date_range
 from apps.utils.iotile.variable import SYSTEM_VID, USER_VID
 from apps.utils.timezone_utils import convert_to_utc, str_to_dt_utc, str_utc
 
@@ -150,16 +151,12 @@ class ShippingTripInfoSerializerMixin(object):
                  {'start': '<datetime_str>', 'end': '<datetime_str>'}.
                  None if not set
         """
-        mask_stream_slug = obj.get_stream_slug_for(SYSTEM_VID['DEVICE_DATA_MASK'])
-        if mask_stream_slug:
-            event = DataManager.filter_qs('event', stream_slug=mask_stream_slug).last()
-            if event:
-                assert ('start' in event.extra_data)
-                assert ('end' in event.extra_data)
-                return {
-                    'start': event.extra_data.get('start'),
-                    'end': event.extra_data.get('end'),
-                }
+        mask_data = get_data_mask_date_range(obj)
+        if mask_data:
+            return {
+                'start': mask_data.get('start'),
+                'end': mask_data.get('end'),
+            }
         return None
 
     def get_streams(self, obj):
@@ -34,6 +34,7 @@ class ReportAvailabilityPod1MTestCase(TestMixin, APITestCase):
         self.pd1 = self.p1.devices.first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         GeneratedUserReport.objects.all().delete()
         self.orgTestTearDown()
         self.userTestTearDown()
@@ -35,6 +35,7 @@ class APITripInfoTestCase(TestMixin, APITestCase):
         self.pd1 = self.p1.devices.first()
 
     def tearDown(self):
+        self.dataMaskTestTearDown()
         self.device_mock.tearDown()
         self.userTestTearDown()
 
@@ -242,6 +242,7 @@ MIDDLEWARE = [
     'corsheaders.middleware.CorsPostCsrfMiddleware',
     'django_feature_policy.FeaturePolicyMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.org.membership.OrgMembershipSnapshotMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'apps.utils.timezoneMiddleware.TimezoneMiddleware',
@@ -675,6 +676,9 @@ STREAMER_REPORT_DROPBOX_KEY_FORMAT_V2 = '{stage}/{{streamer}}/{{path}}/{{uuid}}{
 STREAMER_REPORT_DROPBOX_PUBLIC_KEY = get_secret('STREAMER_REPORT_DROPBOX_PUBLIC_KEY')
 STREAMER_REPORT_DROPBOX_PRIVATE_KEY = get_secret('STREAMER_REPORT_DROPBOX_PRIVATE_KEY')
 STREAMER_REPORT_DROPBOX_MAX_SIZE = 1024000  # 1M
+# Local cache for downloaded streamer reports (disabled if not set)
+STREAMER_REPORT_CACHE_DIR = env('STREAMER_REPORT_CACHE_DIR', default=None)
+STREAMER_REPORT_CACHE_MAX_BYTES = env.int('STREAMER_REPORT_CACHE_MAX_BYTES', default=512 * 1024 * 1024)
 
 S3IMAGE_BUCKET_NAME = 'iotile-cloud-media'
 S3IMAGE_ENDPOINT = 'https://%s.s3.amazonaws.com/' % S3IMAGE_BUCKET_NAME
@@ -742,6 +746,32 @@ DYNAMODB_FILTER_LOG_TABLE_NAME = 'iotile-filter-log-{}'.format(SERVER_TYPE)
 USE_DYNAMODB_WORKERLOG_DB = False
 USE_DYNAMODB_FILTERLOG_DB = False
 
+# Stream Filters
+# --------------
+# In-process cache for serialized stream filters (seconds). Changes made by other processes are seen
+# after, at most, STREAM_FILTER_CACHE_VERSION_CHECK_INTERVAL seconds
+STREAM_FILTER_LOCAL_CACHE_TIMEOUT = env.int('STREAM_FILTER_LOCAL_CACHE_TIMEOUT', default=60)
+STREAM_FILTER_CACHE_VERSION_CHECK_INTERVAL = env.int('STREAM_FILTER_CACHE_VERSION_CHECK_INTERVAL', default=5)
+
+# Stream Metadata
+# ---------------
+# In-process cache for stream metadata (StreamId, units and MDOs) used to process incoming data (seconds).
+# Entries are dropped when the stream (or a variable, var type or unit) is saved or deleted by the same process.
+# Changes made by other processes (i.e. the API servers) can take up to this long to be seen by the workers
+STREAM_METADATA_LOCAL_CACHE_TIMEOUT = env.int('STREAM_METADATA_LOCAL_CACHE_TIMEOUT', default=30)
+
+# Device Data Masks
+# -----------------
+# Shared cache for device/block data masks (seconds). Updated by set_data_mask and clear_data_mask. 0 to disable
+DATA_MASK_CACHE_TIMEOUT = env.int('DATA_MASK_CACHE_TIMEOUT', default=600)
+
+# Org Memberships
+# ---------------
+# Permission checks use a snapshot of the user's memberships, loaded once per request.
+# Snapshots are also kept in the shared cache for ORG_MEMBERSHIP_CACHE_TIMEOUT seconds (0 to disable),
+# and are cleared whenever a membership is saved or deleted
+ORG_MEMBERSHIP_CACHE_TIMEOUT = env.int('ORG_MEMBERSHIP_CACHE_TIMEOUT', default=300)
+
 # SQS worker
 if SQS_URL:
     SQS_WORKER_QUEUE_NAME = 'default'
@@ -824,6 +854,16 @@ os.environ["BOKEH_SIGN_SESSIONS"] = "True"
 
 # Data Manager: should be the import path to the class
 DATA_MANAGER = 'apps.utils.data_helpers.manager.django_managers.streamdata_manager.DjangoStreamDataManager'
+# Use COPY FROM STDIN for DataManager.bulk_create (PostgreSQL only)
+DATA_MANAGER_USE_COPY = env.bool('DATA_MANAGER_USE_COPY', default=False)
+# Max number of rows removed by every DELETE statement of DataManager.delete_in_chunks
+DATA_MANAGER_DELETE_CHUNK_SIZE = env.int('DATA_MANAGER_DELETE_CHUNK_SIZE', default=10000)
+
+# StreamData/StreamEventData -> StreamTimeSeries migration (apps.streamtimeseries.worker.migrate)
+# Rows fetched, converted and written at a time
+STREAMTIMESERIES_MIGRATION_CHUNK_SIZE = env.int('STREAMTIMESERIES_MIGRATION_CHUNK_SIZE', default=2000)
+# Max rows migrated by each action. Larger streams are migrated by a chain of actions
+STREAMTIMESERIES_MIGRATION_SLICE_SIZE = env.int('STREAMTIMESERIES_MIGRATION_SLICE_SIZE', default=200000)
 
 # OEE Caching worker
 # Set this to True to push the OEE Caching tasks into SQS to be processed by other workers
@@ -26,6 +26,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.org.membership.OrgMembershipSnapshotMiddleware',
     'apps.utils.timezoneMiddleware.TimezoneMiddleware',
 ]
 # No need for fancy passports for testing. Make it fast instead
@@ -39,6 +40,10 @@ CACHES = {
     }
 }
 #SESSION_ENGINE = "django.contrib.sessions.backends.cache"
+# Tests clear the cache between test cases, so always check the filter cache version
+STREAM_FILTER_CACHE_VERSION_CHECK_INTERVAL = 0
+STREAM_METADATA_LOCAL_CACHE_TIMEOUT = 0
+ORG_MEMBERSHIP_CACHE_TIMEOUT = 0
 
 # Turn off debug while imported by Celery with a workaround
 # See http://stackoverflow.com/a/4806384